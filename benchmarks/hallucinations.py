@@ -0,0 +1,66 @@
+"""
+Микробенчмарк фильтра галлюцинаций.
+
+Сравнивает прежнюю реализацию (re.sub на каждое стоп-слово) с собранным
+фильтром на синтетических транскриптах в несколько мегабайт и выводит
+пропускную способность в JSON.
+
+    python -m benchmarks.hallucinations --sizes 1 4 16
+"""
+import argparse
+import json
+import re
+import time
+
+from src.hallucinations import DEFAULT_STOP_WORDS, HallucinationFilter
+
+from .synthetic import make_transcript
+
+
+def legacy_filter(text: str) -> str:
+    for word in DEFAULT_STOP_WORDS["ru"]:
+        text = re.sub(rf'\b{word}\b', '', text, flags=re.IGNORECASE)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _measure(fn, argument, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(argument)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(sizes_mb, repeat: int = 3) -> dict:
+    engine = HallucinationFilter(DEFAULT_STOP_WORDS["ru"])
+    results = []
+    for size_mb in sizes_mb:
+        text = make_transcript(int(size_mb * 1024 * 1024))
+        words = [{"word": word, "start": i * 0.3, "end": i * 0.3 + 0.25}
+                 for i, word in enumerate(text.split())]
+        for name, fn, argument in (
+            ("legacy_text", legacy_filter, text),
+            ("compiled_text", engine.filter_text, text),
+            ("compiled_words", engine.filter_words, words),
+        ):
+            seconds = _measure(fn, argument, repeat)
+            results.append({
+                "case": name,
+                "size_mb": size_mb,
+                "seconds": round(seconds, 4),
+                "mb_per_second": round(size_mb / seconds, 2),
+            })
+    return {"benchmark": "hallucinations", "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="Размеры транскриптов, МБ")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.repeat), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Локальные заглушки Yandex SpeechKit, SaluteSpeech и S3.
+
+Каждая заглушка - отдельное приложение FastAPI на своем порту в фоновом
+потоке. Распознавание "длится" processing_delay секунд с момента создания
+задачи, результат - синтетический транскрипт; синхронное распознавание
+отвечает сразу. Заглушка S3 понимает
+PutObject, HeadObject, GetObject, DeleteObject и multipart upload, чего
+достаточно для boto3.
+
+    with MockServers(processing_delay=1.0) as mocks:
+        os.environ.update(mocks.environ())
+"""
+import hashlib
+import itertools
+import socket
+import threading
+import time
+import uuid
+
+from functools import cached_property
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+from .synthetic import make_transcript
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _chunks_for(text: str) -> list:
+    words = text.split()
+    chunks = []
+    for index in range(0, len(words), 12):
+        part = words[index:index + 12]
+        chunks.append({
+            "alternatives": [{
+                "text": " ".join(part),
+                "confidence": 1,
+                "words": [
+                    {
+                        "word": word,
+                        "startTime": f"{(index + i) * 0.4:.1f}s",
+                        "endTime": f"{(index + i) * 0.4 + 0.3:.1f}s",
+                        "confidence": 1,
+                    }
+                    for i, word in enumerate(part)
+                ],
+            }],
+            "channelTag": "1",
+        })
+    return chunks
+
+
+class MockState:
+    """Задачи заглушек и счетчики запросов (для отчета бенчмарка)."""
+
+    def __init__(self, processing_delay: float, transcript_bytes: int):
+        self.processing_delay = processing_delay
+        self.transcript_bytes = transcript_bytes
+        self.tasks = {}
+        self.objects = {}
+        self.uploads = {}
+        self.requests = {}
+        self.polls = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @cached_property
+    def transcript(self) -> str:
+        return make_transcript(self.transcript_bytes)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + value
+
+    def new_task(self) -> str:
+        task_id = f"task-{next(self._ids)}"
+        self.tasks[task_id] = time.monotonic() + self.processing_delay
+        return task_id
+
+    def poll(self, task_id: str) -> bool:
+        """Отмечает опрос и возвращает True, если задача готова."""
+        with self._lock:
+            self.polls[task_id] = self.polls.get(task_id, 0) + 1
+        return time.monotonic() >= self.tasks[task_id]
+
+    def stats(self) -> dict:
+        polls = list(self.polls.values())
+        return {
+            "requests": dict(self.requests),
+            "tasks": len(self.tasks),
+            "polls_per_task": round(sum(polls) / len(polls), 2) if polls else 0,
+            "s3_objects": len(self.objects),
+            "s3_bytes": sum(len(data) for data in self.objects.values()),
+        }
+
+
+def yandex_app(state: MockState) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/speech/stt/v2/longRunningRecognize")
+    async def recognize(request: Request):
+        state.count("yandex_recognize")
+        body = await request.json()
+        if "uri" not in body.get("audio", {}):
+            return JSONResponse({"message": "audio.uri is required"}, status_code=400)
+        return {"id": state.new_task(), "done": False}
+
+    @app.post("/speech/v1/stt:recognize")
+    async def recognize_sync(request: Request):
+        state.count("yandex_recognize_sync")
+        body = await request.body()
+        if not body:
+            return JSONResponse({"error_code": "BAD_REQUEST", "error_message": "empty audio"}, status_code=400)
+        return {"result": state.transcript}
+
+    @app.get("/operations/{operation_id}")
+    async def operation(operation_id: str):
+        state.count("yandex_operation")
+        if operation_id not in state.tasks:
+            return JSONResponse({"message": "operation not found"}, status_code=404)
+        if not state.poll(operation_id):
+            return {"id": operation_id, "done": False}
+        return {
+            "id": operation_id,
+            "done": True,
+            "response": {"chunks": _chunks_for(state.transcript)},
+        }
+
+    return app
+
+
+def salute_app(state: MockState) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/v2/oauth")
+    async def oauth():
+        state.count("salute_oauth")
+        return {"access_token": uuid.uuid4().hex, "expires_at": int((time.time() + 1800) * 1000)}
+
+    @app.post("/rest/v1/data:upload")
+    async def upload(request: Request):
+        state.count("salute_upload")
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        state.count("salute_upload_bytes", size)
+        file_id = f"file-{uuid.uuid4().hex}"
+        return {"status": 200, "result": {"request_file_id": file_id}}
+
+    @app.post("/rest/v1/speech:async_recognize")
+    async def recognize():
+        state.count("salute_recognize")
+        return {"status": 200, "result": {"id": state.new_task(), "status": "NEW"}}
+
+    @app.post("/rest/v1/speech:recognize")
+    async def recognize_sync(request: Request):
+        state.count("salute_recognize_sync")
+        body = await request.body()
+        if not body:
+            return JSONResponse({"status": 400, "message": "empty audio"}, status_code=400)
+        return {"status": 200, "result": [chunk["alternatives"][0]["text"] for chunk in _chunks_for(state.transcript)]}
+
+    @app.get("/rest/v1/task:get")
+    async def task(id: str):
+        state.count("salute_task")
+        if id not in state.tasks:
+            return JSONResponse({"status": 404, "message": "task not found"}, status_code=404)
+        if not state.poll(id):
+            return {"status": 200, "result": {"id": id, "status": "RUNNING"}}
+        return {"status": 200, "result": {"id": id, "status": "DONE", "response_file_id": f"result-{id}"}}
+
+    @app.get("/rest/v1/data:download")
+    async def download(response_file_id: str):
+        state.count("salute_download")
+        return [
+            {
+                "results": [{
+                    "text": chunk["alternatives"][0]["text"],
+                    "normalized_text": chunk["alternatives"][0]["text"],
+                    "start": chunk["alternatives"][0]["words"][0]["startTime"],
+                    "end": chunk["alternatives"][0]["words"][-1]["endTime"],
+                    "word_alignments": [
+                        {"word": w["word"], "start": w["startTime"], "end": w["endTime"]}
+                        for w in chunk["alternatives"][0]["words"]
+                    ],
+                }],
+                "eou": True,
+                "channel": 0,
+            }
+            for chunk in _chunks_for(state.transcript)
+        ]
+
+    return app
+
+
+def _decode_aws_chunked(body: bytes) -> bytes:
+    """Тело в кодировке aws-chunked (новые версии botocore с контрольными суммами)."""
+    data = bytearray()
+    position = 0
+    while True:
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        if size == 0:
+            return bytes(data)
+        start = line_end + 2
+        data += body[start:start + size]
+        position = start + size + 2
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def s3_app(state: MockState) -> FastAPI:
+    app = FastAPI()
+
+    async def _body(request: Request) -> bytes:
+        body = await request.body()
+        if "aws-chunked" in request.headers.get("content-encoding", "") or \
+                request.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+            return _decode_aws_chunked(body)
+        return body
+
+    @app.put("/{bucket}/{key:path}")
+    async def put(bucket: str, key: str, request: Request):
+        data = await _body(request)
+        upload_id = request.query_params.get("uploadId")
+        if upload_id is not None:
+            state.count("s3_upload_part")
+            state.uploads[upload_id]["parts"][int(request.query_params["partNumber"])] = data
+        else:
+            state.count("s3_put")
+            state.objects[f"{bucket}/{key}"] = data
+        return Response(headers={"ETag": _etag(data)})
+
+    @app.post("/{bucket}/{key:path}")
+    async def post(bucket: str, key: str, request: Request):
+        params = request.query_params
+        if "uploads" in params:
+            state.count("s3_create_multipart")
+            upload_id = uuid.uuid4().hex
+            state.uploads[upload_id] = {"key": f"{bucket}/{key}", "parts": {}}
+            xml = (
+                "<InitiateMultipartUploadResult>"
+                f"<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>"
+                "</InitiateMultipartUploadResult>"
+            )
+            return Response(xml, media_type="application/xml")
+        state.count("s3_complete_multipart")
+        await request.body()
+        upload = state.uploads.pop(params["uploadId"])
+        data = b"".join(upload["parts"][number] for number in sorted(upload["parts"]))
+        state.objects[upload["key"]] = data
+        xml = (
+            "<CompleteMultipartUploadResult>"
+            f"<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>{_etag(data)}</ETag>"
+            "</CompleteMultipartUploadResult>"
+        )
+        return Response(xml, media_type="application/xml")
+
+    @app.head("/{bucket}/{key:path}")
+    async def head(bucket: str, key: str):
+        state.count("s3_head")
+        data = state.objects.get(f"{bucket}/{key}")
+        if data is None:
+            return Response(status_code=404)
+        return Response(headers={"Content-Length": str(len(data)), "ETag": _etag(data)})
+
+    @app.get("/{bucket}/{key:path}")
+    async def get(bucket: str, key: str):
+        state.count("s3_get")
+        data = state.objects.get(f"{bucket}/{key}")
+        if data is None:
+            return Response(
+                "<Error><Code>NoSuchKey</Code></Error>", status_code=404, media_type="application/xml"
+            )
+        return Response(data, headers={"ETag": _etag(data)})
+
+    @app.delete("/{bucket}/{key:path}")
+    async def delete(bucket: str, key: str, request: Request):
+        upload_id = request.query_params.get("uploadId")
+        if upload_id is not None:
+            state.count("s3_abort_multipart")
+            state.uploads.pop(upload_id, None)
+        else:
+            state.count("s3_delete")
+            state.objects.pop(f"{bucket}/{key}", None)
+        return Response(status_code=204)
+
+    return app
+
+
+class _Server(uvicorn.Server):
+    def install_signal_handlers(self):
+        # Сервер работает в фоновом потоке, сигналы обрабатывает основной
+        pass
+
+
+class MockServers:
+    """Запускает заглушки провайдеров на свободных портах localhost."""
+
+    def __init__(self, processing_delay: float = 1.0, transcript_bytes: int = 4096):
+        self.state = MockState(processing_delay, transcript_bytes)
+        self.ports = {}
+        self._servers = []
+        self._threads = []
+
+    def __enter__(self):
+        for name, factory in (("yandex", yandex_app), ("salute", salute_app), ("s3", s3_app)):
+            port = _free_port()
+            server = _Server(uvicorn.Config(
+                factory(self.state), host="127.0.0.1", port=port, log_level="warning",
+            ))
+            thread = threading.Thread(target=server.run, name=f"mock-{name}", daemon=True)
+            thread.start()
+            self.ports[name] = port
+            self._servers.append(server)
+            self._threads.append(thread)
+        deadline = time.monotonic() + 10
+        while not all(server.started for server in self._servers):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Заглушки провайдеров не запустились")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc):
+        for server in self._servers:
+            server.should_exit = True
+        for thread in self._threads:
+            thread.join(timeout=5)
+        return False
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.ports[name]}"
+
+    def environ(self) -> dict:
+        """Переменные окружения, направляющие клиенты проекта на заглушки."""
+        return {
+            "YANDEX_STT_URL": f"{self.url('yandex')}/speech/stt/v2/longRunningRecognize",
+            "YANDEX_OPERATIONS_URL": f"{self.url('yandex')}/operations",
+            "YANDEX_SYNC_URL": f"{self.url('yandex')}/speech/v1/stt:recognize",
+            "SALUTE_OAUTH_URL": f"{self.url('salute')}/api/v2/oauth",
+            "SALUTE_API_URL": f"{self.url('salute')}/rest/v1",
+            "YANDEX_S3_ENDPOINT_URL": self.url("s3"),
+            "S3_ADDRESSING_STYLE": "path",
+            "BUCKET_NAME": "bench",
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+        }
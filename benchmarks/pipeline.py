@@ -0,0 +1,335 @@
+"""
+Бенчмарк этапов конвейера распознавания.
+
+Генерирует синтетическое аудио нужных длительностей, форматов и числа
+каналов, поднимает заглушки Yandex, Salute и S3 и замеряет каждый этап
+отдельно: декодирование, VAD, перевод в моно, DCCRNet, DSP-цепочку,
+загрузку в S3 (и повтор уже загруженного файла), отправку/ожидание у провайдера,
+синхронное распознавание и фильтр галлюцинаций.
+Результат - JSON для сравнения между релизами.
+
+    python -m benchmarks.pipeline --durations 10 60 300 --formats wav mp3 --output bench.json
+
+Этап, для которого не установлены зависимости (torch, asteroid, ffmpeg),
+попадает в отчет со статусом skipped и причиной.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+
+from .mock_servers import MockServers
+from .synthetic import speech_like, write_audio, transcript_for
+
+SAMPLE_RATE = 16000
+
+FILE_STAGES = ("decode", "vad", "convert_to_mono", "s3_upload", "s3_dedup")
+ARRAY_STAGES = ("denoise", "dsp")
+PROVIDER_STAGES = ("yandex_submit_poll", "salute_submit_poll", "yandex_sync", "salute_sync")
+TEXT_STAGES = ("filter_hallucinations",)
+ALL_STAGES = FILE_STAGES + ARRAY_STAGES + PROVIDER_STAGES + TEXT_STAGES
+
+
+class Skipped(Exception):
+    """Этап нельзя выполнить в текущем окружении."""
+
+
+def _require(module: str):
+    try:
+        return __import__(module, fromlist=["_"])
+    except Exception as e:
+        raise Skipped(f"{module}: {type(e).__name__}: {e}")
+
+
+def _mock_storage(mocks: MockServers):
+    """
+    Хранилище на заглушке S3. Синглтон src.storage не подходит: config
+    загружает .env с override=True, и его адрес и бакет могут оказаться
+    боевыми.
+    """
+    storage = _require("src.storage")
+    return storage.ObjectStorage(
+        bucket="bench",
+        endpoint_url=mocks.url("s3"),
+        access_key="bench",
+        secret_key="bench",
+        addressing_style="path",
+    )
+
+
+def _check_mocked(mocks: MockServers, provider: str):
+    """Адреса провайдера в config должны вести на заглушку, а не в боевой API."""
+    config = _require("config")
+    names = {
+        "yandex": ("YANDEX_STT_URL", "YANDEX_OPERATIONS_URL", "YANDEX_SYNC_URL"),
+        "salute": ("SALUTE_OAUTH_URL", "SALUTE_API_URL"),
+    }[provider]
+    for name in names:
+        if not getattr(config, name).startswith(mocks.url(provider)):
+            raise Skipped(f"{name} переопределен в .env и указывает не на заглушку: {getattr(config, name)}")
+
+
+def file_stage(name: str, workdir: str, mocks: MockServers):
+    """Возвращает функцию этапа над файлом (path) -> None."""
+    if name == "decode":
+        utils = _require("src.utils")
+        return lambda path: utils.decode_audio(path)
+    if name == "vad":
+        utils = _require("src.utils")
+        return lambda path: utils._detect_speech_regions(path)
+    if name == "convert_to_mono":
+        utils = _require("src.utils")
+        output = os.path.join(workdir, "mono.mp3")
+        return lambda path: utils._convert_to_mono(path, output)
+    if name == "s3_upload":
+        storage = _mock_storage(mocks)
+
+        async def upload(path):
+            # Объект удаляется сразу, так что каждый повтор - настоящая загрузка
+            await storage.delete(await storage.upload(path, "bench"))
+        return upload
+    if name == "s3_dedup":
+        storage = _mock_storage(mocks)
+
+        async def upload_existing(path):
+            # Загружает только первый повтор, остальные - хэш и HEAD
+            await storage.upload(path, "bench")
+        return upload_existing
+    raise ValueError(name)
+
+
+def array_stage(name: str):
+    """Возвращает функцию этапа над моно-массивом 16 кГц."""
+    if name == "denoise":
+        denoiser = _require("src.denoiser").denoiser
+        try:
+            denoiser.load()
+        except Exception as e:
+            raise Skipped(f"DCCRNet: {type(e).__name__}: {e}")
+        return denoiser.enhance
+    if name == "dsp":
+        algo = _require("src.algo")
+        return lambda y: algo.preprocess_audio(y, SAMPLE_RATE)
+    raise ValueError(name)
+
+
+def provider_stage(name: str, workdir: str, mocks: MockServers):
+    """Возвращает корутинную функцию (path, duration) - полный цикл у провайдера."""
+    _check_mocked(mocks, name.split("_")[0])
+    if name == "yandex_submit_poll":
+        yandex = _require("src.yandex_transcribe")
+
+        async def run(path, duration):
+            await yandex.transcribe_audio(
+                f"bench/{os.path.basename(path)}", duration=duration, audio_encoding="LINEAR16_PCM"
+            )
+        return run
+
+    if name == "salute_submit_poll":
+        salute = _require("src.salutespeech_transcribe")
+
+        async def run(path, duration):
+            # Файл удаляется после загрузки, поэтому отправляется копия
+            copy = os.path.join(workdir, f"salute_{os.path.basename(path)}")
+            shutil.copyfile(path, copy)
+            await salute.recognize_file_with_salute(copy, audio_encoding="PCM_S16LE", duration=duration)
+        return run
+
+    if name == "yandex_sync":
+        yandex = _require("src.yandex_transcribe")
+
+        async def run(path, duration):
+            await yandex.recognize_sync(path, audio_encoding="LINEAR16_PCM", sample_rate=SAMPLE_RATE)
+        return run
+
+    if name == "salute_sync":
+        salute = _require("src.salutespeech_transcribe")
+
+        async def run(path, duration):
+            await salute.recognize_sync_with_salute(path, audio_encoding="PCM_S16LE")
+        return run
+    raise ValueError(name)
+
+
+def text_stage(name: str):
+    hallucinations = _require("src.hallucinations")
+    return hallucinations.hallucination_filters.get().filter_text
+
+
+async def _time(fn, argument, repeat: int, *extra) -> list:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(argument, *extra)
+        if asyncio.iscoroutine(result):
+            await result
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def _measure(stage: str, audio_seconds: float, fn, argument, repeat: int, *extra, **params) -> dict:
+    """Замер этапа; ошибка этапа попадает в отчет, а не прерывает прогон."""
+    try:
+        timings = await _time(fn, argument, repeat, *extra)
+    except Exception as e:
+        return {"stage": stage, "audio_seconds": audio_seconds, **params,
+                "error": f"{type(e).__name__}: {e}"}
+    return _record(stage, audio_seconds, timings, **params)
+
+
+def _record(stage: str, audio_seconds: float, timings: list, **params) -> dict:
+    median = statistics.median(timings)
+    return {
+        "stage": stage,
+        "audio_seconds": audio_seconds,
+        **params,
+        "repeat": len(timings),
+        "seconds": {
+            "min": round(min(timings), 4),
+            "median": round(median, 4),
+            "max": round(max(timings), 4),
+        },
+        "realtime_factor": round(audio_seconds / median, 2) if median else None,
+    }
+
+
+async def run(durations, formats, channels, stages, repeat: int, processing_delay: float) -> dict:
+    results = []
+    skipped = {}
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    mocks = MockServers(processing_delay=processing_delay)
+    with mocks:
+        # До импорта модулей проекта: клиенты берут адреса провайдеров из окружения
+        os.environ.update(mocks.environ())
+
+        def prepare(name, factory):
+            if name in skipped:
+                return None
+            try:
+                return factory()
+            except Skipped as e:
+                skipped[name] = str(e)
+                return None
+
+        try:
+            for duration in durations:
+                for channel_count in channels:
+                    samples = speech_like(duration, SAMPLE_RATE, channel_count)
+                    for audio_format in formats:
+                        path = os.path.join(workdir, f"synthetic_{duration}s_{channel_count}ch.{audio_format}")
+                        try:
+                            write_audio(samples, SAMPLE_RATE, path, audio_format)
+                        except Exception as e:
+                            skipped[f"format:{audio_format}"] = f"{type(e).__name__}: {e}"
+                            continue
+                        for name in stages:
+                            if name not in FILE_STAGES:
+                                continue
+                            fn = prepare(name, lambda: file_stage(name, workdir, mocks))
+                            if fn is None:
+                                continue
+                            results.append(await _measure(
+                                name, duration, fn, path, repeat,
+                                format=audio_format, channels=channel_count,
+                                size_bytes=os.path.getsize(path),
+                            ))
+
+                mono = speech_like(duration, SAMPLE_RATE, 1)[:, 0]
+                for name in stages:
+                    if name not in ARRAY_STAGES:
+                        continue
+                    fn = prepare(name, lambda: array_stage(name))
+                    if fn is not None:
+                        results.append(await _measure(
+                            name, duration, fn, mono, repeat, format="array", channels=1,
+                        ))
+
+                wav = write_audio(
+                    speech_like(duration, SAMPLE_RATE, 1), SAMPLE_RATE,
+                    os.path.join(workdir, f"provider_{duration}s.wav"), "wav",
+                )
+                for name in stages:
+                    if name not in PROVIDER_STAGES:
+                        continue
+                    fn = prepare(name, lambda: provider_stage(name, workdir, mocks))
+                    if fn is not None:
+                        results.append(await _measure(
+                            name, duration, fn, wav, repeat, duration,
+                            format="wav", channels=1, processing_delay=processing_delay,
+                        ))
+
+                transcript = transcript_for(duration)
+                for name in stages:
+                    if name not in TEXT_STAGES:
+                        continue
+                    fn = prepare(name, lambda: text_stage(name))
+                    if fn is not None:
+                        results.append(await _measure(
+                            name, duration, fn, transcript, repeat,
+                            format="text", size_bytes=len(transcript.encode()),
+                        ))
+        finally:
+            await _close_project_clients()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "benchmark": "pipeline",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "parameters": {
+            "durations": durations,
+            "formats": formats,
+            "channels": channels,
+            "repeat": repeat,
+            "processing_delay": processing_delay,
+        },
+        "results": results,
+        "skipped": skipped,
+        "mock_servers": mocks.state.stats(),
+    }
+
+
+async def _close_project_clients():
+    """Закрывает HTTP-клиенты и планировщик опросов, если они успели создаться."""
+    import sys
+    if "src.poller" in sys.modules:
+        await sys.modules["src.poller"].poller.close()
+    if "src.http_client" in sys.modules:
+        await sys.modules["src.http_client"].close_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов конвейера распознавания")
+    parser.add_argument("--durations", type=float, nargs="+", default=[10, 60, 300], help="Длительности аудио, с")
+    parser.add_argument("--formats", nargs="+", default=["wav", "mp3"], help="Форматы файлов")
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 2], help="Число каналов")
+    parser.add_argument("--stages", nargs="+", default=list(ALL_STAGES), choices=ALL_STAGES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--processing-delay", type=float, default=1.0,
+                        help="Сколько заглушки провайдеров 'распознают' задачу, с")
+    parser.add_argument("--output", help="Файл для JSON (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(
+        args.durations, args.formats, args.channels, args.stages, args.repeat, args.processing_delay,
+    ))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Детерминированное синтетическое аудио, похожее на речь, и транскрипты.
+
+Речь моделируется слогами: основной тон 100-240 Гц с гармониками,
+огибающая двух формант гласной, плавное нарастание/затухание. Слоги
+собираются в слова и фразы, между фразами паузы, поверх - слабый шум,
+так что VAD и шумоподавление работают на правдоподобном сигнале.
+"""
+import random
+
+import numpy as np
+
+# Форманты гласных (F1, F2), Гц
+VOWELS = [(730, 1090), (270, 2290), (300, 870), (530, 1840), (570, 840)]
+
+VOCABULARY = [
+    "добрый", "день", "меня", "зовут", "звоню", "по", "поводу", "заказа",
+    "номер", "доставка", "завтра", "спасибо", "пожалуйста", "да", "нет",
+    "это", "самое", "главное", "вопрос", "оплата", "картой", "курьер",
+]
+
+
+def _syllable(rng, sample_rate):
+    length = int(rng.uniform(0.12, 0.32) * sample_rate)
+    t = np.arange(length) / sample_rate
+    f0 = rng.uniform(100, 240) * (1 + 0.05 * np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    f1, f2 = VOWELS[rng.randrange(len(VOWELS))]
+    signal = np.zeros(length)
+    for harmonic in range(1, 25):
+        frequency = harmonic * f0.mean()
+        if frequency >= sample_rate / 2:
+            break
+        gain = np.exp(-((frequency - f1) / 150) ** 2) + 0.6 * np.exp(-((frequency - f2) / 200) ** 2)
+        signal += (gain + 0.02) / harmonic * np.sin(harmonic * phase)
+    envelope = np.sin(np.pi * np.linspace(0, 1, length)) ** 0.6
+    return signal * envelope
+
+
+def speech_like(duration: float, sample_rate: int = 16000, channels: int = 1, seed: int = 0) -> np.ndarray:
+    """
+    :return: Массив float32 формы (кадры, каналы) в диапазоне [-1, 1].
+    """
+    rng = random.Random(seed)
+    total = int(duration * sample_rate)
+    mono = np.zeros(total)
+    position = int(rng.uniform(0.2, 0.6) * sample_rate)
+    while position < total:
+        # Фраза: несколько слов по 1-4 слога
+        for _ in range(rng.randint(2, 8)):
+            for _ in range(rng.randint(1, 4)):
+                if position >= total:
+                    break
+                syllable = _syllable(rng, sample_rate)
+                end = min(position + len(syllable), total)
+                mono[position:end] += syllable[:end - position]
+                position = end
+            position += int(rng.uniform(0.03, 0.12) * sample_rate)
+        position += int(rng.uniform(0.3, 1.2) * sample_rate)
+
+    noise = np.random.default_rng(seed).standard_normal(total) * 0.003
+    mono = 0.3 * mono / max(np.abs(mono).max(), 1e-9) + noise
+    if channels == 1:
+        return mono[:, None].astype(np.float32)
+    # Остальные каналы - ослабленная копия с задержкой, как у стереозаписи
+    delay = int(0.0007 * sample_rate)
+    shifted = np.concatenate([np.zeros(delay), mono[:-delay]]) * 0.8
+    return np.stack([mono] + [shifted] * (channels - 1), axis=1).astype(np.float32)
+
+
+def write_audio(samples: np.ndarray, sample_rate: int, path: str, format: str) -> str:
+    """Сохраняет массив в файл: wav/flac через soundfile, остальное через pydub (ffmpeg)."""
+    if format in ("wav", "flac"):
+        import soundfile as sf
+        sf.write(path, samples, sample_rate, subtype="PCM_16")
+        return path
+
+    from pydub import AudioSegment
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    AudioSegment(
+        data=pcm.tobytes(), sample_width=2, frame_rate=sample_rate, channels=pcm.shape[1],
+    ).export(path, format=format)
+    return path
+
+
+def make_transcript(size_bytes: int, seed: int = 0, stop_ratio: float = 0.08) -> str:
+    """Детерминированный транскрипт с примесью стоп-фраз."""
+    # Импорт здесь: config читает окружение при импорте, а бенчмарк задает
+    # адреса заглушек уже после загрузки этого модуля
+    from src.hallucinations import DEFAULT_STOP_WORDS
+
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size_bytes:
+        word = rng.choice(DEFAULT_STOP_WORDS["ru"]) if rng.random() < stop_ratio else rng.choice(VOCABULARY)
+        words.append(word)
+        length += len(word.encode()) + 1
+    return " ".join(words)
+
+
+def transcript_for(duration: float, seed: int = 0) -> str:
+    """Транскрипт, по длине соответствующий записи (около 2.5 слов в секунду)."""
+    return make_transcript(int(duration * 2.5 * 8), seed)
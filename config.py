@@ -28,3 +28,235 @@ if not os.path.exists(YANDEX_SPEECHKIT_DIR):
 
 if not os.path.exists(SALUTE_SPEECHKIT_DIR):
     os.makedirs(SALUTE_SPEECHKIT_DIR)
+
+# Vosk: доступные модели и размер пула распознавателей. Воркеры пула vosk при
+# старте прогревают только VOSK_ENGINE_MODEL, остальные загружают по требованию
+VOSK_MODELS = [
+    name.strip()
+    for name in os.getenv("VOSK_MODELS", "vosk-model-small-ru-0.22,vosk-model-ru-0.42").split(",")
+    if name.strip()
+]
+VOSK_WARMUP = os.getenv("VOSK_WARMUP", "true").lower() in ("1", "true", "yes")
+VOSK_RECOGNIZER_POOL_SIZE = int(os.getenv("VOSK_RECOGNIZER_POOL_SIZE", "4"))
+VOSK_RECOGNIZER_TIMEOUT = float(os.getenv("VOSK_RECOGNIZER_TIMEOUT", "30"))
+
+# Шумоподавление DCCRNet
+DENOISE_MODEL = os.getenv("DENOISE_MODEL", "JorisCos/DCCRNet_Libri1Mix_enhsingle_16k")
+DENOISE_WARMUP = os.getenv("DENOISE_WARMUP", "true").lower() in ("1", "true", "yes")
+DENOISE_THREADS = int(os.getenv("DENOISE_THREADS", "0"))  # 0 - значение torch по умолчанию
+DENOISE_WINDOW_SECONDS = float(os.getenv("DENOISE_WINDOW_SECONDS", "4"))
+DENOISE_OVERLAP_SECONDS = float(os.getenv("DENOISE_OVERLAP_SECONDS", "0.5"))
+DENOISE_BATCH_SIZE = int(os.getenv("DENOISE_BATCH_SIZE", "8"))
+
+# Каталог для сохранения промежуточных этапов algo (пусто - не сохранять)
+ALGO_DEBUG_DIR = os.getenv("ALGO_DEBUG_DIR", "")
+
+# HTTP-клиент для облачных провайдеров
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "300"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_UPLOAD_CHUNK_SIZE = int(os.getenv("HTTP_UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+
+# Пулы процессов для CPU-нагруженных этапов (0 воркеров - выполнение в потоке)
+EXECUTOR_MP_CONTEXT = os.getenv("EXECUTOR_MP_CONTEXT", "spawn")
+EXECUTOR_POOLS = {
+    name: {
+        "workers": int(os.getenv(f"EXECUTOR_{name.upper()}_WORKERS", str(workers))),
+        "max_queue": int(os.getenv(f"EXECUTOR_{name.upper()}_QUEUE", "16")),
+    }
+    for name, workers in (("vad", 2), ("transcode", 2), ("denoise", 1), ("vosk", 2))
+}
+
+# Опрос статуса долгих операций Yandex и задач Salute
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "0.5"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "15"))
+POLL_BACKOFF = float(os.getenv("POLL_BACKOFF", "1.5"))
+POLL_DEADLINE = float(os.getenv("POLL_DEADLINE", "3600"))
+POLL_MAX_CONCURRENCY = int(os.getenv("POLL_MAX_CONCURRENCY", "50"))
+# Время обработки на секунду аудио, пока по провайдеру нет своей истории:
+# первый опрос длинной записи назначается по нему, а не через POLL_MIN_INTERVAL
+POLL_INITIAL_TURNAROUND = float(os.getenv("POLL_INITIAL_TURNAROUND", "0.1"))
+
+# За сколько секунд до истечения обновлять токен SaluteSpeech
+SALUTE_TOKEN_REFRESH_MARGIN = float(os.getenv("SALUTE_TOKEN_REFRESH_MARGIN", "60"))
+
+# Асинхронные задания: хранилище и ограничение параллельности
+JOBS_DIR = os.path.join(DOWNLOADS, "jobs")
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(DOWNLOADS, "jobs.sqlite3"))
+JOBS_MAX_CONCURRENCY = int(os.getenv("JOBS_MAX_CONCURRENCY", "20"))
+# Хосты, на которые разрешено отправлять webhook; пусто - любые публичные адреса
+WEBHOOK_ALLOWED_HOSTS = [
+    name.strip().lower()
+    for name in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",")
+    if name.strip()
+]
+
+if not os.path.exists(JOBS_DIR):
+    os.makedirs(JOBS_DIR)
+
+# Кэш результатов распознавания по содержимому файла
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(DOWNLOADS, "results_cache.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))
+
+# VAD: дополнительный запас вокруг участков речи
+VAD_PAD_MS = int(os.getenv("VAD_PAD_MS", "0"))
+
+# Потоковый прием загрузок с VAD
+INGEST_MAX_STREAMS = int(os.getenv("INGEST_MAX_STREAMS", "16"))
+INGEST_MIN_SPEECH_MS = int(os.getenv("INGEST_MIN_SPEECH_MS", "250"))
+
+# Битрейт Opus при перекодировании для облачных провайдеров
+TRANSCODE_OPUS_BITRATE = os.getenv("TRANSCODE_OPUS_BITRATE", "24k")
+
+# Параллельное распознавание длинных записей частями
+SEGMENT_TARGET_SECONDS = float(os.getenv("SEGMENT_TARGET_SECONDS", "300"))
+SEGMENT_CONCURRENCY = {
+    "yandex": int(os.getenv("SEGMENT_CONCURRENCY_YANDEX", "8")),
+    "salute": int(os.getenv("SEGMENT_CONCURRENCY_SALUTE", "4")),
+}
+
+# Короткие записи распознаются синхронным API, без S3 и опросов статуса:
+# порог длительности (секунды) после VAD, 0 - всегда асинхронно.
+# Ограничения провайдеров: Yandex - 30 с и 1 МБ, SaluteSpeech - 1 мин и 2 МБ
+SYNC_MAX_SECONDS = {
+    "yandex": float(os.getenv("YANDEX_SYNC_MAX_SECONDS", "29")),
+    "salute": float(os.getenv("SALUTE_SYNC_MAX_SECONDS", "59")),
+}
+
+# Параллельное распознавание длинных файлов Vosk по всем воркерам пула vosk
+VOSK_PARALLEL_SEGMENT_SECONDS = float(os.getenv("VOSK_PARALLEL_SEGMENT_SECONDS", "60"))
+VOSK_PARALLEL_SEARCH_SECONDS = float(os.getenv("VOSK_PARALLEL_SEARCH_SECONDS", "5"))
+
+# Потоковое распознавание Vosk по WebSocket
+LIVE_VOSK_MODELS = [
+    name.strip()
+    for name in os.getenv("LIVE_VOSK_MODELS", "vosk-model-small-ru-0.22").split(",")
+    if name.strip()
+]
+LIVE_WARMUP = os.getenv("LIVE_WARMUP", "true").lower() in ("1", "true", "yes")
+LIVE_MAX_STREAMS = int(os.getenv("LIVE_MAX_STREAMS", "32"))
+LIVE_IDLE_TIMEOUT = float(os.getenv("LIVE_IDLE_TIMEOUT", "15"))
+LIVE_MAX_SECONDS = float(os.getenv("LIVE_MAX_SECONDS", "7200"))
+LIVE_MAX_FRAME_BYTES = int(os.getenv("LIVE_MAX_FRAME_BYTES", str(64 * 1024)))
+
+# Каталог со списками стоп-фраз <язык>.txt (перечитываются при изменении)
+HALLUCINATIONS_DIR = os.getenv("HALLUCINATIONS_DIR", os.path.join(current_dir, "hallucinations"))
+
+# Адреса API провайдеров (переопределяются для стендов и бенчмарков)
+YANDEX_STT_URL = os.getenv(
+    "YANDEX_STT_URL", "https://transcribe.api.cloud.yandex.net/speech/stt/v2/longRunningRecognize"
+)
+YANDEX_OPERATIONS_URL = os.getenv("YANDEX_OPERATIONS_URL", "https://operation.api.cloud.yandex.net/operations")
+YANDEX_SYNC_URL = os.getenv("YANDEX_SYNC_URL", "https://stt.api.cloud.yandex.net/speech/v1/stt:recognize")
+SALUTE_OAUTH_URL = os.getenv("SALUTE_OAUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oauth")
+SALUTE_API_URL = os.getenv("SALUTE_API_URL", "https://smartspeech.sber.ru/rest/v1")
+
+# Журнал: уровень и заголовок для сквозного идентификатора запроса
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+TRACE_ID_HEADER = os.getenv("TRACE_ID_HEADER", "X-Request-ID")
+
+# Рабочие каталоги запросов: корень (по умолчанию в DOWNLOADS или tmpfs) и квота
+WORKSPACE_TMPFS = os.getenv("WORKSPACE_TMPFS", "false").lower() in ("1", "true", "yes")
+WORKSPACE_DIR = os.getenv(
+    "WORKSPACE_DIR",
+    "/dev/shm/transcribe-workspace" if WORKSPACE_TMPFS else os.path.join(DOWNLOADS, "workspace"),
+)
+WORKSPACE_QUOTA_BYTES = int(os.getenv("WORKSPACE_QUOTA_BYTES", str(8 * 1024 ** 3)))
+# Во сколько раз рабочий набор (промежуточные файлы) больше загруженного файла
+WORKSPACE_SIZE_FACTOR = float(os.getenv("WORKSPACE_SIZE_FACTOR", "4"))
+# Резерв для загрузок неизвестного размера (потоковый прием)
+WORKSPACE_DEFAULT_RESERVE = int(os.getenv("WORKSPACE_DEFAULT_RESERVE", str(512 * 1024 ** 2)))
+# Сколько ждать освобождения квоты, прежде чем отклонить запрос
+WORKSPACE_ADMISSION_TIMEOUT = float(os.getenv("WORKSPACE_ADMISSION_TIMEOUT", "10"))
+# Файлы старых каталогов загрузок старше этого возраста удаляются при запуске, с
+WORKSPACE_ORPHAN_AGE = float(os.getenv("WORKSPACE_ORPHAN_AGE", "3600"))
+
+# Хранилище S3 для файлов Yandex SpeechKit: адресация (auto, virtual, path), части multipart
+S3_REGION = os.getenv("S3_REGION", "ru-central1")
+S3_ADDRESSING_STYLE = os.getenv("S3_ADDRESSING_STYLE", "auto")
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+# Удалять объект после распознавания (ключ - хэш содержимого, повтор загрузит снова)
+S3_DELETE_AFTER_RECOGNITION = os.getenv("S3_DELETE_AFTER_RECOGNITION", "true").lower() in ("1", "true", "yes")
+# Через сколько секунд после распознавания удалять объект, загруженный процессом
+S3_DELETE_GRACE = float(os.getenv("S3_DELETE_GRACE", "3600"))
+# Правило жизненного цикла бакета: объекты файлов для распознавания удаляются
+# через столько дней (то, что не удалил сам сервис); 0 - правило не настраивается
+S3_LIFECYCLE_DAYS = int(os.getenv("S3_LIFECYCLE_DAYS", "1"))
+
+# Защита вызовов провайдеров. Лимит запросов в секунду и всплеск (token
+# bucket) по провайдерам - по квоте аккаунта, 0 - без ограничения
+PROVIDER_RATE_LIMITS = {
+    name: (
+        float(os.getenv(f"{name.upper()}_RATE_LIMIT", str(rate))),
+        int(os.getenv(f"{name.upper()}_RATE_BURST", str(burst))),
+    )
+    for name, rate, burst in (
+        ("yandex", 20, 40), ("salute", 10, 20), ("salute_oauth", 1, 5), ("s3", 50, 100),
+    )
+}
+# Повторы временных ошибок (сеть, 429, 5xx): попыток всего и задержки с разбросом.
+# У S3 по умолчанию одна попытка: boto3 сам повторяет запросы
+PROVIDER_RETRY_ATTEMPTS = {
+    name: int(os.getenv(f"{name.upper()}_RETRY_ATTEMPTS", str(attempts)))
+    for name, attempts in (("yandex", 4), ("salute", 4), ("salute_oauth", 3), ("s3", 1))
+}
+PROVIDER_RETRY_BASE_DELAY = float(os.getenv("PROVIDER_RETRY_BASE_DELAY", "0.5"))
+PROVIDER_RETRY_MAX_DELAY = float(os.getenv("PROVIDER_RETRY_MAX_DELAY", "20"))
+# Автоматический выключатель: столько временных ошибок подряд размыкают его,
+# и запросы к провайдеру отклоняются сразу в течение PROVIDER_BREAKER_RESET секунд
+PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", "5"))
+PROVIDER_BREAKER_RESET = float(os.getenv("PROVIDER_BREAKER_RESET", "30"))
+
+# Пакетное распознавание: лимиты запроса и параллельность по провайдерам
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "1000"))
+BATCH_MAX_ARCHIVE_BYTES = int(os.getenv("BATCH_MAX_ARCHIVE_BYTES", str(8 * 1024 ** 3)))
+BATCH_CONCURRENCY = {
+    name: int(os.getenv(f"BATCH_{name.upper()}_CONCURRENCY", str(limit)))
+    for name, limit in (("yandex", 8), ("salute", 4))
+}
+# Каталог, из которого манифест может брать локальные файлы (пусто - манифесты отключены)
+BATCH_MANIFEST_ROOT = os.getenv("BATCH_MANIFEST_ROOT", "")
+
+# Модель Vosk для общего интерфейса движков (маршрутизация, задания, пакеты)
+VOSK_ENGINE_MODEL = os.getenv("VOSK_ENGINE_MODEL", VOSK_MODELS[0])
+
+# Маршрутизация между движками (POST /transcribe): порядок движков и режим
+# fallback (по очереди до первого успеха) или hedged (второй движок
+# запускается, если первый не уложился в свой p95)
+ROUTING_ENGINES = [
+    name.strip()
+    for name in os.getenv("ROUTING_ENGINES", "yandex,salute,vosk").split(",")
+    if name.strip()
+]
+ROUTING_MODE = os.getenv("ROUTING_MODE", "fallback")
+# Окно последних успешных распознаваний для p95 и минимум замеров для него
+ROUTING_LATENCY_WINDOW = int(os.getenv("ROUTING_LATENCY_WINDOW", "200"))
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", "20"))
+# Задержка второго движка (секунды), пока замеров меньше минимума, и нижняя граница
+ROUTING_HEDGE_DELAY = float(os.getenv("ROUTING_HEDGE_DELAY", "10"))
+ROUTING_HEDGE_MIN_DELAY = float(os.getenv("ROUTING_HEDGE_MIN_DELAY", "0.5"))
+
+# Сколько секунд задание или файл пакета повторяют попытки при перегрузке
+# пула, нехватке квоты или недоступности провайдера, прежде чем завершиться ошибкой
+ENGINE_RETRY_DEADLINE = float(os.getenv("ENGINE_RETRY_DEADLINE", "900"))
+
+# Движки, которые загружаются при запуске (остальные - при первом запросе):
+# yandex, salute, vosk, algo, live
+PRELOAD_ENGINES = [
+    name.strip()
+    for name in os.getenv("PRELOAD_ENGINES", "yandex,salute,vosk,algo,live").split(",")
+    if name.strip()
+]
+
+# Сервер: адрес, число процессов для serve.py и автоперезагрузка для разработки
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_RELOAD = os.getenv("SERVER_RELOAD", "false").lower() in ("1", "true", "yes")
@@ -1,13 +1,107 @@
+import logging
+import time
+
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI
-from routers import transcribe_router
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from config import LOG_LEVEL, TRACE_ID_HEADER, SERVER_HOST, SERVER_PORT, SERVER_RELOAD
+from routers import transcribe_router, jobs_router, batch_router, metrics_router, routing_router
+from src.engines import warmup_engines
+from src.executors import ExecutorOverloaded, shutdown_pools
+from src.http_client import close_clients
+from src.jobs import job_manager
+from src.workspace import workspaces, WorkspaceQuotaExceeded
+from src.metrics import HTTP_REQUEST_SECONDS, TraceIdFilter, new_trace_id, trace_id_var
+from src.poller import poller
+from src.resilience import ProviderUnavailable
+from src.storage import storage
+
+logging.basicConfig(
+    level=LOG_LEVEL,
+    format="%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s",
+)
+for handler in logging.getLogger().handlers:
+    handler.addFilter(TraceIdFilter())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Загружаем движки из PRELOAD_ENGINES и поднимаем их пулы до приема первого запроса
+    await workspaces.sweep_orphans()
+    await warmup_engines()
+    await job_manager.start()
+    await storage.ensure_lifecycle()
+    yield
+    await job_manager.stop()
+    await poller.close()
+    await close_clients()
+    shutdown_pools()
+
 
 # Создаем приложение FastAPI
-app = FastAPI(title="Transcribe audio")
+app = FastAPI(title="Transcribe audio", lifespan=lifespan)
 
 # Подключаем маршруты
 app.include_router(transcribe_router.router)
+app.include_router(jobs_router.router)
+app.include_router(batch_router.router)
+app.include_router(routing_router.router)
+app.include_router(metrics_router.router)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Идентификатор запроса попадает во все записи журнала, пока запрос обрабатывается
+    trace_id = request.headers.get(TRACE_ID_HEADER) or new_trace_id()
+    token = trace_id_var.set(trace_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[TRACE_ID_HEADER] = trace_id
+        return response
+    finally:
+        # Метка - шаблон маршрута, а не путь, чтобы не плодить ряды по идентификаторам
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+        trace_id_var.reset(token)
+
+
+@app.exception_handler(ExecutorOverloaded)
+async def executor_overloaded_handler(request: Request, exc: ExecutorOverloaded):
+    return JSONResponse(
+        content={"detail": str(exc)},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(WorkspaceQuotaExceeded)
+async def workspace_quota_handler(request: Request, exc: WorkspaceQuotaExceeded):
+    return JSONResponse(
+        content={"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(ProviderUnavailable)
+async def provider_unavailable_handler(request: Request, exc: ProviderUnavailable):
+    return JSONResponse(
+        content={"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 
-# Точка входа для запуска сервера
+# Точка входа для разработки; в продакшене - serve.py (несколько процессов)
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host=SERVER_HOST, port=SERVER_PORT, reload=SERVER_RELOAD)
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+
+from contextlib import AsyncExitStack
+
+import aiofiles
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import UploadFile
+
+from config import BATCH_MAX_FILES, BATCH_MANIFEST_ROOT
+from src.batch import (
+    BatchItem,
+    is_archive,
+    unpacked_size,
+    extract_archive,
+    manifest_items,
+    check_size,
+    run_batch,
+)
+from src.engines import ENGINES
+from src.workspace import workspaces, WorkspaceQuotaExceeded
+
+
+router = APIRouter(prefix="/batch")
+
+
+async def _save_uploads(uploads: list, workspace) -> list:
+    items = []
+    for upload in uploads:
+        name = os.path.basename(upload.filename or "audio")
+        path = workspace.file(f"{len(items):05d}_{name}")
+        async with aiofiles.open(path, "wb") as buffer:
+            while chunk := await upload.read(1024 * 1024):
+                await buffer.write(chunk)
+        if is_archive(name):
+            # Архив лежит рядом со своими файлами, пока не распакован
+            size = await asyncio.to_thread(unpacked_size, path)
+            await workspaces.resize(workspace, workspace.reserved + size)
+            items += await asyncio.to_thread(extract_archive, path, workspace.path, len(items))
+        else:
+            items.append(BatchItem(len(items), name, path))
+    # Дальше резерв пакета - только его файлы: распознавание резервирует свое
+    await workspaces.resize(workspace, await asyncio.to_thread(workspace.size))
+    return items
+
+
+async def _collect(request: Request, stack: AsyncExitStack):
+    """:return: Файлы пакета и рабочий каталог, куда они сохранены (для манифеста None)."""
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            manifest = await request.json()
+        except ValueError:
+            raise ValueError("Манифест должен быть JSON-объектом с полем paths")
+        if not isinstance(manifest, dict):
+            raise ValueError("Манифест должен быть JSON-объектом с полем paths")
+        return await asyncio.to_thread(manifest_items, manifest.get("paths"), BATCH_MANIFEST_ROOT), None
+
+    form = await request.form(max_files=BATCH_MAX_FILES)
+    stack.push_async_callback(form.close)
+    uploads = [value for _, value in form.multi_items() if isinstance(value, UploadFile)]
+    # Резерв под сами загрузки; архивы добавляют объем распакованных файлов
+    size = sum(upload.size or 0 for upload in uploads)
+    workspace = await stack.enter_async_context(workspaces.open("batch", size or None))
+    return await _save_uploads(uploads, workspace), workspace
+
+
+@router.post("/{engine}")
+async def batch_point(engine: str, request: Request):
+    """
+    Пакетное распознавание: файлы multipart (в том числе zip/tar архивы)
+    или JSON-манифест {"paths": [...]} с путями внутри BATCH_MANIFEST_ROOT.
+
+    Ответ - NDJSON: строка на каждый файл по мере готовности
+    ({"index", "name", "status", "result" | "error"}), последняя строка -
+    {"summary": {...}}.
+    """
+    if engine not in ENGINES:
+        raise HTTPException(status_code=404, detail=f"Неизвестный движок: {engine}")
+
+    # Рабочий каталог пакета живет, пока отдается ответ
+    stack = AsyncExitStack()
+    try:
+        items, workspace = await _collect(request, stack)
+        check_size(items)
+    except WorkspaceQuotaExceeded:
+        await stack.aclose()
+        raise
+    except ValueError as e:
+        await stack.aclose()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        await stack.aclose()
+        raise
+
+    async def stream():
+        try:
+            async for line in run_batch(engine, items, workspace):
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            await stack.aclose()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
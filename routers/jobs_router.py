@@ -0,0 +1,118 @@
+import os
+import uuid
+
+from datetime import datetime
+from typing import Optional
+
+import aiofiles
+from fastapi import APIRouter, UploadFile, HTTPException, Form
+from fastapi.responses import JSONResponse
+
+from config import JOBS_DIR
+from src.jobs import job_manager, check_webhook_url, WebhookRejected
+from src.transcode import upload_extension
+from src.workspace import workspaces
+
+
+router = APIRouter(prefix="/jobs")
+
+
+async def _save_upload(audio: UploadFile, prefix: str):
+    """
+    Сохраняет вход задания в JOBS_DIR. Место резервируется в квоте рабочих
+    каталогов до записи и остается занятым, пока вход задания не удален.
+
+    :return: Путь к файлу и резерв квоты.
+    """
+    current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    unique_id = str(uuid.uuid4())[:10]
+    file_name = f"{prefix}_audio_{current_time}_processed_{unique_id}{upload_extension(audio.filename)}"
+    reservation = await workspaces.reserve(JOBS_DIR, audio.size)
+    local_file_path = reservation.file(file_name)
+    try:
+        async with aiofiles.open(local_file_path, "wb") as buffer:
+            while chunk := await audio.read(1024 * 1024):
+                await buffer.write(chunk)
+        # Размер загрузки мог быть неизвестен заранее
+        await workspaces.resize(reservation, os.path.getsize(local_file_path))
+    except BaseException:
+        await _discard_upload(local_file_path, reservation)
+        raise
+    return local_file_path, reservation
+
+
+async def _discard_upload(local_file_path: str, reservation):
+    try:
+        os.remove(local_file_path)
+    except FileNotFoundError:
+        pass
+    await workspaces.release(reservation)
+
+
+async def _submit(engine: str, audio: UploadFile, webhook_url: Optional[str]):
+    if webhook_url:
+        try:
+            await check_webhook_url(webhook_url)
+        except WebhookRejected as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    local_file_path, reservation = await _save_upload(audio, engine)
+    try:
+        job = await job_manager.submit(engine, local_file_path, webhook_url, reservation=reservation)
+    except BaseException:
+        await _discard_upload(local_file_path, reservation)
+        raise
+    return JSONResponse(
+        content={"job_id": job["id"], "status": job["status"]},
+        status_code=202,
+    )
+
+
+@router.post("/yandex_speech_kit")
+async def yandex_speech_kit_job_point(audio: UploadFile, webhook_url: Optional[str] = Form(None)):
+    """Ставит файл в очередь на распознавание Yandex SpeechKit и сразу возвращает id задания."""
+    return await _submit("yandex", audio, webhook_url)
+
+
+@router.post("/salute_speech")
+async def salute_speech_job_point(audio: UploadFile, webhook_url: Optional[str] = Form(None)):
+    """Ставит файл в очередь на распознавание SaluteSpeech и сразу возвращает id задания."""
+    return await _submit("salute", audio, webhook_url)
+
+
+async def _get_job(job_id: str) -> dict:
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return job
+
+
+@router.get("/{job_id}")
+async def job_status_point(job_id: str):
+    job = await _get_job(job_id)
+    return JSONResponse(
+        content={
+            "job_id": job["id"],
+            "engine": job["engine"],
+            "status": job["status"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+        },
+        status_code=200,
+    )
+
+
+@router.get("/{job_id}/result")
+async def job_result_point(job_id: str):
+    job = await _get_job(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка при обработке файла: {job['error']}",
+        )
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Задание еще выполняется: {job['status']}")
+    return JSONResponse(
+        content=job["result"],
+        status_code=200,
+    )
@@ -0,0 +1,29 @@
+import asyncio
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from config import DOWNLOADS
+from src.metrics import metrics, directory_size, TEMP_DISK_BYTES
+
+
+router = APIRouter()
+
+
+def _collect_temp_disk():
+    """Место, занятое временными файлами, по подкаталогам DOWNLOADS."""
+    with os.scandir(DOWNLOADS) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                TEMP_DISK_BYTES.set(directory_size(entry.path), directory=entry.name)
+
+
+metrics.add_collector(_collect_temp_disk)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Коллекторы обходят диск, поэтому выгрузка собирается вне цикла событий
+    text = await asyncio.to_thread(metrics.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,64 @@
+from typing import Optional
+
+import aiofiles
+from fastapi import APIRouter, UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+
+from src.executors import ExecutorOverloaded
+from src.resilience import ProviderUnavailable
+from src.routing import engine_router, RoutingError
+from src.transcode import upload_extension
+from src.workspace import workspaces, estimate_bytes, WorkspaceQuotaExceeded
+
+
+router = APIRouter()
+
+
+@router.post("/transcribe")
+async def transcribe_point(audio: UploadFile, engines: Optional[str] = None, mode: Optional[str] = None):
+    """
+    Распознавание с переключением между движками.
+
+    :param engines: Движки через запятую в порядке приоритета (yandex, salute,
+        vosk); по умолчанию ROUTING_ENGINES.
+    :param mode: fallback - следующий движок только при ошибке предыдущего;
+        hedged - следующий запускается параллельно, если текущий не уложился
+        в свой p95, побеждает первый ответ. По умолчанию ROUTING_MODE.
+    """
+    engines = [name.strip() for name in engines.split(",") if name.strip()] if engines else None
+    try:
+        async with workspaces.open("routing", estimate_bytes(audio.size)) as workspace:
+            local_file_path = workspace.file(f"audio{upload_extension(audio.filename)}")
+            async with aiofiles.open(local_file_path, "wb") as buffer:
+                while chunk := await audio.read(1024 * 1024):
+                    await buffer.write(chunk)
+            result = await engine_router.recognize(local_file_path, engines, mode)
+
+        return JSONResponse(
+            content=result,
+            status_code=200,
+        )
+
+    except (ExecutorOverloaded, WorkspaceQuotaExceeded, ProviderUnavailable):
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RoutingError as e:
+        raise HTTPException(
+            status_code=502,
+            detail={"message": f"Ни один движок не распознал файл: {e}", "attempts": e.attempts},
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка при обработке файла: {str(e)}",
+        )
+
+
+@router.get("/routing/stats")
+async def routing_stats_point():
+    """Маршрутизация между движками: p50/p95 на секунду аудио, победы, переключения."""
+    return JSONResponse(
+        content=engine_router.stats(),
+        status_code=200,
+    )
@@ -1,16 +1,29 @@
-import os
+import asyncio
 import uuid
 
 from datetime import datetime
 import aiofiles
-from fastapi import APIRouter, UploadFile, HTTPException
+from fastapi import APIRouter, UploadFile, HTTPException, Request, WebSocket
 from fastapi.responses import JSONResponse
 from pydub import AudioSegment
-import speech_recognition as sr
-from src.algo import algo
-from src.audio import (process_audio_for_salute, process_audio_for_yandex,)
-from config import YANDEX_SPEECHKIT_DIR, SALUTE_SPEECHKIT_DIR
-from src.vosk import transcribe_vosk
+from config import VOSK_MODELS, LIVE_VOSK_MODELS
+from src.executors import ExecutorOverloaded, run_in_pool, pools, pools_stats
+from src.poller import poller
+from src.resilience import ProviderUnavailable, guards_stats
+from src.cache import cached, result_cache
+from src.transcode import upload_extension
+from src.workspace import workspaces, estimate_bytes, WorkspaceQuotaExceeded
+from src.storage import storage
+
+
+async def _save_upload(audio: UploadFile, path: str):
+    async with aiofiles.open(path, "wb") as buffer:
+        while chunk := await audio.read(1024 * 1024):
+            await buffer.write(chunk)
+
+
+def _upload_name(audio: UploadFile) -> str:
+    return f"{uuid.uuid4()}.{audio.filename.split('.')[-1]}"
 
 
 def convert_file(file_name: str, save_audio_path: str):
@@ -21,21 +34,41 @@ def convert_file(file_name: str, save_audio_path: str):
 
 
 
+# Модули движков (torch, librosa, vosk, Silero) импортируются в обработчиках:
+# процесс загружает только то, что действительно используется, либо то,
+# что заранее загрузил src.engines для PRELOAD_ENGINES
+
+
+async def _algo_vosk(file_name: str, model_path: str):
+    from src.algo import preprocess_file
+    from src.vosk import transcribe_vosk_array
+
+    # Предобработанный массив сразу уходит в распознаватель, без записи на диск
+    y, sample_rate = await preprocess_file(file_name)
+    return await run_in_pool("vosk", transcribe_vosk_array, y, sample_rate, model_path)
+
+
 router = APIRouter()
 
 
 @router.post("/yandex_speech_kit")
-async def yandex_speech_kit_point(audio: UploadFile):
+async def yandex_speech_kit_point(audio: UploadFile, segmented: bool = False):
+    """
+    :param segmented: Распознать длинную запись частями параллельно.
+    """
+    from src.audio import process_audio_for_yandex
+
     try:
         # Сохраняем загруженный файл локально
         current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         unique_id = str(uuid.uuid4())[:10]
-        file_name = f"yandex_audio_{current_time}_processed_{unique_id}.mp3"
-        local_file_path = os.path.join(YANDEX_SPEECHKIT_DIR, file_name)
-        async with aiofiles.open(local_file_path, "wb") as buffer:
-            content = await audio.read()
-            await buffer.write(content)
-        status, full_text, chunks = await process_audio_for_yandex(local_file_path, file_name)
+        file_name = f"yandex_audio_{current_time}_processed_{unique_id}{upload_extension(audio.filename)}"
+        async with workspaces.open("yandex", estimate_bytes(audio.size)) as workspace:
+            local_file_path = workspace.file(file_name)
+            await _save_upload(audio, local_file_path)
+            status, full_text, chunks = await process_audio_for_yandex(
+                local_file_path, file_name, segmented=segmented
+            )
 
         return JSONResponse(
             content={"message": {
@@ -46,6 +79,51 @@ async def yandex_speech_kit_point(audio: UploadFile):
             status_code=200,
         )
 
+    except (ExecutorOverloaded, WorkspaceQuotaExceeded, ProviderUnavailable):
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка при обработке файла: {str(e)}",
+        )
+
+
+@router.post("/yandex_speech_kit/stream")
+async def yandex_speech_kit_stream_point(request: Request):
+    """
+    То же, что /yandex_speech_kit, но VAD выполняется во время загрузки.
+
+    Принимает multipart/form-data с полем audio или файл в теле запроса.
+    """
+    from src.audio import process_audio_for_yandex
+    from src.ingest import StreamingVadIngest, iter_upload
+
+    try:
+        current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        unique_id = str(uuid.uuid4())[:10]
+        file_name = f"yandex_audio_{current_time}_processed_{unique_id}.mp3"
+        content_length = int(request.headers.get("content-length") or 0)
+        async with workspaces.open("yandex", estimate_bytes(content_length)) as workspace:
+            local_file_path = workspace.file(file_name)
+            async with StreamingVadIngest(local_file_path) as ingest:
+                async for chunk in iter_upload(request):
+                    await ingest.feed(chunk)
+
+            # Если поток не удалось декодировать, regions = None и VAD выполнится по файлу
+            status, full_text, chunks = await process_audio_for_yandex(
+                local_file_path, file_name, speech_regions=ingest.regions
+            )
+
+        return JSONResponse(
+            content={"message": {
+                "status": status,
+                "full_text": full_text,
+            }},
+            status_code=200,
+        )
+
+    except (ExecutorOverloaded, WorkspaceQuotaExceeded, ProviderUnavailable):
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -54,24 +132,29 @@ async def yandex_speech_kit_point(audio: UploadFile):
 
 
 @router.post("/salute_speech")
-async def salute_speech_point(audio: UploadFile):
+async def salute_speech_point(audio: UploadFile, segmented: bool = False):
+    """
+    :param segmented: Распознать длинную запись частями параллельно.
+    """
+    from src.audio import process_audio_for_salute
+
     try:
         # Сохраняем загруженный файл локально
         unique_id = str(uuid.uuid4())[:10]
         current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        file_name = f"salute_audio_{current_time}_processed_{unique_id}.mp3"
-        local_file_path = os.path.join(SALUTE_SPEECHKIT_DIR, file_name)
-        async with aiofiles.open(local_file_path, "wb") as buffer:
-            content = await audio.read()
-            await buffer.write(content)
-
-        result = await process_audio_for_salute(local_file_path)
+        file_name = f"salute_audio_{current_time}_processed_{unique_id}{upload_extension(audio.filename)}"
+        async with workspaces.open("salute", estimate_bytes(audio.size)) as workspace:
+            local_file_path = workspace.file(file_name)
+            await _save_upload(audio, local_file_path)
+            result = await process_audio_for_salute(local_file_path, segmented=segmented)
 
         return JSONResponse(
             content=result,
             status_code=200,
         )
 
+    except (ExecutorOverloaded, WorkspaceQuotaExceeded, ProviderUnavailable):
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -82,18 +165,24 @@ async def salute_speech_point(audio: UploadFile):
 async def algo_speech_point(audio: UploadFile):
     try:
         # Сохраняем загруженный файл локально
-        file_name = f"tmp/{uuid.uuid4()}.{audio.filename.split('.')[-1]}"
-        async with aiofiles.open(file_name, "wb") as buffer:
-            content = await audio.read()
-            await buffer.write(content)
+        async with workspaces.open("vosk", estimate_bytes(audio.size)) as workspace:
+            file_name = workspace.file(_upload_name(audio))
+            await _save_upload(audio, file_name)
 
-        path = algo(file_name, file_name)
-        result = transcribe_vosk(path, "vosk-model-small-ru-0.22")
+            result = await cached(
+                "vosk",
+                file_name,
+                {"model": "vosk-model-small-ru-0.22", "preprocessing": "algo"},
+                lambda: _algo_vosk(file_name, "vosk-model-small-ru-0.22"),
+                should_store=bool,
+            )
         return JSONResponse(
             content=result,
             status_code=200,
         )
 
+    except (ExecutorOverloaded, WorkspaceQuotaExceeded, ProviderUnavailable):
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -102,26 +191,30 @@ async def algo_speech_point(audio: UploadFile):
     
 @router.post("/algo")
 async def algo_speech_point(audio: UploadFile):
+    import speech_recognition as sr
+    from src.algo import preprocess_file_to
+
     try:
         # Сохраняем загруженный файл локально
-        file_name = f"tmp/{uuid.uuid4()}.{audio.filename.split('.')[-1]}"
-        async with aiofiles.open(file_name, "wb") as buffer:
-            content = await audio.read()
-            await buffer.write(content)
-
-        path = algo(file_name, file_name)
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(file_name) as source:
-            # Прослушиваем аудио и сохраняем его в переменную
-            audio_data = recognizer.record(source)
-            text = recognizer.recognize_google(audio_data, language="ru-RU")  # Для русского языка
-            # Выводим распознанный текст
-            print("Распознанный текст: ", text)
-            return JSONResponse(
-                content=text,
-                status_code=200,
-            )
+        async with workspaces.open("algo", estimate_bytes(audio.size)) as workspace:
+            file_name = workspace.file(_upload_name(audio))
+            await _save_upload(audio, file_name)
 
+            path = await preprocess_file_to(file_name, file_name)
+            recognizer = sr.Recognizer()
+            with sr.AudioFile(path) as source:
+                # Прослушиваем аудио и сохраняем его в переменную
+                audio_data = recognizer.record(source)
+                text = recognizer.recognize_google(audio_data, language="ru-RU")  # Для русского языка
+                # Выводим распознанный текст
+                print("Распознанный текст: ", text)
+                return JSONResponse(
+                    content=text,
+                    status_code=200,
+                )
+
+    except (ExecutorOverloaded, WorkspaceQuotaExceeded, ProviderUnavailable):
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -129,22 +222,23 @@ async def algo_speech_point(audio: UploadFile):
         )
 @router.post("/algo/only-transcrib")
 async def algo_speech_point(audio: UploadFile):
+        import speech_recognition as sr
+
         # Сохраняем загруженный файл локально
-        file_name = f"tmp/{uuid.uuid4()}.{audio.filename.split('.')[-1]}"
-        async with aiofiles.open(file_name, "wb") as buffer:
-            content = await audio.read()
-            await buffer.write(content)
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(file_name) as source:
-            # Прослушиваем аудио и сохраняем его в переменную
-            audio_data = recognizer.record(source)
-            text = recognizer.recognize_google(audio_data, language="ru-RU")  # Для русского языка
-            # Выводим распознанный текст
-            print("Распознанный текст: ", text)
-            return JSONResponse(
-                content=text,
-                status_code=200,
-            )
+        async with workspaces.open("algo", estimate_bytes(audio.size)) as workspace:
+            file_name = workspace.file(_upload_name(audio))
+            await _save_upload(audio, file_name)
+            recognizer = sr.Recognizer()
+            with sr.AudioFile(file_name) as source:
+                # Прослушиваем аудио и сохраняем его в переменную
+                audio_data = recognizer.record(source)
+                text = recognizer.recognize_google(audio_data, language="ru-RU")  # Для русского языка
+                # Выводим распознанный текст
+                print("Распознанный текст: ", text)
+                return JSONResponse(
+                    content=text,
+                    status_code=200,
+                )
     # try:
     # except Exception as e:
     #     raise HTTPException(
@@ -154,17 +248,24 @@ async def algo_speech_point(audio: UploadFile):
     
 @router.post("/algo/vosk/only-transcrib/small")
 async def algo_speech_point(audio: UploadFile):
+    from src.vosk import transcribe_vosk
+
     # Сохраняем загруженный файл локально
     # try:
-    file_name = f"tmp/{uuid.uuid4()}.{audio.filename.split('.')[-1]}"
-    async with aiofiles.open(file_name, "wb") as buffer:
-        content = await audio.read()
-        await buffer.write(content)
+    async with workspaces.open("vosk", estimate_bytes(audio.size)) as workspace:
+        file_name = workspace.file(_upload_name(audio))
+        await _save_upload(audio, file_name)
 
-    # Load MP3 
-    # convert_file(file_name, file_name)
+        # Load MP3 
+        # convert_file(file_name, file_name)
 
-    result = transcribe_vosk(file_name, "vosk-model-small-ru-0.22")
+        result = await cached(
+            "vosk",
+            file_name,
+            {"model": "vosk-model-small-ru-0.22"},
+            lambda: run_in_pool("vosk", transcribe_vosk, file_name, "vosk-model-small-ru-0.22"),
+            should_store=bool,
+        )
     return JSONResponse(
         content=result,
         status_code=200,
@@ -174,3 +275,132 @@ async def algo_speech_point(audio: UploadFile):
     #         status_code=500,
     #         detail=f"Ошибка при обработке файла: {str(e)}",
     #     )
+
+
+@router.post("/vosk/parallel")
+async def vosk_parallel_point(audio: UploadFile, model: str = "vosk-model-ru-0.42"):
+    """
+    Офлайн-распознавание длинного файла Vosk на всех воркерах пула vosk.
+
+    :param model: Одна из моделей VOSK_MODELS.
+    """
+    if model not in VOSK_MODELS:
+        raise HTTPException(status_code=400, detail=f"Неизвестная модель: {model}")
+    from src.vosk_parallel import transcribe_vosk_parallel
+
+    try:
+        # Размер PCM 16 кГц зависит от длительности, а не от размера сжатого файла
+        async with workspaces.open("vosk", estimate_bytes(audio.size) * 4) as workspace:
+            file_name = workspace.file(_upload_name(audio))
+            await _save_upload(audio, file_name)
+
+            result = await cached(
+                "vosk",
+                file_name,
+                {"model": model, "mode": "parallel"},
+                lambda: transcribe_vosk_parallel(file_name, model),
+                should_store=lambda result: bool(result["text"]),
+            )
+        return JSONResponse(
+            content=result,
+            status_code=200,
+        )
+
+    except (ExecutorOverloaded, WorkspaceQuotaExceeded, ProviderUnavailable):
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка при обработке файла: {str(e)}",
+        )
+
+
+@router.websocket("/ws/vosk")
+async def vosk_ws_point(websocket: WebSocket, model: str = LIVE_VOSK_MODELS[0],
+                        sample_rate: int = 16000, format: str = "pcm"):
+    """
+    Потоковое распознавание Vosk: бинарные кадры PCM s16le или Ogg/WebM Opus,
+    в ответ промежуточные и итоговые результаты с таймстампами слов.
+    Завершение сессии - текстовое сообщение {"eof": 1}.
+    """
+    from src.live import serve_live_vosk
+
+    await serve_live_vosk(websocket, model, sample_rate, format)
+
+
+@router.get("/live/stats")
+async def live_stats_point():
+    """Состояние потоковых сессий: активные, отклоненные, таймауты."""
+    from src.live import live_stats
+
+    return JSONResponse(
+        content=live_stats(),
+        status_code=200,
+    )
+
+
+@router.get("/vosk/models")
+async def vosk_models_point():
+    """Статистика загруженных моделей Vosk: память, время загрузки, попадания."""
+    from src.vosk import vosk_stats
+
+    # Снимки воркеров пула vosk приходят через очередь событий
+    pools["vosk"].drain_events()
+    return JSONResponse(
+        content=vosk_stats(),
+        status_code=200,
+    )
+
+
+@router.get("/executors")
+async def executors_point():
+    """Состояние пулов процессов: глубина очереди, загрузка, отказы."""
+    return JSONResponse(
+        content=pools_stats(),
+        status_code=200,
+    )
+
+
+@router.get("/poller")
+async def poller_point():
+    """Состояние общего планировщика опросов провайдеров."""
+    return JSONResponse(
+        content=poller.stats(),
+        status_code=200,
+    )
+
+
+@router.get("/providers")
+async def providers_point():
+    """Защита провайдеров: выключатели, повторы, лимиты запросов."""
+    return JSONResponse(
+        content=guards_stats(),
+        status_code=200,
+    )
+
+
+@router.get("/workspace/stats")
+async def workspace_stats_point():
+    """Рабочие каталоги запросов: квота, резерв, отказы, удаленные при запуске."""
+    return JSONResponse(
+        content=workspaces.stats(),
+        status_code=200,
+    )
+
+
+@router.get("/storage/stats")
+async def storage_stats_point():
+    """Объектное хранилище: загрузки в процессе и используемые объекты."""
+    return JSONResponse(
+        content=storage.stats(),
+        status_code=200,
+    )
+
+
+@router.get("/cache/stats")
+async def cache_stats_point():
+    """Статистика кэша результатов: попадания, промахи, размер."""
+    return JSONResponse(
+        content=await asyncio.to_thread(result_cache.stats),
+        status_code=200,
+    )
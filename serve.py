@@ -0,0 +1,112 @@
+"""
+Запуск в продакшене: несколько процессов uvicorn на одном сокете.
+
+Главный процесс импортирует приложение и загружает движки из
+PRELOAD_ENGINES, затем порождает воркеры через fork. Веса моделей
+остаются общими страницами памяти (copy-on-write), и воркеры не
+загружают их заново. Упавший воркер перезапускается, SIGTERM/SIGINT
+завершает все воркеры штатно.
+
+    SERVER_WORKERS=4 PRELOAD_ENGINES=salute,live python serve.py
+"""
+import logging
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, PRELOAD_ENGINES
+
+# Не перезапускать воркер чаще, чем раз в столько секунд
+RESPAWN_DELAY = 1.0
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(app, sock: socket.socket):
+    # Журнал уже настроен в main.py, uvicorn пишет в те же обработчики
+    config = uvicorn.Config(app, lifespan="on", log_config=None)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, app, sock: socket.socket, workers: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                _serve(self.app, self.sock)
+            except BaseException:
+                logging.exception("Воркер завершился с ошибкой")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        logging.info(f"Запущен воркер {pid}")
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logging.error(f"Воркер {pid} завершился (код {os.waitstatus_to_exitcode(status)}), перезапуск")
+            time.sleep(max(0.0, RESPAWN_DELAY - (time.monotonic() - started)))
+            if not self.stopping:
+                self.spawn()
+
+
+def main():
+    # Импорт приложения настраивает журнал, маршруты и метрики до fork
+    from main import app
+    from src.engines import preload
+    from src.workspace import workspaces
+
+    workers = max(SERVER_WORKERS, 1)
+    preload(PRELOAD_ENGINES)
+    # Резерв места каждый воркер ведет сам, поэтому общая квота делится между ними
+    workspaces.quota //= workers
+    sock = _bind(SERVER_HOST, SERVER_PORT)
+    logging.info(
+        f"Сервер на {SERVER_HOST}:{SERVER_PORT}, воркеров: {workers}, "
+        f"квота рабочих каталогов на воркер: {workspaces.quota} байт"
+    )
+    Supervisor(app, sock, workers).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
-import torch
+import os
+from functools import lru_cache
+
 import librosa
 import soundfile as sf
-import matplotlib.pyplot as plt
-from asteroid.models import DCCRNet  # Правильный импорт модели
-from scipy.signal import butter, lfilter
+from scipy.signal import butter, sosfilt
 import numpy as np
 
+from config import ALGO_DEBUG_DIR
+from .denoiser import denoiser
+from .executors import PoolBatcher, run_in_pool
+
 def plot_spectrogram(audio, sr, title):
+    # matplotlib нужен только для отладки, при импорте модуля он не грузится
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(10, 4))
     D = librosa.amplitude_to_db(np.abs(librosa.stft(audio)), ref=np.max)
     librosa.display.specshow(D, sr=sr, x_axis='time', y_axis='log')
@@ -35,89 +42,155 @@ def save_audio(y, sr, output_file):
     except Exception as e:
         print(f"Ошибка при сохранении аудио: {e}")
 
-def bandpass_filter(audio, sr, lowcut=300.0, highcut=3000.0, order=4):
+@lru_cache(maxsize=16)
+def _bandpass_sos(sr, lowcut, highcut, order):
     nyquist = 0.5 * sr
     low = lowcut / nyquist
     high = highcut / nyquist
-    b, a = butter(order, [low, high], btype='band')
-    y = lfilter(b, a, audio)
-    return y
+    return butter(order, [low, high], btype='band', output='sos').astype(np.float32)
 
-def dynamic_range_compression(audio, threshold=0.5, ratio=4.0):
-    compressed = np.copy(audio)
-    above_threshold = np.abs(audio) > threshold
-    compressed[above_threshold] = np.sign(audio[above_threshold]) * (
-        threshold + (np.abs(audio[above_threshold]) - threshold) / ratio
+def bandpass_filter(audio, sr, lowcut=300.0, highcut=3000.0, order=4):
+    # Коэффициенты кэшируются, фильтрация идет в float32 без промежуточных копий
+    sos = _bandpass_sos(sr, lowcut, highcut, order)
+    return sosfilt(sos, np.asarray(audio, dtype=np.float32))
+
+def dynamic_range_compression(audio, threshold=0.5, ratio=4.0, inplace=False):
+    compressed = audio if inplace else np.copy(audio)
+    magnitude = np.abs(compressed)
+    above_threshold = magnitude > threshold
+    compressed[above_threshold] = np.sign(compressed[above_threshold]) * (
+        threshold + (magnitude[above_threshold] - threshold) / ratio
     )
     return compressed
 
-def normalize_audio(audio, target_dBFS=-20.0):
-    rms = np.sqrt(np.mean(audio**2))
+def normalize_audio(audio, target_dBFS=-20.0, inplace=False):
+    normalized_audio = audio if inplace else np.copy(audio)
+    rms = np.sqrt(np.mean(np.square(audio, dtype=np.float64)))
+    if rms == 0:
+        return normalized_audio
     target_rms = 10**(target_dBFS / 20)
-    normalized_audio = audio * (target_rms / rms)
+    normalized_audio *= target_rms / rms
     # Избегаем клиппинга
-    normalized_audio = np.clip(normalized_audio, -1.0, 1.0)
+    np.clip(normalized_audio, -1.0, 1.0, out=normalized_audio)
     return normalized_audio
 
 def enhance_audio_with_asteroid(input_file, output_file):
     print("Загрузка аудио...")
     y, sr = load_audio(input_file)
-    
-    print("Визуализация исходной спектрограммы...")
-    
+
     print("Загрузка модели DCCRNet для шумоподавления...")
     try:
-        model = DCCRNet.from_pretrained("JorisCos/DCCRNet_Libri1Mix_enhsingle_16k")
+        denoiser.load()
     except Exception as e:
         print(f"Ошибка при загрузке модели: {e}")
         return None, None
-    
-    model.eval()
-    
-    if torch.cuda.is_available():
-        model = model.cuda()
-        y_tensor = torch.from_numpy(y).unsqueeze(0).cuda()
-    else:
-        y_tensor = torch.from_numpy(y).unsqueeze(0)
-    
+
     print("Применение шумоподавления с использованием модели DCCRNet...")
-    with torch.no_grad():
-        enhanced = model(y_tensor)
-    enhanced = enhanced.squeeze().cpu().numpy()
-    
-    print("Визуализация спектрограммы после шумоподавления...")
-    
+    enhanced = denoiser.enhance(y)
+
     print(f"Сохранение улучшенного аудио в {output_file}...")
     save_audio(enhanced, sr, output_file)
-    
+
     return enhanced, sr
 
-def algo(input_audio: str, save_audio_path: str):
-    enhanced_audio = "enhanced_DCCRNetet.wav"  # Исправлено название файла
-    filtered_audio = f"{input_audio}filtered_audio.wav"
-    compressed_audio = f"{input_audio}compressed_audio.wav"
-    
+def preprocess_audio(y, sr, debug_prefix=None):
+    """
+    Цепочка предобработки в памяти: шумоподавление, полосовой фильтр,
+    компрессия и нормализация. Промежуточные файлы не пишутся.
+
+    :param y: Аудио 16 кГц, одномерный массив float32.
+    :param sr: Частота дискретизации.
+    :param debug_prefix: Если задан, после каждого этапа сохраняется
+        f"{debug_prefix}_<этап>.wav".
+    :return: Обработанный массив float32.
+    """
     # Шаг 1: Шумоподавление с использованием Asteroid (DCCRNet)
-    y_enhanced, sr = enhance_audio_with_asteroid(input_audio, enhanced_audio)
-    
-    if y_enhanced is None:
-        print("Не удалось выполнить шумоподавление.")
-        return
-    
+    print("Применение шумоподавления с использованием модели DCCRNet...")
+    y = denoiser.enhance(y)
+    return filter_audio(y, sr, debug_prefix=debug_prefix)
+
+def filter_audio(y, sr, debug_prefix=None):
+    """
+    Этапы предобработки после шумоподавления: полосовой фильтр, компрессия
+    и нормализация.
+
+    :param y: Очищенное аудио, одномерный массив float32.
+    :param debug_prefix: См. preprocess_audio.
+    :return: Обработанный массив float32.
+    """
+    def dump(stage, audio):
+        if debug_prefix:
+            save_audio(audio, sr, f"{debug_prefix}_{stage}.wav")
+
+    dump("enhanced", y)
+
     # Шаг 2: Полосовая фильтрация
     print("Применение полосового фильтра (300-3000 Гц)...")
-    y_filtered = bandpass_filter(y_enhanced, sr, lowcut=300.0, highcut=3000.0, order=4)
-    save_audio(y_filtered, sr, filtered_audio)
-    
+    y = bandpass_filter(y, sr, lowcut=300.0, highcut=3000.0, order=4)
+    dump("filtered", y)
+
     # Шаг 3: Динамическая компрессия
     print("Применение динамической компрессии...")
-    y_compressed = dynamic_range_compression(y_filtered, threshold=0.5, ratio=4.0)
-    save_audio(y_compressed, sr, compressed_audio)
-    
+    dynamic_range_compression(y, threshold=0.5, ratio=4.0, inplace=True)
+    dump("compressed", y)
+
     # Шаг 4: Нормализация громкости
     print("Нормализация громкости...")
-    y_normalized = normalize_audio(y_compressed, target_dBFS=-20.0)
-    save_audio(y_normalized, sr, save_audio_path)
-    
+    normalize_audio(y, target_dBFS=-20.0, inplace=True)
+    dump("normalized", y)
+    return y
+
+def _debug_prefix(input_audio, debug):
+    if not (debug or ALGO_DEBUG_DIR):
+        return None
+    debug_dir = ALGO_DEBUG_DIR or os.path.dirname(os.path.abspath(input_audio))
+    os.makedirs(debug_dir, exist_ok=True)
+    return os.path.join(debug_dir, os.path.basename(input_audio))
+
+def algo_array(input_audio: str, debug: bool = False):
+    """Загружает файл и возвращает результат предобработки как (массив, частота)."""
+    print("Загрузка аудио...")
+    y, sr = load_audio(input_audio)
+    y = preprocess_audio(y, sr, debug_prefix=_debug_prefix(input_audio, debug))
+    return y, sr
+
+def algo(input_audio: str, save_audio_path: str, debug: bool = False):
+    try:
+        y, sr = algo_array(input_audio, debug=debug)
+    except Exception as e:
+        print(f"Не удалось выполнить предобработку: {e}")
+        return
+
+    save_audio(y, sr, save_audio_path)
+    print(f"Все этапы обработки завершены. Итоговый файл: {save_audio_path}")
+    return save_audio_path
+
+def enhance_batch(signals):
+    """Шумоподавление пакета записей одним проходом модели (в пуле denoise)."""
+    return denoiser.enhance_many(signals)
+
+# Воркер пула denoise выполняет одну задачу за раз, поэтому одновременные
+# записи объединяются до пула, а не внутри воркера
+_denoise_batches = PoolBatcher("denoise", enhance_batch)
+
+async def preprocess_file(input_audio: str, debug: bool = False):
+    """
+    Предобработка файла с пакетным шумоподавлением.
+
+    Загрузка и фильтры выполняются в пуле transcode, шумоподавление
+    одновременных запросов - одним вызовом пула denoise.
+
+    :return: Обработанный массив float32 и частота дискретизации.
+    """
+    debug_prefix = _debug_prefix(input_audio, debug)
+    y, sr = await run_in_pool("transcode", load_audio, input_audio)
+    y = await _denoise_batches.submit(y)
+    y = await run_in_pool("transcode", filter_audio, y, sr, debug_prefix)
+    return y, sr
+
+async def preprocess_file_to(input_audio: str, save_audio_path: str, debug: bool = False):
+    """Асинхронный вариант algo: предобработка с сохранением в save_audio_path."""
+    y, sr = await preprocess_file(input_audio, debug=debug)
+    await run_in_pool("transcode", save_audio, y, sr, save_audio_path)
     print(f"Все этапы обработки завершены. Итоговый файл: {save_audio_path}")
     return save_audio_path
@@ -1,38 +1,110 @@
+import os
 import logging
 
 from pydub import AudioSegment
 
+from config import SYNC_MAX_SECONDS
+
 from .utils import (
     remove_background_audio,
-    apply_vad,
+    detect_speech_regions,
     filter_hallucinations,
 )
-from src.salutespeech_transcribe import (
-    upload_file_to_salute,
-    create_salute_task,
-    get_task_status,
-    get_access_token,
-    download_result_from_salute,
+from src.salutespeech_transcribe import recognize_file_with_salute, recognize_sync_with_salute
+from src.yandex_transcribe import upload_file_to_s3, recognize_sync
+from src.cache import cached
+from src.resilience import ProviderError, ProviderUnavailable
+from src.transcode import transcode_for_provider, derived_path
+from src.hallucinations import hallucination_filters
+from src.segmented import (
+    split_regions,
+    segment_map,
+    remap_timestamps,
+    recognize_yandex_segmented,
+    recognize_salute_segmented,
 )
-from src.yandex_transcribe import upload_file_to_s3
 
+# Опции, от которых зависит результат: входят в ключ кэша
+YANDEX_CACHE_OPTIONS = {"language": "ru-RU", "vad": True, "literature_text": True, "timestamps": "source"}
+SALUTE_CACHE_OPTIONS = {"language": "ru-RU", "hypotheses_count": 1}
+
+# Ограничения синхронных API на размер тела запроса
+SYNC_MAX_BYTES = {"yandex": 1024 * 1024, "salute": 2 * 1024 * 1024}
+
+
+def use_sync(plan, upload_path: str) -> bool:
+    """Запись достаточно короткая для синхронного распознавания (SYNC_MAX_SECONDS)."""
+    return (
+        0 < plan.duration <= SYNC_MAX_SECONDS[plan.provider]
+        and os.path.getsize(upload_path) <= SYNC_MAX_BYTES[plan.provider]
+    )
 
-async def process_audio_for_yandex(audio_path: AudioSegment, file_name) -> str:
+
+async def process_audio_for_yandex(audio_path: AudioSegment, file_name, speech_regions=None,
+                                   segmented=False) -> str:
+    """
+    :param speech_regions: Участки речи (секунды), если VAD уже выполнен при приеме файла.
+    :param segmented: Распознавать длинную запись частями параллельно.
+    """
+    result = await cached(
+        "yandex",
+        audio_path,
+        {**YANDEX_CACHE_OPTIONS, "segmented": segmented},
+        lambda: _process_audio_for_yandex(audio_path, file_name, speech_regions, segmented),
+        should_store=lambda result: result[0] == "done",
+    )
+    return tuple(result)
+
+
+async def _process_audio_for_yandex(audio_path, file_name, speech_regions=None, segmented=False):
     try:
-        # Применяем VaD для удаления участков тишины
-        vad_processed_path = await apply_vad(audio_path, audio_path.replace(".mp3", "_vad.mp3"))
-        if not vad_processed_path:
+        if speech_regions is None:
+            # Определяем участки речи с помощью VaD
+            speech_regions = await detect_speech_regions(audio_path)
+        if not speech_regions:
             raise Exception("Ошибка при применении VaD")
 
-        # Определяем путь на S3
-        s3_file_name = f"yandex/{file_name}"
+        if segmented and len(split_regions(speech_regions)) > 1:
+            # Длинная запись распознается частями параллельно
+            status, full_text, chunks = await recognize_yandex_segmented(
+                audio_path, file_name, speech_regions
+            )
+            full_text = await filter_hallucinations(full_text)
+            return status, full_text, hallucination_filters.get().filter_yandex_chunks(chunks)
+
+        # Одно кодирование: вырезание тишины, моно 16 кГц, формат провайдера
+        upload_path, plan = await transcode_for_provider(audio_path, "yandex", speech_regions)
+
+        result = None
+        if use_sync(plan, upload_path):
+            # Короткая запись: один синхронный запрос без S3 и опросов
+            try:
+                result = await recognize_sync(upload_path, audio_encoding=plan.encoding)
+                os.remove(upload_path)
+            except ProviderUnavailable:
+                raise
+            except ProviderError as e:
+                logging.warning(f"Синхронное распознавание Yandex не удалось, используем асинхронное: {e}")
 
-        # Загружаем файл в Yandex Cloud
-        status, full_text, chunks = await upload_file_to_s3(
-            local_file_path=vad_processed_path,
-            s3_file_name=s3_file_name,
-        )
+        if result is None:
+            # Определяем путь на S3
+            s3_file_name = f"yandex/{derived_path(file_name, '', plan.target['ext'])}"
+
+            # Загружаем файл в Yandex Cloud
+            result = await upload_file_to_s3(
+                local_file_path=upload_path,
+                s3_file_name=s3_file_name,
+                audio_encoding=plan.encoding,
+                duration=plan.duration,
+            )
+        status, full_text, chunks = result
         full_text = await filter_hallucinations(full_text)
+        if status == "done":
+            # Распознавалась запись без тишины: таймстампы переводятся на шкалу
+            # исходной записи, как и в распознавании частями
+            remap_timestamps(chunks, segment_map(speech_regions))
+            # Таймстампы сохраняются: из чанков удаляются только сами стоп-слова
+            chunks = hallucination_filters.get().filter_yandex_chunks(chunks)
         return status, full_text, chunks
 
     except Exception as e:
@@ -40,43 +112,56 @@ async def process_audio_for_yandex(audio_path: AudioSegment, file_name) -> str:
         raise e
 
 
-async def process_audio_for_salute(audio_path: AudioSegment) -> dict:
+async def process_audio_for_salute(audio_path: AudioSegment, segmented=False) -> dict:
+    """
+    :param segmented: Распознавать длинную запись частями параллельно.
+    """
+    return await cached(
+        "salute",
+        audio_path,
+        {**SALUTE_CACHE_OPTIONS, "segmented": segmented},
+        lambda: _process_audio_for_salute(audio_path, segmented),
+    )
+
+
+async def _process_audio_for_salute(audio_path, segmented=False):
     try:
-        # Загрузка файла в SaluteSpeech
-        access_token = await get_access_token()
-        request_file_id = await upload_file_to_salute(audio_path, access_token)
-        if not request_file_id:
-            raise Exception("Ошибка при загрузке файла в SaluteSpeech")
-
-        # Создание задачи для транскрибации
-        task_id = await create_salute_task(request_file_id, access_token)
-        if not task_id:
-            raise Exception(
-                "Ошибка при создании задачи для транскрибации в SaluteSpeech"
-            )
+        result = None
+        if segmented:
+            # Длинная запись распознается частями параллельно
+            result = await recognize_salute_segmented(audio_path)
+        if result is None:
+            # Одно кодирование в формат провайдера (моно 16 кГц)
+            upload_path, plan = await transcode_for_provider(audio_path, "salute")
+            if upload_path != audio_path:
+                os.remove(audio_path)
+            if use_sync(plan, upload_path):
+                # Короткая запись: один синхронный запрос без загрузки и опросов
+                try:
+                    result = await recognize_sync_with_salute(upload_path, audio_encoding=plan.encoding)
+                    os.remove(upload_path)
+                except ProviderUnavailable:
+                    raise
+                except ProviderError as e:
+                    logging.warning(f"Синхронное распознавание SaluteSpeech не удалось, используем асинхронное: {e}")
+            if result is None:
+                result = await recognize_file_with_salute(
+                    upload_path, audio_encoding=plan.encoding, duration=plan.duration
+                )
+
+        # Обработка текста для удаления галлюцинаций (вместе с выравниванием слов)
+        result = hallucination_filters.get().filter_salute_result(result)
+        transcribed_texts = []
+        for segment in result:
+            # Проверяем наличие ключа "results" в каждом сегменте
+            if "results" in segment:
+                for hypothesis in segment["results"]:
+                    transcribed_text = hypothesis.get("normalized_text", "")
+                    if transcribed_text:
+                        transcribed_texts.append(transcribed_text)
 
-        # Проверка статуса задачи
-        task_status = await get_task_status(task_id, access_token)
-        if not task_status:
-            raise Exception("Ошибка при распознавании аудио в SaluteSpeech")
-        response_file_id = task_status.get("response_file_id")
-
-        result = await download_result_from_salute(response_file_id, access_token)
-        # Обработка текста для удаления галлюцинаций
-        if isinstance(result, list) and len(result) > 0:
-            transcribed_texts = []
-            for segment in result:
-                # Проверяем наличие ключа "results" в каждом сегменте
-                if "results" in segment:
-                    for hypothesis in segment["results"]:
-                        transcribed_text = hypothesis.get("normalized_text", "")
-                        if transcribed_text:
-                            transcribed_texts.append(transcribed_text)
-
-            # Объединяем все тексты в один
-            full_transcribed_text = " ".join(transcribed_texts)
-        else:
-            raise Exception("Некорректный формат ответа из SaluteSpeech")
+        # Объединяем все тексты в один
+        full_transcribed_text = " ".join(transcribed_texts)
         filtered_text = await filter_hallucinations(full_transcribed_text)
         # filtered_text += "\n\n"
         return {
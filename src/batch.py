@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import shutil
+import tarfile
+import time
+import zipfile
+
+from config import BATCH_MAX_FILES, BATCH_MAX_ARCHIVE_BYTES, BATCH_CONCURRENCY
+from .engines import ENGINES, run_engine
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class BatchItem:
+    def __init__(self, index: int, name: str, path: str = None, error: str = None):
+        self.index = index
+        self.name = name
+        self.path = path
+        self.error = error
+
+
+def is_archive(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _skip_member(name: str) -> bool:
+    # Служебные файлы архиваторов и скрытые файлы не распознаются
+    parts = name.replace("\\", "/").split("/")
+    return any(part.startswith(".") or part == "__MACOSX" for part in parts)
+
+
+def _archive_members(archive_path: str) -> tuple:
+    """Открытый архив и его файлы: (имя, размер, функция открытия)."""
+    if zipfile.is_zipfile(archive_path):
+        archive = zipfile.ZipFile(archive_path)
+        return archive, [
+            (info.filename, info.file_size, lambda info=info: archive.open(info))
+            for info in archive.infolist()
+            if not info.is_dir()
+        ]
+    archive = tarfile.open(archive_path)
+    return archive, [
+        (member.name, member.size, lambda member=member: archive.extractfile(member))
+        for member in archive.getmembers()
+        if member.isfile()
+    ]
+
+
+def unpacked_size(archive_path: str) -> int:
+    """Объем файлов архива после распаковки (без служебных)."""
+    try:
+        archive, members = _archive_members(archive_path)
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ValueError(f"Не удалось прочитать архив {os.path.basename(archive_path)}: {e}")
+    with archive:
+        return sum(size for name, size, _ in members if not _skip_member(name))
+
+
+def extract_archive(archive_path: str, directory: str, first_index: int) -> list:
+    """
+    Распаковывает файлы архива в directory без вложенных путей.
+
+    :return: Список BatchItem, нумерация с first_index.
+    """
+    try:
+        archive, members = _archive_members(archive_path)
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ValueError(f"Не удалось прочитать архив {os.path.basename(archive_path)}: {e}")
+
+    with archive:
+        members = [member for member in members if not _skip_member(member[0])]
+        total = sum(size for _, size, _ in members)
+        if total > BATCH_MAX_ARCHIVE_BYTES:
+            raise ValueError(
+                f"Архив {os.path.basename(archive_path)} распаковывается в {total} байт, "
+                f"допустимо не больше {BATCH_MAX_ARCHIVE_BYTES}"
+            )
+        items = []
+        for offset, (name, _, open_member) in enumerate(members):
+            index = first_index + offset
+            # Имена из архива не используются как пути: только базовое имя с номером
+            path = os.path.join(directory, f"{index:05d}_{os.path.basename(name)}")
+            with open_member() as source, open(path, "wb") as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            items.append(BatchItem(index, name, path))
+    os.remove(archive_path)
+    return items
+
+
+def manifest_items(paths: list, root: str) -> list:
+    """
+    Файлы манифеста. Допустимы только пути внутри root; недоступный путь
+    становится ошибкой этого файла, а не всего пакета.
+    """
+    if not root:
+        raise ValueError("Манифесты локальных файлов отключены (BATCH_MANIFEST_ROOT)")
+    if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+        raise ValueError("Манифест должен содержать список путей paths")
+
+    root = os.path.realpath(root)
+    items = []
+    for index, name in enumerate(paths):
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([path, root]) != root:
+            items.append(BatchItem(index, name, error="Путь вне каталога манифестов"))
+        elif not os.path.isfile(path):
+            items.append(BatchItem(index, name, error="Файл не найден"))
+        else:
+            items.append(BatchItem(index, name, path))
+    return items
+
+
+def check_size(items: list):
+    if len(items) > BATCH_MAX_FILES:
+        raise ValueError(f"В пакете {len(items)} файлов, допустимо не больше {BATCH_MAX_FILES}")
+    if not items:
+        raise ValueError("В пакете нет файлов")
+
+
+# Параллельность по провайдерам общая для всех пакетов процесса
+_semaphores = {}
+
+
+def _semaphore(engine: str) -> asyncio.Semaphore:
+    if engine not in _semaphores:
+        _semaphores[engine] = asyncio.Semaphore(BATCH_CONCURRENCY.get(engine, 4))
+    return _semaphores[engine]
+
+
+async def _run_item(engine: str, item: BatchItem, workspace) -> dict:
+    line = {"index": item.index, "name": item.name}
+    if item.error is not None:
+        return {**line, "status": "failed", "error": item.error}
+
+    async with _semaphore(engine):
+        started = time.monotonic()
+        try:
+            result = await run_engine(engine, item.path, parent=workspace)
+        except Exception as e:
+            logging.error(f"Ошибка при распознавании файла пакета {item.name}: {e}")
+            return {**line, "status": "failed", "error": str(e),
+                    "seconds": round(time.monotonic() - started, 3)}
+    return {**line, "status": "done", "seconds": round(time.monotonic() - started, 3),
+            "result": result}
+
+
+async def run_batch(engine: str, items: list, workspace=None):
+    """
+    Распознает файлы пакета параллельно (не больше BATCH_CONCURRENCY на
+    провайдера) и отдает результаты по мере готовности, последней строкой -
+    сводку. Если клиент отключился, незавершенные файлы отменяются.
+
+    :param workspace: Рабочий каталог, куда сохранены файлы пакета: каждый
+        файл распознается в его подкаталоге, а не в отдельном каталоге.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Неизвестный движок: {engine}")
+
+    started = time.monotonic()
+    counts = {"done": 0, "failed": 0}
+    tasks = [asyncio.ensure_future(_run_item(engine, item, workspace)) for item in items]
+    try:
+        for future in asyncio.as_completed(tasks):
+            line = await future
+            counts[line["status"]] += 1
+            yield line
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    yield {"summary": {
+        "engine": engine,
+        "total": len(items),
+        **counts,
+        "seconds": round(time.monotonic() - started, 3),
+    }}
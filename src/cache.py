@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from config import CACHE_ENABLED, CACHE_DB_PATH, CACHE_MAX_BYTES, CACHE_TTL
+
+
+def cache_key(file_path: str, engine: str, options: dict = None) -> str:
+    """Ключ кэша: хэш содержимого файла, движок и влияющие на результат опции."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    digest.update(engine.encode())
+    digest.update(json.dumps(options or {}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Кэш результатов распознавания на диске (SQLite).
+
+    Записи старше ttl считаются промахом, при превышении max_bytes
+    вытесняются давно не использованные записи (LRU).
+    """
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode())
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now),
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute(
+            "SELECT key, size FROM results ORDER BY accessed_at"
+        ).fetchall():
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        requests = self.hits + self.misses
+        return {
+            "enabled": CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+result_cache = ResultCache()
+
+
+async def cached(engine: str, file_path: str, options: dict, compute, should_store=None):
+    """
+    Возвращает результат из кэша или вычисляет его через compute() и сохраняет.
+
+    :param engine: Имя движка распознавания.
+    :param file_path: Путь к исходному загруженному файлу.
+    :param options: Опции, влияющие на результат (язык, модель, предобработка).
+    :param compute: Корутина-фабрика без аргументов, выполняющая распознавание.
+    :param should_store: Проверка, что результат можно кэшировать (например, не ошибка).
+    """
+    if not CACHE_ENABLED:
+        return await compute()
+
+    try:
+        key = await asyncio.to_thread(cache_key, file_path, engine, options)
+        result = await asyncio.to_thread(result_cache.get, key)
+    except Exception as e:
+        logging.error(f"Ошибка чтения кэша результатов: {e}")
+        return await compute()
+    if result is not None:
+        logging.info(f"Результат {engine} для {file_path} взят из кэша")
+        return result
+
+    result = await compute()
+    if should_store is None or should_store(result):
+        try:
+            await asyncio.to_thread(result_cache.set, key, result)
+        except Exception as e:
+            logging.error(f"Ошибка записи в кэш результатов: {e}")
+    return result
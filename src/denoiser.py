@@ -0,0 +1,191 @@
+import time
+import logging
+import threading
+
+import numpy as np
+import torch
+from asteroid.models import DCCRNet
+
+from config import (
+    DENOISE_MODEL,
+    DENOISE_THREADS,
+    DENOISE_WINDOW_SECONDS,
+    DENOISE_OVERLAP_SECONDS,
+    DENOISE_BATCH_SIZE,
+)
+from .metrics import record_model_load
+
+
+class _Request:
+    """Запись, ожидающая шумоподавления в общем проходе модели."""
+
+    def __init__(self, signal):
+        self.signal = signal
+        self.result = None
+        self.error = None
+        self.done = False
+
+
+class DCCRNetDenoiser:
+    """
+    Долгоживущий сервис шумоподавления на DCCRNet.
+
+    Модель загружается один раз, аудио обрабатывается окнами фиксированной
+    длины с перекрытием и склеивается методом overlap-add, поэтому расход
+    памяти на инференс не зависит от длины записи. Окна нескольких коротких
+    записей можно обработать одним проходом модели через enhance_many.
+
+    Одновременные вызовы enhance из разных потоков объединяются: пока модель
+    занята, записи копятся в очереди, и следующий проход обрабатывает их все
+    вместе. Одиночный вызов не ждет. Запросы сервиса объединяются еще до пула
+    denoise (src.algo.preprocess_file) и приходят сюда через enhance_many.
+    """
+
+    def __init__(self, model_name: str = DENOISE_MODEL, sample_rate: int = 16000,
+                 window_seconds: float = DENOISE_WINDOW_SECONDS,
+                 overlap_seconds: float = DENOISE_OVERLAP_SECONDS,
+                 batch_size: int = DENOISE_BATCH_SIZE,
+                 num_threads: int = DENOISE_THREADS):
+        self.model_name = model_name
+        self.sample_rate = sample_rate
+        self.window = int(window_seconds * sample_rate)
+        self.overlap = min(int(overlap_seconds * sample_rate), self.window // 2)
+        self.hop = self.window - self.overlap
+        self.batch_size = max(batch_size, 1)
+        self.num_threads = num_threads
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._model = None
+        self._lock = threading.Lock()
+        # Очередь записей для enhance и блокировка прохода модели
+        self._queue = []
+        self._queue_lock = threading.Lock()
+        self._runner_lock = threading.Lock()
+        self._weight = self._crossfade_weight()
+
+    def _crossfade_weight(self) -> np.ndarray:
+        """Весовое окно: плоское в центре, с косинусными скатами на перекрытиях."""
+        weight = np.ones(self.window, dtype=np.float32)
+        if self.overlap:
+            ramp = np.sin(
+                0.5 * np.pi * (np.arange(1, self.overlap + 1) / (self.overlap + 1))
+            ) ** 2
+            weight[:self.overlap] = ramp
+            weight[-self.overlap:] = ramp[::-1]
+        return weight
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """Загружает модель (однократно, потокобезопасно)."""
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                if self.num_threads > 0:
+                    torch.set_num_threads(self.num_threads)
+                logging.info(f"Загрузка модели {self.model_name} для шумоподавления...")
+                started = time.perf_counter()
+                model = DCCRNet.from_pretrained(self.model_name)
+                model.eval()
+                self._model = model.to(self.device)
+                elapsed = time.perf_counter() - started
+                record_model_load("dccrnet", self.model_name, elapsed)
+                logging.info(f"Модель {self.model_name} загружена за {elapsed:.2f} с")
+        return self._model
+
+    def warmup(self):
+        """Загружает модель и прогоняет одно пустое окно."""
+        try:
+            self.enhance(np.zeros(self.window, dtype=np.float32))
+        except Exception as e:
+            logging.warning(f"Прогрев DCCRNet пропущен: {e}")
+
+    def _starts(self, length: int) -> list:
+        if length <= self.window:
+            return [0]
+        starts = list(range(0, length - self.window, self.hop))
+        starts.append(length - self.window)
+        return starts
+
+    def _forward(self, batch: np.ndarray) -> np.ndarray:
+        model = self.load()
+        with torch.inference_mode():
+            tensor = torch.from_numpy(batch).to(self.device)
+            enhanced = model(tensor)
+        return enhanced.reshape(batch.shape[0], -1)[:, :self.window].cpu().numpy()
+
+    def enhance_many(self, signals: list) -> list:
+        """
+        Шумоподавление для нескольких записей 16 кГц одновременно.
+
+        Окна всех записей собираются в общие батчи, так что короткие записи
+        обрабатываются одним проходом модели.
+
+        :param signals: Список одномерных массивов float32.
+        :return: Список очищенных массивов той же длины.
+        """
+        signals = [np.asarray(signal, dtype=np.float32) for signal in signals]
+        outputs = [np.zeros(len(signal), dtype=np.float32) for signal in signals]
+        norms = [np.zeros(len(signal), dtype=np.float32) for signal in signals]
+        windows = [
+            (index, start)
+            for index, signal in enumerate(signals)
+            if len(signal)
+            for start in self._starts(len(signal))
+        ]
+
+        batch = np.zeros((self.batch_size, self.window), dtype=np.float32)
+        for offset in range(0, len(windows), self.batch_size):
+            chunk = windows[offset:offset + self.batch_size]
+            batch[:] = 0.0
+            for row, (index, start) in enumerate(chunk):
+                segment = signals[index][start:start + self.window]
+                batch[row, :len(segment)] = segment
+            enhanced = self._forward(batch[:len(chunk)])
+            for row, (index, start) in enumerate(chunk):
+                length = min(self.window, len(signals[index]) - start)
+                weight = self._weight[:length]
+                outputs[index][start:start + length] += enhanced[row, :length] * weight
+                norms[index][start:start + length] += weight
+
+        for output, norm in zip(outputs, norms):
+            np.maximum(norm, 1e-8, out=norm)
+            output /= norm
+        return outputs
+
+    def _run_queue(self):
+        with self._queue_lock:
+            batch, self._queue = self._queue, []
+        if not batch:
+            return
+        try:
+            results = self.enhance_many([request.signal for request in batch])
+        except BaseException as e:
+            for request in batch:
+                request.error = e
+        else:
+            for request, result in zip(batch, results):
+                request.result = result
+        finally:
+            for request in batch:
+                request.done = True
+
+    def enhance(self, y: np.ndarray) -> np.ndarray:
+        """Шумоподавление одной записи 16 кГц."""
+        request = _Request(y)
+        with self._queue_lock:
+            self._queue.append(request)
+        # Модель гоняет один поток за раз и забирает всю накопленную очередь:
+        # к моменту, когда блокировка получена, запись либо уже обработана
+        # предыдущим проходом, либо попадет в этот
+        with self._runner_lock:
+            if not request.done:
+                self._run_queue()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+
+denoiser = DCCRNetDenoiser()
@@ -0,0 +1,168 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+
+from config import PRELOAD_ENGINES, VOSK_WARMUP, DENOISE_WARMUP, VOSK_ENGINE_MODEL, ENGINE_RETRY_DEADLINE
+from .cache import cached
+from .executors import ExecutorOverloaded, pools, warmup_pools
+from .resilience import ProviderUnavailable
+from .workspace import workspaces, estimate_bytes, WorkspaceQuotaExceeded
+
+# Модули движка, которые импортируются заранее (torch, vosk, librosa и т.д.)
+ENGINE_MODULES = {
+    "yandex": ("src.audio", "src.ingest"),
+    "salute": ("src.audio",),
+    "vosk": ("src.vosk", "src.vosk_parallel"),
+    "algo": ("src.algo", "src.vosk"),
+    "live": ("src.live",),
+}
+
+# Пулы процессов, которые использует движок
+ENGINE_POOLS = {
+    "yandex": ("vad",),
+    "salute": ("vad",),
+    "vosk": ("vosk",),
+    "algo": ("transcode", "denoise", "vosk"),
+    "live": (),
+}
+
+
+class EngineError(Exception):
+    """Движок завершил распознавание ошибкой, а не результатом."""
+
+
+class Engine:
+    """
+    Общий интерфейс движка распознавания файлов.
+
+    :param recognize: Корутина (путь к файлу) -> ответ в формате эндпоинта
+        движка. Конвейер может удалить входной файл.
+    :param text: Функция, достающая распознанный текст из ответа.
+    :param size_factor: Во сколько раз рабочему каталогу нужно больше места,
+        чем обычно для файла такого размера (декодирование в PCM).
+    """
+
+    def __init__(self, name: str, recognize, text, size_factor: int = 1):
+        self.name = name
+        self.recognize = recognize
+        self.text = text
+        self.size_factor = size_factor
+
+    def __repr__(self):
+        return f"Engine({self.name})"
+
+
+async def _recognize_yandex(input_path: str) -> dict:
+    from .audio import process_audio_for_yandex
+
+    status, full_text, chunks = await process_audio_for_yandex(
+        input_path, os.path.basename(input_path)
+    )
+    if status != "done":
+        raise EngineError(f"Yandex SpeechKit вернул статус {status}")
+    return {"status": status, "full_text": full_text}
+
+
+async def _recognize_salute(input_path: str) -> dict:
+    from .audio import process_audio_for_salute
+
+    return await process_audio_for_salute(input_path)
+
+
+async def _recognize_vosk(input_path: str) -> dict:
+    from .vosk_parallel import transcribe_vosk_parallel
+
+    # Тот же ключ кэша, что у /vosk/parallel
+    return await cached(
+        "vosk",
+        input_path,
+        {"model": VOSK_ENGINE_MODEL, "mode": "parallel"},
+        lambda: transcribe_vosk_parallel(input_path, VOSK_ENGINE_MODEL),
+        should_store=lambda result: bool(result["text"]),
+    )
+
+
+ENGINES = {
+    "yandex": Engine("yandex", _recognize_yandex, lambda result: result["full_text"]),
+    "salute": Engine("salute", _recognize_salute, lambda result: result["task_result"]),
+    "vosk": Engine("vosk", _recognize_vosk, lambda result: result["text"], size_factor=4),
+}
+
+
+async def run_engine(engine: str, input_path: str, retry_overload: bool = True, parent=None):
+    """
+    Распознает файл движком engine в отдельном рабочем каталоге.
+
+    Конвейер удаляет вход и пишет файлы рядом с ним, поэтому работает с
+    копией: сам input_path остается нетронутым, и один файл могут
+    одновременно распознавать несколько движков.
+
+    :param retry_overload: При перегрузке пула, нехватке квоты или
+        недоступности провайдера не отклонять запрос, а повторять позже -
+        не дольше ENGINE_RETRY_DEADLINE, затем бросается последняя ошибка.
+    :param parent: Рабочий каталог, в котором уже лежит input_path (пакет):
+        движок работает в его подкаталоге, резерв добавляется к резерву parent.
+    """
+    engine = ENGINES[engine]
+    size = estimate_bytes(os.path.getsize(input_path)) * engine.size_factor
+    deadline = time.monotonic() + ENGINE_RETRY_DEADLINE
+    while True:
+        if parent is None:
+            context = workspaces.open(engine.name, size)
+        else:
+            context = workspaces.nested(parent, engine.name, size)
+        try:
+            async with context as workspace:
+                work_path = await asyncio.to_thread(workspace.adopt, input_path)
+                return await engine.recognize(work_path)
+        except (ExecutorOverloaded, WorkspaceQuotaExceeded, ProviderUnavailable) as e:
+            remaining = deadline - time.monotonic()
+            if not retry_overload or remaining <= 0:
+                raise
+            logging.warning(f"Движок {engine.name} перегружен, повтор через {e.retry_after} с: {e}")
+            await asyncio.sleep(min(e.retry_after, remaining))
+
+
+def _load_models(engine: str):
+    """Модели, которые движок держит в текущем процессе: свои и пулов без процессов."""
+    if engine in ("yandex", "salute"):
+        from .utils import get_vad_model
+        get_vad_model()
+    elif engine == "live":
+        from .live import preload_live
+        preload_live()
+    if engine in ("vosk", "algo") and pools["vosk"].workers == 0 and VOSK_WARMUP:
+        from .vosk import vosk_registry
+        vosk_registry.warmup()
+    if engine == "algo" and pools["denoise"].workers == 0 and DENOISE_WARMUP:
+        from .denoiser import denoiser
+        # Только веса: прогон модели до fork запустил бы потоки torch
+        denoiser.load()
+
+
+def preload(engines=PRELOAD_ENGINES):
+    """
+    Импортирует модули движков и загружает их модели в текущий процесс.
+
+    Вызывается до fork воркеров (serve.py), чтобы веса были общими
+    между процессами (copy-on-write), и при старте приложения - тогда
+    повторный вызов ничего не делает.
+    """
+    for engine in engines:
+        if engine not in ENGINE_MODULES:
+            logging.warning(f"Неизвестный движок в PRELOAD_ENGINES: {engine}")
+            continue
+        started = time.perf_counter()
+        for module in ENGINE_MODULES[engine]:
+            importlib.import_module(module)
+        _load_models(engine)
+        logging.info(f"Движок {engine} загружен за {time.perf_counter() - started:.2f} с")
+
+
+async def warmup_engines(engines=PRELOAD_ENGINES):
+    """Загружает движки и поднимает их пулы процессов до приема запросов."""
+    await asyncio.to_thread(preload, engines)
+    names = {name for engine in engines for name in ENGINE_POOLS.get(engine, ())}
+    await warmup_pools(names)
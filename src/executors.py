@@ -0,0 +1,327 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .metrics import (
+    metrics,
+    init_worker_events,
+    drain_worker_events,
+    EXECUTOR_QUEUE_DEPTH,
+    EXECUTOR_ACTIVE,
+    EXECUTOR_REJECTED,
+    EXECUTOR_TASK_SECONDS,
+)
+from config import (
+    EXECUTOR_MP_CONTEXT,
+    EXECUTOR_POOLS,
+    VOSK_WARMUP,
+    VOSK_ENGINE_MODEL,
+    DENOISE_WARMUP,
+)
+
+
+class ExecutorOverloaded(Exception):
+    """Очередь пула заполнена, запрос нужно повторить позже."""
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"Пул {pool} перегружен, повторите через {retry_after} с")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+def _init_vad():
+    from .utils import get_vad_model
+    get_vad_model()
+
+
+def _init_vosk():
+    # Воркер держит только модель общего интерфейса движков, остальные
+    # загружаются по требованию: иначе каждый воркер занял бы память под все VOSK_MODELS
+    if VOSK_WARMUP:
+        from .vosk import vosk_registry
+        vosk_registry.warmup([VOSK_ENGINE_MODEL])
+
+
+def _init_denoise():
+    if DENOISE_WARMUP:
+        from .denoiser import denoiser
+        denoiser.warmup()
+
+
+def _noop():
+    return None
+
+
+def _init_worker(events, initializer):
+    init_worker_events(events)
+    if initializer is not None:
+        initializer()
+
+
+INITIALIZERS = {
+    "vad": _init_vad,
+    "vosk": _init_vosk,
+    "denoise": _init_denoise,
+}
+
+
+class ManagedPool:
+    """
+    Пул процессов с ограниченной очередью.
+
+    Если задач в работе и в очереди больше, чем workers + max_queue,
+    новая задача сразу отклоняется с ExecutorOverloaded, а не ждет
+    неограниченно долго.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int, initializer=None,
+                 mp_context: str = EXECUTOR_MP_CONTEXT):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.initializer = initializer
+        self.mp_context = mp_context
+        self._executor = None
+        self._events = None
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return max(self.workers, 1) + self.max_queue
+
+    def _get_executor(self):
+        if self._executor is None and self.workers > 0:
+            context = multiprocessing.get_context(self.mp_context)
+            # Через очередь воркеры сообщают о событиях для метрик (загрузка моделей)
+            self._events = context.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._events, self.initializer),
+            )
+        return self._executor
+
+    def retry_after(self) -> int:
+        """Оценка в секундах, через сколько в пуле освободится место."""
+        if not self._completed:
+            return 1
+        avg = self._total_seconds / self._completed
+        waves = self._in_flight / max(self.workers, 1)
+        return max(1, int(avg * waves + 0.5))
+
+    async def run(self, fn, *args, **kwargs):
+        """Выполняет fn(*args, **kwargs) в пуле и возвращает результат."""
+        if self._in_flight >= self.capacity:
+            self._rejected += 1
+            EXECUTOR_REJECTED.inc(pool=self.name)
+            raise ExecutorOverloaded(self.name, self.retry_after())
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        call = functools.partial(fn, *args, **kwargs)
+
+        def finished(*_):
+            # Задача освобождает место, когда действительно завершилась, а не когда
+            # отменили ожидающий ее запрос: воркер продолжает ее выполнять
+            try:
+                loop.call_soon_threadsafe(self._task_done, started)
+            except RuntimeError:
+                pass  # Цикл событий уже закрыт
+
+        executor = self._get_executor()
+        self._in_flight += 1
+        self._submitted += 1
+        try:
+            if executor is None:
+                context = contextvars.copy_context()
+
+                def tracked():
+                    try:
+                        return context.run(call)
+                    finally:
+                        finished()
+
+                # Без shield отмена сняла бы еще не начатую задачу, и finished не вызвался бы
+                result = await asyncio.shield(loop.run_in_executor(None, tracked))
+            else:
+                try:
+                    future = executor.submit(call)
+                except BaseException:
+                    finished()
+                    raise
+                future.add_done_callback(finished)
+                result = await asyncio.wrap_future(future)
+        except Exception:
+            self._failed += 1
+            raise
+        self._completed += 1
+        return result
+
+    def _task_done(self, started: float):
+        self._in_flight -= 1
+        elapsed = time.monotonic() - started
+        self._total_seconds += elapsed
+        EXECUTOR_TASK_SECONDS.observe(elapsed, pool=self.name)
+
+    async def warmup(self):
+        """Поднимает процессы пула, чтобы инициализаторы отработали до запросов."""
+        if self.workers == 0:
+            if self.initializer is not None:
+                await asyncio.to_thread(self.initializer)
+            return
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(
+            loop.run_in_executor(executor, _noop) for _ in range(self.workers)
+        ))
+
+    def stats(self) -> dict:
+        workers = max(self.workers, 1)
+        active = min(self._in_flight, workers)
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "active": active,
+            "queue_depth": self._in_flight - active,
+            "utilisation": round(active / workers, 3),
+            "avg_seconds": round(self._total_seconds / max(self._completed, 1), 3),
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+        }
+
+    def drain_events(self):
+        if self._events is not None:
+            drain_worker_events(self._events)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pools = {
+    name: ManagedPool(name, initializer=INITIALIZERS.get(name), **options)
+    for name, options in EXECUTOR_POOLS.items()
+}
+
+
+async def run_in_pool(pool: str, fn, *args, **kwargs):
+    """Выполняет CPU-нагруженную функцию в пуле pool ("vad", "transcode", "denoise", "vosk")."""
+    return await pools[pool].run(fn, *args, **kwargs)
+
+
+async def gather_or_cancel(coroutines):
+    """
+    Как asyncio.gather, но при первой ошибке отменяет остальные задачи и
+    дожидается их: общие входные файлы можно удалять сразу после выхода.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class PoolBatcher:
+    """
+    Объединяет одновременные вызовы в один вызов пула.
+
+    Пока в пуле выполняется пакет, новые элементы копятся, и следующий вызов
+    fn получает их все одним списком. Пакетов в работе не больше, чем воркеров
+    в пуле, поэтому воркер с одной задачей за раз все равно видит пакет, а не
+    отдельные записи. fn должна вернуть список результатов в том же порядке.
+    """
+
+    def __init__(self, pool: str, fn):
+        self.pool = pool
+        self.fn = fn
+        self._pending = []
+        self._running = 0
+        self._tasks = set()
+
+    async def submit(self, item):
+        """Добавляет элемент в ближайший пакет и возвращает его результат."""
+        pool = pools[self.pool]
+        if len(self._pending) >= pool.capacity:
+            raise ExecutorOverloaded(self.pool, pool.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if self._running < max(pool.workers, 1):
+            self._running += 1
+            task = asyncio.create_task(self._drain())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await future
+
+    async def _drain(self):
+        try:
+            while self._pending:
+                # Элементы отмененных запросов в пул не отправляем
+                batch = [(item, future) for item, future in self._pending if not future.done()]
+                self._pending = []
+                if not batch:
+                    continue
+                try:
+                    results = await run_in_pool(self.pool, self.fn, [item for item, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                except BaseException:
+                    for _, future in batch:
+                        future.cancel()
+                    raise
+                else:
+                    for (_, future), result in zip(batch, results):
+                        if not future.done():
+                            future.set_result(result)
+        finally:
+            self._running -= 1
+
+
+async def warmup_pools(names=None):
+    """:param names: Пулы для прогрева; по умолчанию все."""
+    for pool in pools.values():
+        if names is not None and pool.name not in names:
+            continue
+        try:
+            await pool.warmup()
+        except Exception as e:
+            logging.error(f"Ошибка при прогреве пула {pool.name}: {e}")
+
+
+def shutdown_pools():
+    for pool in pools.values():
+        pool.shutdown()
+
+
+def pools_stats() -> dict:
+    return {name: pool.stats() for name, pool in pools.items()}
+
+
+def _collect_metrics():
+    for name, pool in pools.items():
+        pool.drain_events()
+        stats = pool.stats()
+        EXECUTOR_QUEUE_DEPTH.set(stats["queue_depth"], pool=name)
+        EXECUTOR_ACTIVE.set(stats["active"], pool=name)
+
+
+metrics.add_collector(_collect_metrics)
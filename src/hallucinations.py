@@ -0,0 +1,180 @@
+import logging
+import os
+import re
+import threading
+
+from config import HALLUCINATIONS_DIR
+
+# Стоп-слова или стоп-фразы, которые могут быть "галлюцинациями"
+DEFAULT_STOP_WORDS = {
+    "ru": [
+        "эмм", "эээ", "типа", "ну это", "мм", "вроде как", "короче",
+        "это самое", "в общем", "как его там", "что-то типа"
+    ],
+}
+
+_WORD = re.compile(r"[\w-]+")
+_SPACES = re.compile(r"\s+")
+_END = object()
+
+
+def _tokens(phrase: str) -> tuple:
+    return tuple(_WORD.findall(phrase.lower()))
+
+
+def _trie_pattern(node: dict):
+    """
+    Регулярное выражение из префиксного дерева слов: общие начала фраз
+    проверяются один раз, жадный хвост дает самое длинное совпадение.
+    """
+    branches = []
+    for word in sorted(key for key in node if key is not _END):
+        child = node[word]
+        rest = _trie_pattern(child)
+        if rest is None:
+            branches.append(re.escape(word))
+        elif _END in child:
+            branches.append(rf"{re.escape(word)}(?:\s+{rest})?")
+        else:
+            branches.append(rf"{re.escape(word)}\s+{rest}")
+    return f"(?:{'|'.join(branches)})" if branches else None
+
+
+class HallucinationFilter:
+    """
+    Фильтр стоп-фраз, собранный один раз.
+
+    Для текста все фразы объединяются в одно регулярное выражение по
+    префиксному дереву, так что текст проходится один раз. Для
+    потока слов с таймстампами фразы хранятся в префиксном дереве по
+    словам: удаляются сами слова, таймстампы остальных не меняются.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = sorted({tokens for tokens in map(_tokens, phrases) if tokens})
+        self._trie = {}
+        for phrase in self.phrases:
+            node = self._trie
+            for word in phrase:
+                node = node.setdefault(word, {})
+            node[_END] = True
+
+        alternation = _trie_pattern(self._trie)
+        self._pattern = alternation and re.compile(
+            rf"(?<![\w-]){alternation}(?![\w-])", re.IGNORECASE
+        )
+
+    def filter_text(self, text: str) -> str:
+        """Удаляет стоп-фразы из текста и схлопывает пробелы."""
+        if self._pattern is not None:
+            text = self._pattern.sub("", text)
+        return _SPACES.sub(" ", text).strip()
+
+    def _match(self, words: list, start: int) -> int:
+        """Длина самой длинной стоп-фразы, начинающейся со слова start (0 - нет)."""
+        node = self._trie
+        longest = 0
+        for offset in range(start, len(words)):
+            node = node.get(words[offset])
+            if node is None:
+                break
+            if _END in node:
+                longest = offset - start + 1
+        return longest
+
+    def filter_words(self, words: list, key: str = "word") -> list:
+        """
+        Удаляет стоп-фразы из потока слов с таймстампами.
+
+        :param words: Список словарей (Vosk "result", Yandex "words",
+            Salute "word_alignments").
+        :param key: Поле со словом.
+        :return: Новый список без слов, входящих в стоп-фразы.
+        """
+        normalized = [" ".join(_tokens(str(word.get(key, "")))) for word in words]
+        result = []
+        index = 0
+        while index < len(words):
+            length = self._match(normalized, index)
+            if length:
+                index += length
+                continue
+            result.append(words[index])
+            index += 1
+        return result
+
+    def filter_yandex_chunks(self, chunks: list) -> list:
+        """Фильтрует текст и слова в чанках результата Yandex SpeechKit (на месте)."""
+        for chunk in chunks:
+            for alternative in chunk.get("alternatives", []):
+                if "text" in alternative:
+                    alternative["text"] = self.filter_text(alternative["text"])
+                if "words" in alternative:
+                    alternative["words"] = self.filter_words(alternative["words"])
+        return chunks
+
+    def filter_salute_result(self, result: list) -> list:
+        """Фильтрует тексты и выравнивание слов в результате SaluteSpeech (на месте)."""
+        for segment in result:
+            for hypothesis in segment.get("results", []):
+                for field in ("text", "normalized_text"):
+                    if field in hypothesis:
+                        hypothesis[field] = self.filter_text(hypothesis[field])
+                if "word_alignments" in hypothesis:
+                    hypothesis["word_alignments"] = self.filter_words(hypothesis["word_alignments"])
+        return result
+
+
+class HallucinationFilters:
+    """
+    Фильтры по языкам.
+
+    Списки читаются из HALLUCINATIONS_DIR/<язык>.txt (одна фраза на строку,
+    # - комментарий), иначе берется встроенный список. Файл перечитывается,
+    когда меняется время его изменения.
+    """
+
+    def __init__(self, directory: str = HALLUCINATIONS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._filters = {}
+
+    def _path(self, language: str) -> str:
+        return os.path.join(self.directory, f"{language}.txt") if self.directory else ""
+
+    def _mtime(self, language: str):
+        try:
+            return os.stat(self._path(language)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, language: str, mtime) -> HallucinationFilter:
+        if mtime is None:
+            return HallucinationFilter(DEFAULT_STOP_WORDS.get(language, []))
+        with open(self._path(language), encoding="utf-8") as file:
+            phrases = [
+                line.strip() for line in file
+                if line.strip() and not line.lstrip().startswith("#")
+            ]
+        logging.info(f"Загружено {len(phrases)} стоп-фраз для языка {language}")
+        return HallucinationFilter(phrases)
+
+    def get(self, language: str = "ru") -> HallucinationFilter:
+        mtime = self._mtime(language)
+        cached = self._filters.get(language)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with self._lock:
+            cached = self._filters.get(language)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, self._load(language, mtime))
+                self._filters[language] = cached
+            return cached[1]
+
+    def reload(self):
+        """Сбрасывает собранные фильтры, при следующем обращении они соберутся заново."""
+        with self._lock:
+            self._filters.clear()
+
+
+hallucination_filters = HallucinationFilters()
@@ -0,0 +1,79 @@
+import os
+import logging
+
+import aiofiles
+import httpx
+
+from config import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_WRITE_TIMEOUT,
+    HTTP_POOL_TIMEOUT,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_UPLOAD_CHUNK_SIZE,
+)
+
+# Настройки клиентов по провайдерам. Сертификаты Sber не проходят
+# стандартную проверку, поэтому для них verify отключен (как и раньше).
+PROVIDERS = {
+    "salute_oauth": {"verify": False},
+    "salute": {"verify": False},
+    "yandex": {"verify": True},
+    "webhook": {"verify": True},
+}
+
+_clients = {}
+
+
+def get_client(provider: str) -> httpx.AsyncClient:
+    """
+    Возвращает общий асинхронный HTTP-клиент провайдера.
+
+    Клиент держит пул keep-alive соединений к хостам провайдера и
+    переиспользуется всеми запросами процесса.
+    """
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            verify=PROVIDERS[provider]["verify"],
+            timeout=httpx.Timeout(
+                connect=HTTP_CONNECT_TIMEOUT,
+                read=HTTP_READ_TIMEOUT,
+                write=HTTP_WRITE_TIMEOUT,
+                pool=HTTP_POOL_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _clients[provider] = client
+    return client
+
+
+async def close_clients():
+    """Закрывает все HTTP-клиенты (при остановке приложения)."""
+    for provider, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logging.error(f"Ошибка при закрытии HTTP-клиента {provider}: {e}")
+    _clients.clear()
+
+
+async def stream_file(file_path: str, chunk_size: int = HTTP_UPLOAD_CHUNK_SIZE):
+    """Читает файл по частям для потоковой загрузки без чтения целиком в память."""
+    async with aiofiles.open(file_path, "rb") as f:
+        while True:
+            chunk = await f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def file_upload_headers(file_path: str) -> dict:
+    """Заголовки для потоковой загрузки файла с известной длиной."""
+    return {"Content-Length": str(os.path.getsize(file_path))}
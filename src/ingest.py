@@ -0,0 +1,230 @@
+import asyncio
+import logging
+
+import aiofiles
+import numpy as np
+import torch
+
+from silero_vad import load_silero_vad, VADIterator
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from config import INGEST_MAX_STREAMS, INGEST_MIN_SPEECH_MS
+
+VAD_SAMPLE_RATE = 16000
+VAD_WINDOW = 512  # размер окна VADIterator для 16 кГц
+
+
+class _VadModelPool:
+    """Модели Silero хранят состояние, поэтому у каждого потока своя копия."""
+
+    def __init__(self, size: int):
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def acquire(self):
+        await self._semaphore.acquire()
+        if self._idle:
+            return self._idle.pop()
+        return await asyncio.to_thread(load_silero_vad)
+
+    def release(self, model):
+        self._idle.append(model)
+        self._semaphore.release()
+
+
+_models = None
+
+
+def _model_pool():
+    global _models
+    if _models is None:
+        _models = _VadModelPool(INGEST_MAX_STREAMS)
+    return _models
+
+
+class StreamingVadIngest:
+    """
+    Прием загрузки с одновременным VAD.
+
+    Байты загрузки пишутся на диск и параллельно подаются в ffmpeg, который
+    декодирует их в моно 16 кГц. Кадры сразу уходят в потоковый VADIterator,
+    так что к приходу последнего байта участки речи уже известны.
+    Память на запрос не зависит от размера файла.
+    """
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.regions = None
+        self._process = None
+        self._file = None
+        self._reader = None
+        self._model = None
+        self._iterator = None
+        self._pending = b""
+        self._samples = 0
+        self._speech_start = None
+        self._regions = []
+        self._decoder_failed = False
+
+    async def __aenter__(self):
+        self._file = await aiofiles.open(self.output_path, "wb")
+        self._model = await _model_pool().acquire()
+        self._iterator = VADIterator(self._model, sampling_rate=VAD_SAMPLE_RATE)
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-i", "pipe:0",
+                "-f", "s16le", "-ac", "1", "-ar", str(VAD_SAMPLE_RATE),
+                "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except OSError as e:
+            logging.error(f"Не удалось запустить ffmpeg для потокового VAD: {e}")
+            self._decoder_failed = True
+        else:
+            self._reader = asyncio.get_running_loop().create_task(self._read_decoded())
+        return self
+
+    async def feed(self, chunk: bytes):
+        """Принимает очередную порцию загружаемого файла."""
+        await self._file.write(chunk)
+        if self._decoder_failed:
+            return
+        try:
+            self._process.stdin.write(chunk)
+            await self._process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # Формат не декодируется из потока - VAD выполнится после загрузки
+            self._decoder_failed = True
+
+    async def _read_decoded(self):
+        while True:
+            data = await self._process.stdout.read(64 * 1024)
+            if not data:
+                break
+            work = asyncio.ensure_future(asyncio.to_thread(self._process_pcm, data))
+            try:
+                await asyncio.shield(work)
+            except asyncio.CancelledError:
+                # Поток все равно дойдет до конца порции: ждем его, прежде чем
+                # модель будет сброшена и возвращена в пул
+                await work
+                raise
+
+    def _process_pcm(self, data: bytes):
+        data = self._pending + data
+        usable = len(data) - len(data) % (VAD_WINDOW * 2)
+        self._pending = data[usable:]
+        if not usable:
+            return
+        frames = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        for offset in range(0, len(frames), VAD_WINDOW):
+            event = self._iterator(torch.from_numpy(frames[offset:offset + VAD_WINDOW]))
+            if not event:
+                continue
+            if "start" in event:
+                self._speech_start = event["start"]
+            elif "end" in event and self._speech_start is not None:
+                self._add_region(self._speech_start, event["end"])
+                self._speech_start = None
+        self._samples += len(frames)
+
+    def _add_region(self, start, end):
+        if (end - start) * 1000 < INGEST_MIN_SPEECH_MS * VAD_SAMPLE_RATE:
+            return
+        self._regions.append((start / VAD_SAMPLE_RATE, end / VAD_SAMPLE_RATE))
+
+    async def _finish(self):
+        if self._decoder_failed:
+            if self._process is not None and self._process.returncode is None:
+                self._process.kill()
+            if self._reader is not None:
+                self._reader.cancel()
+                await asyncio.gather(self._reader, return_exceptions=True)
+            return None
+        self._process.stdin.close()
+        await self._reader
+        returncode = await self._process.wait()
+        if returncode != 0:
+            logging.warning("ffmpeg не смог декодировать загрузку потоком")
+            return None
+        if self._speech_start is not None:
+            self._add_region(self._speech_start, self._samples)
+        return self._regions
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.regions = await self._finish()
+            else:
+                self._decoder_failed = True
+                await self._finish()
+        finally:
+            await self._file.close()
+            self._iterator.reset_states()
+            _model_pool().release(self._model)
+        return False
+
+
+async def iter_upload(request, field: str = "audio"):
+    """
+    Отдает байты загружаемого файла по мере их поступления.
+
+    Поддерживает multipart/form-data (поле field) и тело запроса, которое
+    целиком является файлом.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data":
+        async for chunk in request.stream():
+            if chunk:
+                yield chunk
+        return
+
+    pieces = []
+    state = {"header_field": b"", "header_value": b"", "headers": {}, "target": False}
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["target"] = False
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        state["target"] = options.get(b"name") == field.encode()
+
+    def on_part_data(data, start, end):
+        if state["target"]:
+            pieces.append(bytes(data[start:end]))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+    async for chunk in request.stream():
+        parser.write(chunk)
+        while pieces:
+            yield pieces.pop(0)
+    parser.finalize()
+    while pieces:
+        yield pieces.pop(0)
+
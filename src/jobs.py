@@ -0,0 +1,298 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from urllib.parse import urlsplit
+
+from config import JOBS_DB_PATH, JOBS_MAX_CONCURRENCY, WEBHOOK_ALLOWED_HOSTS
+from .engines import ENGINES, run_engine
+from .http_client import get_client
+from .metrics import trace_id_var, pid_alive
+from .workspace import workspaces
+
+
+class WebhookRejected(ValueError):
+    """Адрес webhook не разрешен: не http(s) или ведет во внутреннюю сеть."""
+
+
+def _public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_webhook_url(url: str, allowed_hosts=WEBHOOK_ALLOWED_HOSTS):
+    """
+    Проверяет, что webhook можно отправить на url: схема http или https и
+    хост из allowed_hosts, а без списка - все его адреса публичные (не
+    частные, не loopback, не link-local). Хост проверяется и при отправке:
+    DNS мог измениться после постановки задания.
+
+    :raises WebhookRejected: Адрес не разрешен.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise WebhookRejected(f"Webhook должен быть адресом http(s): {url}")
+    host = parts.hostname.lower()
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise WebhookRejected(f"Хост webhook не разрешен: {host}")
+        return
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, ValueError) as e:
+        raise WebhookRejected(f"Не удалось разрешить хост webhook {host}: {e}")
+    addresses = {info[4][0] for info in infos}
+    internal = sorted(address for address in addresses if not _public_address(address))
+    if internal:
+        raise WebhookRejected(f"Webhook ведет во внутреннюю сеть: {host} -> {', '.join(internal)}")
+
+
+class JobStore:
+    """
+    Хранилище заданий в SQLite, переживающее перезапуск процесса.
+
+    Файл базы общий для всех воркеров; owner - pid процесса, который
+    выполняет задание.
+    """
+
+    def __init__(self, db_path: str = JOBS_DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        # Соединение одно на процесс, операции из разных потоков сериализуются
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    engine TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    input_path TEXT NOT NULL,
+                    webhook_url TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner INTEGER
+                )
+                """
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def create(self, engine: str, input_path: str, webhook_url: str = None) -> dict:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO jobs (id, engine, status, input_path, webhook_url, created_at, updated_at, owner) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, engine, input_path, webhook_url, now, now, os.getpid()),
+            )
+            conn.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row)
+
+    def update(self, job_id: str, status: str, result=None, error: str = None):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+            conn.commit()
+
+    def claim(self, job_id: str, owner) -> bool:
+        """
+        Забирает незавершенное задание у владельца owner (None - без владельца)
+        себе. Если другой процесс успел забрать его раньше, возвращает False.
+        """
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "UPDATE jobs SET owner = ?, updated_at = ? "
+                "WHERE id = ? AND status IN ('queued', 'running') AND owner IS ?",
+                (os.getpid(), time.time(), job_id, owner),
+            )
+            conn.commit()
+        return cursor.rowcount == 1
+
+    def unfinished(self) -> list:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class JobManager:
+    """
+    Выполняет задания в фоне и сохраняет их состояние в JobStore.
+
+    При старте незавершенные задания, чей входной файл сохранился,
+    ставятся в очередь заново. Воркеры делят одну базу, поэтому задание
+    возобновляет только процесс, атомарно забравший его у завершившегося
+    владельца; задания живых соседей не трогаются.
+    """
+
+    def __init__(self, store: JobStore, max_concurrency: int = JOBS_MAX_CONCURRENCY):
+        self.store = store
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._tasks = {}
+        # Резервы квоты рабочих каталогов под входные файлы заданий
+        self._reservations = {}
+
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        for job in await asyncio.to_thread(self.store.unfinished):
+            owner = job["owner"]
+            # Свой pid в базе остался от прежнего процесса: новый еще ничего не запускал
+            if owner is not None and owner != os.getpid() and pid_alive(owner):
+                continue
+            if not await asyncio.to_thread(self.store.claim, job["id"], owner):
+                continue
+            if os.path.exists(job["input_path"]):
+                logging.info(f"Возобновление задания {job['id']}")
+                # Вход уже на диске: место учитывается в квоте без ожидания
+                self._reservations[job["id"]] = await workspaces.reserve(
+                    os.path.dirname(job["input_path"]),
+                    os.path.getsize(job["input_path"]),
+                    wait=False,
+                )
+                self._launch(job)
+            else:
+                await asyncio.to_thread(
+                    self.store.update, job["id"], "failed",
+                    error="Входной файл не сохранился после перезапуска",
+                )
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.store.close()
+
+    async def submit(self, engine: str, input_path: str, webhook_url: str = None,
+                     reservation=None) -> dict:
+        """
+        :param reservation: Резерв квоты под входной файл (workspaces.reserve);
+            освобождается, когда вход задания удален.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Неизвестный движок: {engine}")
+        job = await asyncio.to_thread(self.store.create, engine, input_path, webhook_url)
+        if reservation is not None:
+            self._reservations[job["id"]] = reservation
+        self._launch(job)
+        return job
+
+    async def get(self, job_id: str):
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def _launch(self, job):
+        task = asyncio.get_running_loop().create_task(self._execute(job))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["id"], None))
+
+    async def _execute(self, job):
+        # Записи журнала фонового задания помечаются его идентификатором
+        trace_id_var.set(job["id"])
+        try:
+            async with self._semaphore:
+                await asyncio.to_thread(self.store.update, job["id"], "running")
+                try:
+                    # При перезапуске вход задания цел, и оно будет возобновлено
+                    result = await run_engine(job["engine"], job["input_path"])
+                except asyncio.CancelledError:
+                    # Остановка процесса: задание останется "running" и будет возобновлено
+                    raise
+                except Exception as e:
+                    logging.error(f"Ошибка при выполнении задания {job['id']}: {e}")
+                    await asyncio.to_thread(self.store.update, job["id"], "failed", error=str(e))
+                else:
+                    await asyncio.to_thread(self.store.update, job["id"], "done", result=result)
+                # Вход нужен только для возобновления незавершенного задания
+                await asyncio.to_thread(_discard, job["input_path"])
+        finally:
+            reservation = self._reservations.pop(job["id"], None)
+            if reservation is not None:
+                await workspaces.release(reservation)
+
+        if job.get("webhook_url"):
+            await self._notify(job["id"], job["webhook_url"])
+
+    async def _notify(self, job_id: str, webhook_url: str):
+        try:
+            await check_webhook_url(webhook_url)
+        except WebhookRejected as e:
+            logging.error(f"Webhook задания {job_id} не отправлен: {e}")
+            return
+        job = await self.get(job_id)
+        payload = {
+            "job_id": job_id,
+            "status": job["status"],
+            "result": job["result"],
+            "error": job["error"],
+        }
+        try:
+            response = await get_client("webhook").post(webhook_url, json=payload)
+            response.raise_for_status()
+        except Exception as e:
+            logging.error(f"Ошибка при отправке webhook задания {job_id}: {e}")
+
+
+job_manager = JobManager(JobStore())
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from config import (
+    LIVE_VOSK_MODELS,
+    LIVE_WARMUP,
+    LIVE_MAX_STREAMS,
+    LIVE_IDLE_TIMEOUT,
+    LIVE_MAX_SECONDS,
+    LIVE_MAX_FRAME_BYTES,
+)
+from .vosk import vosk_registry
+
+LIVE_FORMATS = ("pcm", "opus")
+LIVE_SAMPLE_RATES = (8000, 16000, 32000, 44100, 48000)
+
+# Коды закрытия WebSocket (RFC 6455)
+CLOSE_NORMAL = 1000
+CLOSE_POLICY = 1008
+CLOSE_TOO_BIG = 1009
+CLOSE_ERROR = 1011
+CLOSE_TRY_LATER = 1013
+
+
+class LiveLimitExceeded(Exception):
+    """Сессия превысила лимит, соединение закрывается с кодом code."""
+
+    def __init__(self, code: int, reason: str):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+class LiveVoskSession:
+    """
+    Потоковое распознавание одной WebSocket-сессии.
+
+    Клиент присылает бинарные кадры: PCM s16le моно с частотой sample_rate
+    или поток Ogg/WebM Opus (декодируется ffmpeg). Кадры сразу подаются в
+    KaldiRecognizer из пула "live", клиенту уходят сообщения:
+
+    - {"type": "partial", "text": ...} - промежуточная гипотеза (только при изменении);
+    - {"type": "result", "text": ..., "words": [...]} - законченная фраза;
+    - {"type": "final", "text": ..., "words": [...]} - остаток после {"eof": 1}.
+
+    Таймстампы слов считаются от начала сессии.
+    """
+
+    def __init__(self, websocket: WebSocket, model_path: str,
+                 sample_rate: int = 16000, audio_format: str = "pcm"):
+        self.websocket = websocket
+        self.model_path = model_path
+        self.sample_rate = sample_rate
+        self.audio_format = audio_format
+        self._max_bytes = int(LIVE_MAX_SECONDS * sample_rate) * 2
+        self._recognizer_cm = None
+        self._rec = None
+        self._decoder = None
+        self._reader = None
+        self._lock = asyncio.Lock()
+        self._pending = b""
+        self._bytes = 0
+        self._last_partial = ""
+
+    async def _open(self):
+        self._recognizer_cm = vosk_registry.recognizer(
+            self.model_path, self.sample_rate,
+            pool="live", pool_size=LIVE_MAX_STREAMS,
+        )
+        self._rec = await asyncio.to_thread(self._recognizer_cm.__enter__)
+        if self.audio_format == "opus":
+            self._decoder = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-i", "pipe:0",
+                "-f", "s16le", "-ac", "1", "-ar", str(self.sample_rate),
+                "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            self._reader = asyncio.get_running_loop().create_task(self._read_decoded())
+
+    def _accept(self, pcm: bytes):
+        if self._rec.AcceptWaveform(pcm):
+            return "result", json.loads(self._rec.Result())
+        return "partial", json.loads(self._rec.PartialResult())
+
+    async def _feed(self, pcm: bytes):
+        pcm = self._pending + pcm
+        usable = len(pcm) - len(pcm) % 2
+        self._pending = pcm[usable:]
+        if not usable:
+            return
+        self._bytes += usable
+        if self._bytes > self._max_bytes:
+            raise LiveLimitExceeded(CLOSE_POLICY, "Превышена длительность сессии")
+        # Распознаватель не потокобезопасен: кадры обрабатываются по одному
+        async with self._lock:
+            kind, result = await asyncio.to_thread(self._accept, pcm[:usable])
+        await self._send(kind, result)
+
+    async def _send(self, kind: str, result: dict):
+        if kind == "partial":
+            text = result.get("partial", "")
+            if text == self._last_partial:
+                return
+            self._last_partial = text
+            await self.websocket.send_json({"type": "partial", "text": text})
+            return
+        self._last_partial = ""
+        await self.websocket.send_json({
+            "type": kind,
+            "text": result.get("text", ""),
+            "words": result.get("result", []),
+        })
+
+    async def _read_decoded(self):
+        while True:
+            data = await self._decoder.stdout.read(8000)
+            if not data:
+                break
+            await self._feed(data)
+
+    def _check_reader(self):
+        if self._reader is not None and self._reader.done() and not self._reader.cancelled():
+            error = self._reader.exception()
+            if error is not None:
+                raise error
+
+    async def _write(self, data: bytes):
+        if len(data) > LIVE_MAX_FRAME_BYTES:
+            raise LiveLimitExceeded(CLOSE_TOO_BIG, "Слишком большой кадр")
+        if self._decoder is None:
+            await self._feed(data)
+            return
+        try:
+            self._decoder.stdin.write(data)
+            await self._decoder.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            raise LiveLimitExceeded(CLOSE_POLICY, "Поток Opus не декодируется")
+
+    async def _finish(self):
+        if self._decoder is not None:
+            self._decoder.stdin.close()
+            await self._reader
+        async with self._lock:
+            result = json.loads(await asyncio.to_thread(self._rec.FinalResult))
+        await self._send("final", result)
+
+    async def run(self):
+        """Обслуживает сессию до eof, отключения клиента или таймаута."""
+        error = None
+        try:
+            await self._open()
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        self.websocket.receive(), LIVE_IDLE_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    _stats["idle_timeouts"] += 1
+                    await _close(self.websocket, CLOSE_NORMAL, "idle timeout")
+                    return
+                if message["type"] == "websocket.disconnect":
+                    return
+                self._check_reader()
+                if message.get("bytes") is not None:
+                    await self._write(message["bytes"])
+                elif message.get("text") is not None and _is_eof(message["text"]):
+                    await self._finish()
+                    await _close(self.websocket)
+                    return
+        except LiveLimitExceeded as e:
+            _stats["limited"] += 1
+            await _close(self.websocket, e.code, e.reason)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if self._decoder is not None and self._decoder.returncode is None:
+                self._decoder.kill()
+            if self._reader is not None:
+                self._reader.cancel()
+            if error is None and self._lock.locked():
+                # Кадр еще распознается в потоке, сбрасывать распознаватель нельзя
+                error = RuntimeError("Сессия прервана во время распознавания")
+            # При ошибке распознаватель не возвращается в пул
+            if self._rec is not None and error is None:
+                self._recognizer_cm.__exit__(None, None, None)
+            elif self._rec is not None:
+                self._recognizer_cm.__exit__(type(error), error, error.__traceback__)
+
+
+async def _close(websocket: WebSocket, code: int = CLOSE_NORMAL, reason: str = ""):
+    """Закрывает соединение, если оно еще открыто с обеих сторон."""
+    if (websocket.application_state == WebSocketState.DISCONNECTED
+            or websocket.client_state == WebSocketState.DISCONNECTED):
+        return
+    try:
+        await websocket.close(code=code, reason=reason)
+    except RuntimeError:
+        pass
+
+
+def _is_eof(text: str) -> bool:
+    if text.strip().lower() == "eof":
+        return True
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and bool(data.get("eof"))
+
+
+_streams = None
+_stats = {"active": 0, "accepted": 0, "rejected": 0, "idle_timeouts": 0, "limited": 0}
+
+
+def _stream_slots():
+    global _streams
+    if _streams is None:
+        _streams = asyncio.Semaphore(LIVE_MAX_STREAMS)
+    return _streams
+
+
+async def serve_live_vosk(websocket: WebSocket, model_path: str,
+                          sample_rate: int = 16000, audio_format: str = "pcm"):
+    """Принимает WebSocket, проверяет параметры и лимит сессий и запускает распознавание."""
+    await websocket.accept()
+    if model_path not in LIVE_VOSK_MODELS:
+        await websocket.close(code=CLOSE_POLICY, reason=f"Неизвестная модель: {model_path}")
+        return
+    if audio_format not in LIVE_FORMATS or sample_rate not in LIVE_SAMPLE_RATES:
+        await websocket.close(code=CLOSE_POLICY, reason="Неподдерживаемый формат аудио")
+        return
+
+    slots = _stream_slots()
+    if slots.locked():
+        _stats["rejected"] += 1
+        await websocket.close(code=CLOSE_TRY_LATER, reason="Слишком много потоков")
+        return
+
+    async with slots:
+        _stats["active"] += 1
+        _stats["accepted"] += 1
+        try:
+            await LiveVoskSession(websocket, model_path, sample_rate, audio_format).run()
+        except Exception as e:
+            logging.error(f"Ошибка потокового распознавания Vosk: {e}")
+            await _close(websocket, CLOSE_ERROR)
+        finally:
+            _stats["active"] -= 1
+
+
+def preload_live():
+    """Загружает модели потокового распознавания в текущий процесс."""
+    if LIVE_WARMUP:
+        vosk_registry.warmup(LIVE_VOSK_MODELS)
+
+
+def live_stats() -> dict:
+    return {**_stats, "max_streams": LIVE_MAX_STREAMS}
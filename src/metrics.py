@@ -0,0 +1,348 @@
+import bisect
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+
+# Границы гистограмм длительностей, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+trace_id_var = contextvars.ContextVar("trace_id", default="-")
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class TraceIdFilter(logging.Filter):
+    """Добавляет trace_id текущего запроса в записи журнала (%(trace_id)s)."""
+
+    def filter(self, record):
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> list:
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, key, value) -> list:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _labels(self.label_names, key, [("le", _number(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _labels(self.label_names, key, [("le", "+Inf")])
+        lines.append(f"{self.name}_bucket{labels} {count}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса в текстовом формате Prometheus.
+
+    Коллекторы вызываются перед каждой выгрузкой и обновляют метрики,
+    которые дешевле снять по запросу, чем считать постоянно (очереди
+    пулов, занятый диск).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logging.warning(f"Коллектор метрик {collector.__name__} завершился ошибкой: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "transcribe_http_request_duration_seconds", "Длительность обработки HTTP-запроса",
+    ("method", "route", "status"),
+)
+STAGE_SECONDS = metrics.histogram(
+    "transcribe_stage_duration_seconds", "Длительность этапа конвейера", ("stage",),
+)
+STAGE_ERRORS = metrics.counter(
+    "transcribe_stage_errors_total", "Ошибки этапов конвейера", ("stage",),
+)
+PROVIDER_JOB_SECONDS = metrics.histogram(
+    "transcribe_provider_job_duration_seconds", "Время от отправки задачи провайдеру до результата",
+    ("provider", "outcome"),
+)
+PROVIDER_POLLS = metrics.histogram(
+    "transcribe_provider_polls_per_job", "Число опросов статуса на одну задачу провайдера",
+    ("provider",), buckets=COUNT_BUCKETS,
+)
+UPLOAD_BYTES = metrics.counter(
+    "transcribe_upload_bytes_total", "Байт отправлено во внешние хранилища", ("target",),
+)
+STORAGE_OPERATIONS = metrics.counter(
+    "transcribe_storage_operations_total", "Операции с объектным хранилищем", ("operation",),
+)
+TEMP_DISK_BYTES = metrics.gauge(
+    "transcribe_temp_disk_bytes", "Занято временными файлами", ("directory",),
+)
+EXECUTOR_QUEUE_DEPTH = metrics.gauge(
+    "transcribe_executor_queue_depth", "Задач в очереди пула процессов", ("pool",),
+)
+EXECUTOR_ACTIVE = metrics.gauge(
+    "transcribe_executor_active", "Задач в работе в пуле процессов", ("pool",),
+)
+EXECUTOR_REJECTED = metrics.counter(
+    "transcribe_executor_rejected_total", "Задачи, отклоненные переполненным пулом", ("pool",),
+)
+EXECUTOR_TASK_SECONDS = metrics.histogram(
+    "transcribe_executor_task_duration_seconds", "Длительность задачи в пуле, включая ожидание",
+    ("pool",),
+)
+WORKSPACE_ACTIVE = metrics.gauge(
+    "transcribe_workspace_active", "Открытые рабочие каталоги запросов",
+)
+WORKSPACE_RESERVED_BYTES = metrics.gauge(
+    "transcribe_workspace_reserved_bytes", "Зарезервировано квоты рабочих каталогов",
+)
+WORKSPACE_REJECTED = metrics.counter(
+    "transcribe_workspace_rejected_total", "Запросы, не допущенные из-за квоты временных файлов",
+)
+MODEL_LOADS = metrics.counter(
+    "transcribe_model_loads_total", "Загрузки моделей", ("engine", "model"),
+)
+MODEL_LOAD_SECONDS = metrics.histogram(
+    "transcribe_model_load_duration_seconds", "Длительность загрузки модели", ("engine", "model"),
+)
+
+PROVIDER_REQUESTS = metrics.counter(
+    "transcribe_provider_requests_total", "Попытки запросов к провайдерам по результату",
+    ("provider", "outcome"),
+)
+PROVIDER_RETRIES = metrics.counter(
+    "transcribe_provider_retries_total", "Повторы запросов к провайдерам после временных ошибок",
+    ("provider",),
+)
+PROVIDER_THROTTLE_SECONDS = metrics.histogram(
+    "transcribe_provider_throttle_seconds", "Ожидание токена лимита запросов к провайдеру",
+    ("provider",),
+)
+PROVIDER_BREAKER_STATE = metrics.gauge(
+    "transcribe_provider_breaker_state", "Состояние выключателя: 0 - замкнут, 1 - полуоткрыт, 2 - разомкнут",
+    ("provider",),
+)
+PROVIDER_BREAKER_REJECTED = metrics.counter(
+    "transcribe_provider_breaker_rejected_total", "Запросы, отклоненные разомкнутым выключателем",
+    ("provider",),
+)
+ROUTING_ATTEMPTS = metrics.counter(
+    "transcribe_routing_attempts_total", "Попытки распознавания при маршрутизации между движками",
+    ("engine", "status"),
+)
+ROUTING_HEDGES = metrics.counter(
+    "transcribe_routing_hedges_total", "Дополнительные движки, запущенные из-за медленного первого",
+    ("engine",),
+)
+ROUTING_LATENCY_P95 = metrics.gauge(
+    "transcribe_routing_seconds_per_audio_second_p95", "p95 времени распознавания на секунду аудио",
+    ("engine",),
+)
+
+@contextmanager
+def stage(name: str):
+    """Замер этапа конвейера: длительность и ошибки."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+# В процессах пулов события уходят в основной процесс через очередь
+_worker_events = None
+
+
+def init_worker_events(events):
+    global _worker_events
+    _worker_events = events
+
+
+def record_model_load(engine: str, model: str, seconds: float):
+    if _worker_events is not None:
+        _worker_events.put(("model_load", engine, model, seconds))
+        return
+    MODEL_LOADS.inc(engine=engine, model=model)
+    MODEL_LOAD_SECONDS.observe(seconds, engine=engine, model=model)
+
+
+# Последние снимки статистики процессов пулов: источник -> pid -> снимок
+_worker_stats = {}
+_worker_stats_lock = threading.Lock()
+
+
+def record_worker_stats(source: str, stats: dict, pid: int = None):
+    """
+    Сохраняет снимок статистики процесса. В процессе пула снимок уходит
+    в основной процесс через очередь событий.
+    """
+    if _worker_events is not None:
+        _worker_events.put(("worker_stats", source, stats, os.getpid()))
+        return
+    with _worker_stats_lock:
+        _worker_stats.setdefault(source, {})[pid or os.getpid()] = stats
+
+
+def worker_stats(source: str) -> dict:
+    """Снимки статистики живых процессов по источнику: pid -> снимок."""
+    with _worker_stats_lock:
+        snapshots = _worker_stats.get(source, {})
+        for pid in [pid for pid in snapshots if not pid_alive(pid)]:
+            del snapshots[pid]
+        return dict(snapshots)
+
+
+def drain_worker_events(events):
+    """Переносит события из процессов пула в метрики основного процесса."""
+    while True:
+        try:
+            kind, *payload = events.get_nowait()
+        except (queue.Empty, OSError, ValueError):
+            return
+        if kind == "model_load":
+            record_model_load(*payload)
+        elif kind == "worker_stats":
+            record_worker_stats(*payload)
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        total += directory_size(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    except OSError:
+        return 0
+    return total
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from config import (
+    POLL_MIN_INTERVAL,
+    POLL_MAX_INTERVAL,
+    POLL_BACKOFF,
+    POLL_DEADLINE,
+    POLL_MAX_CONCURRENCY,
+    POLL_INITIAL_TURNAROUND,
+)
+from .metrics import PROVIDER_JOB_SECONDS, PROVIDER_POLLS, trace_id_var
+
+
+class PollTimeout(Exception):
+    """Операция не завершилась до истечения общего срока ожидания."""
+
+
+class _Job:
+    def __init__(self, provider, job_id, check, duration, deadline, interval):
+        self.provider = provider
+        self.job_id = job_id
+        self.check = check
+        self.duration = duration
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline
+        self.interval = interval
+        self.polls = 0
+        self.trace_id = trace_id_var.get()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class OperationPoller:
+    """
+    Общий планировщик опроса долгих операций провайдеров.
+
+    Все ожидающие операции хранятся в одной очереди по времени следующего
+    опроса. Первый опрос назначается по длительности аудио и наблюдаемой
+    скорости провайдера (до первых завершений - по initial_turnaround),
+    затем интервал растет экспоненциально. Запрос,
+    ожидающий результат, просыпается сразу после его получения.
+    """
+
+    def __init__(self, min_interval: float = POLL_MIN_INTERVAL,
+                 max_interval: float = POLL_MAX_INTERVAL,
+                 backoff: float = POLL_BACKOFF,
+                 max_concurrency: int = POLL_MAX_CONCURRENCY,
+                 initial_turnaround: float = POLL_INITIAL_TURNAROUND):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.initial_turnaround = initial_turnaround
+        self._queue = []
+        self._counter = itertools.count()
+        self._jobs = set()
+        self._wakeup = None
+        self._semaphore = None
+        self._task = None
+        self._poll_tasks = set()
+        # Скользящее среднее отношения "время обработки / длительность аудио"
+        self._speed = {}
+        self._completed = 0
+        self._polls = 0
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _expected_turnaround(self, provider, duration):
+        if not duration:
+            return None
+        speed = self._speed.get(provider, self.initial_turnaround)
+        if not speed:
+            return None
+        return speed * duration
+
+    def _schedule(self, job, delay):
+        heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), job))
+        self._wakeup.set()
+
+    async def wait(self, provider: str, job_id: str, check, duration: float = None,
+                   deadline: float = POLL_DEADLINE):
+        """
+        Ожидает завершения операции провайдера.
+
+        :param provider: Имя провайдера ("yandex", "salute").
+        :param job_id: Идентификатор операции или задачи.
+        :param check: Корутина без аргументов, возвращающая (done, result).
+        :param duration: Длительность аудио в секундах, если известна.
+        :param deadline: Общий срок ожидания в секундах.
+        :return: result из check, вернувшей done=True.
+        """
+        self._ensure_running()
+        expected = self._expected_turnaround(provider, duration)
+        if expected is None:
+            first_delay = self.min_interval
+            interval = self.min_interval
+        else:
+            # Первые опросы - чуть раньше ожидаемого завершения, далее частые
+            first_delay = max(self.min_interval, expected * 0.8)
+            interval = max(self.min_interval, expected * 0.1)
+
+        job = _Job(provider, job_id, check, duration, deadline, interval)
+        self._jobs.add(job)
+        self._schedule(job, first_delay)
+        try:
+            return await job.future
+        finally:
+            self._jobs.discard(job)
+            if not job.future.done():
+                job.future.cancel()
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            due, _, job = self._queue[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                # Ждем срока или появления более ранней операции
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._queue)
+            if job.future.done():
+                continue
+            task = asyncio.get_running_loop().create_task(self._poll(job))
+            self._poll_tasks.add(task)
+            task.add_done_callback(self._poll_tasks.discard)
+
+    async def _poll(self, job):
+        # Опрос идет в общей задаче планировщика, журнал помечается запросом операции
+        trace_id_var.set(job.trace_id)
+        async with self._semaphore:
+            if job.future.done():
+                return
+            job.polls += 1
+            self._polls += 1
+            try:
+                done, result = await job.check()
+            except Exception as e:
+                if not job.future.done():
+                    self._observe(job, time.monotonic() - job.started, "error")
+                    job.future.set_exception(e)
+                return
+
+        if job.future.done():
+            return
+        now = time.monotonic()
+        if done:
+            self._record(job, now - job.started)
+            self._observe(job, now - job.started, "done")
+            job.future.set_result(result)
+        elif now >= job.deadline:
+            logging.error(
+                f"Операция {job.provider} {job.job_id} не завершилась за отведенное время"
+            )
+            self._observe(job, now - job.started, "timeout")
+            job.future.set_exception(
+                PollTimeout(f"Операция {job.job_id} не завершилась вовремя")
+            )
+        else:
+            delay = min(job.interval, job.deadline - now)
+            job.interval = min(job.interval * self.backoff, self.max_interval)
+            self._schedule(job, delay)
+
+    def _record(self, job, turnaround):
+        self._completed += 1
+        if job.duration:
+            ratio = turnaround / job.duration
+            previous = self._speed.get(job.provider)
+            self._speed[job.provider] = (
+                ratio if previous is None else 0.8 * previous + 0.2 * ratio
+            )
+
+    @staticmethod
+    def _observe(job, turnaround, outcome):
+        PROVIDER_JOB_SECONDS.observe(turnaround, provider=job.provider, outcome=outcome)
+        PROVIDER_POLLS.observe(job.polls, provider=job.provider)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._jobs),
+            "completed": self._completed,
+            "polls": self._polls,
+            "turnaround_per_audio_second": {
+                provider: round(speed, 3) for provider, speed in self._speed.items()
+            },
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+poller = OperationPoller()
@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import math
+import random
+import time
+
+import httpx
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+from config import (
+    PROVIDER_RATE_LIMITS,
+    PROVIDER_RETRY_ATTEMPTS,
+    PROVIDER_RETRY_BASE_DELAY,
+    PROVIDER_RETRY_MAX_DELAY,
+    PROVIDER_BREAKER_FAILURES,
+    PROVIDER_BREAKER_RESET,
+)
+from .metrics import (
+    metrics,
+    PROVIDER_REQUESTS,
+    PROVIDER_RETRIES,
+    PROVIDER_THROTTLE_SECONDS,
+    PROVIDER_BREAKER_STATE,
+    PROVIDER_BREAKER_REJECTED,
+)
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+S3_THROTTLING_CODES = {"SlowDown", "Throttling", "RequestTimeout", "ServiceUnavailable"}
+
+
+class ProviderError(Exception):
+    """Провайдер вернул ошибку вместо результата."""
+
+    def __init__(self, provider: str, message: str):
+        super().__init__(message)
+        self.provider = provider
+
+
+class SyncRecognitionError(ProviderError):
+    """Синхронное распознавание не удалось, запись можно распознать асинхронно."""
+
+
+class ProviderUnavailable(ProviderError):
+    """Выключатель провайдера разомкнут, запрос нужно повторить позже."""
+
+    def __init__(self, provider: str, retry_after: int):
+        super().__init__(provider, f"Провайдер {provider} недоступен, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+def is_transient(error: Exception) -> bool:
+    """Временная ошибка: сеть, таймаут, ограничение частоты или 5xx."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUSES
+    if isinstance(error, (httpx.TransportError, BotoConnectionError, HTTPClientError, S3UploadFailedError)):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        code = error.response.get("Error", {}).get("Code")
+        return status in RETRYABLE_STATUSES or code in S3_THROTTLING_CODES
+    return False
+
+
+def is_rejected_before_processing(error: Exception) -> bool:
+    """
+    Запрос точно не выполнен провайдером: соединение не установлено или
+    ответ 429. Только такие ошибки можно повторять для неидемпотентных
+    запросов - при таймауте чтения или 5xx операция могла быть создана.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def _retry_after(error: Exception):
+    """Задержка из заголовка Retry-After ответа (секунды), если он есть."""
+    if isinstance(error, httpx.HTTPStatusError):
+        try:
+            return float(error.response.headers.get("Retry-After", ""))
+        except ValueError:
+            return None
+    return None
+
+
+class TokenBucket:
+    """
+    Лимит запросов: rate токенов в секунду, не больше burst про запас.
+    Ожидающие получают токены в порядке очереди.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Забирает токен и возвращает, сколько секунд пришлось ждать."""
+        if self.rate <= 0:
+            return 0.0
+        async with self._lock:
+            self._refill()
+            waited = 0.0
+            if self._tokens < 1:
+                waited = (1 - self._tokens) / self.rate
+                await asyncio.sleep(waited)
+                self._refill()
+            self._tokens -= 1
+            return waited
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель провайдера.
+
+    После failure_threshold временных ошибок подряд размыкается: запросы
+    отклоняются сразу, не дожидаясь таймаутов. Через reset_timeout секунд
+    пропускает один пробный запрос (полуоткрыт); его успех замыкает
+    выключатель, ошибка - снова размыкает.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, provider: str, failure_threshold: int = PROVIDER_BREAKER_FAILURES,
+                 reset_timeout: float = PROVIDER_BREAKER_RESET):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe = False
+
+    def retry_after(self) -> int:
+        remaining = self._opened_at + self.reset_timeout - time.monotonic()
+        return max(math.ceil(remaining), 1)
+
+    def allow(self):
+        """Пропускает запрос или бросает ProviderUnavailable."""
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe = False
+        if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._probe):
+            self.rejected += 1
+            PROVIDER_BREAKER_REJECTED.inc(provider=self.provider)
+            raise ProviderUnavailable(self.provider, self.retry_after())
+        if self.state == self.HALF_OPEN:
+            self._probe = True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logging.info(f"Провайдер {self.provider} снова отвечает, выключатель замкнут")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.error(
+                    f"Провайдер {self.provider}: {self.failures} ошибок подряд, "
+                    f"запросы отклоняются {self.reset_timeout:.0f} с"
+                )
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe = False
+
+    def release(self):
+        """Пробный запрос отменен, не дав ответа: пропустить следующий."""
+        self._probe = False
+
+
+class ProviderGuard:
+    """
+    Защита вызовов одного провайдера: выключатель, лимит запросов и
+    повторы временных ошибок с экспоненциальной задержкой и разбросом.
+    """
+
+    def __init__(self, provider: str, rate: float, burst: int, attempts: int,
+                 base_delay: float = PROVIDER_RETRY_BASE_DELAY,
+                 max_delay: float = PROVIDER_RETRY_MAX_DELAY):
+        self.provider = provider
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(provider)
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def _delay(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Половина задержки фиксирована, половина случайна: повторы не идут волной
+        delay = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def call(self, attempt, *args, idempotent: bool = True, **kwargs):
+        """
+        Выполняет attempt(*args, **kwargs), повторяя его при временных ошибках.
+
+        :param idempotent: False для запросов, создающих операцию у провайдера:
+            они повторяются, только если точно не дошли до него.
+        :raises ProviderUnavailable: Выключатель разомкнут.
+        """
+        for number in range(1, self.attempts + 1):
+            # Токен берется до выключателя: отмена ожидания не оставляет пробный запрос занятым
+            PROVIDER_THROTTLE_SECONDS.observe(await self.bucket.acquire(), provider=self.provider)
+            self.breaker.allow()
+            try:
+                result = await attempt(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # Провайдер ответил, ошибка в самом запросе
+                    self.breaker.record_success()
+                    PROVIDER_REQUESTS.inc(provider=self.provider, outcome="error")
+                    raise
+                self.breaker.record_failure()
+                PROVIDER_REQUESTS.inc(provider=self.provider, outcome="transient")
+                if number == self.attempts or not (idempotent or is_rejected_before_processing(e)):
+                    raise
+                delay = self._delay(number, e)
+                logging.warning(
+                    f"Временная ошибка {self.provider} (попытка {number} из {self.attempts}), "
+                    f"повтор через {delay:.1f} с: {e}"
+                )
+                self.retries += 1
+                PROVIDER_RETRIES.inc(provider=self.provider)
+                await asyncio.sleep(delay)
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                PROVIDER_REQUESTS.inc(provider=self.provider, outcome="ok")
+                return result
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str,
+                      content_factory=None, idempotent: bool = True, **kwargs) -> httpx.Response:
+        """
+        HTTP-запрос через защиту. Ответы 408, 429 и 5xx повторяются, после
+        последней попытки бросается httpx.HTTPStatusError; остальные ответы
+        возвращаются как есть.
+
+        :param content_factory: Функция, создающая тело запроса заново для каждой попытки.
+        :param idempotent: False для запросов, создающих операцию (см. call).
+        """
+        async def attempt():
+            if content_factory is not None:
+                kwargs["content"] = content_factory()
+            response = await client.request(method, url, **kwargs)
+            if response.status_code in RETRYABLE_STATUSES:
+                response.raise_for_status()
+            return response
+
+        return await self.call(attempt, idempotent=idempotent)
+
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rejected": self.breaker.rejected,
+            "retries": self.retries,
+            "rate_limit": self.bucket.rate,
+            "tokens": round(self.bucket.tokens, 2),
+        }
+
+
+guards = {
+    provider: ProviderGuard(provider, rate, burst, PROVIDER_RETRY_ATTEMPTS[provider])
+    for provider, (rate, burst) in PROVIDER_RATE_LIMITS.items()
+}
+
+
+def guards_stats() -> dict:
+    return {provider: guard.stats() for provider, guard in guards.items()}
+
+
+_BREAKER_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+
+def _collect_metrics():
+    for provider, guard in guards.items():
+        PROVIDER_BREAKER_STATE.set(_BREAKER_STATES[guard.breaker.state], provider=provider)
+
+
+metrics.add_collector(_collect_metrics)
@@ -0,0 +1,242 @@
+import asyncio
+import collections
+import logging
+import time
+
+from config import (
+    ROUTING_ENGINES,
+    ROUTING_MODE,
+    ROUTING_LATENCY_WINDOW,
+    ROUTING_MIN_SAMPLES,
+    ROUTING_HEDGE_DELAY,
+    ROUTING_HEDGE_MIN_DELAY,
+)
+from .engines import ENGINES, run_engine
+from .executors import ExecutorOverloaded
+from .resilience import ProviderUnavailable
+from .metrics import metrics, ROUTING_ATTEMPTS, ROUTING_HEDGES, ROUTING_LATENCY_P95
+from .transcode import probe_audio, TranscodeError
+from .workspace import WorkspaceQuotaExceeded
+
+MODES = ("fallback", "hedged")
+
+
+class RoutingError(Exception):
+    """Ни один движок маршрута не распознал файл."""
+
+    def __init__(self, attempts: list):
+        super().__init__("; ".join(
+            f"{attempt['engine']}: {attempt.get('error', attempt['status'])}" for attempt in attempts
+        ))
+        self.attempts = attempts
+
+
+class LatencyWindow:
+    """
+    Время распознавания на секунду аудио за последние успешные запросы
+    движка: длинная запись не должна считаться медленной только из-за
+    своей длины.
+    """
+
+    def __init__(self, size: int = ROUTING_LATENCY_WINDOW, min_samples: int = ROUTING_MIN_SAMPLES):
+        self._values = collections.deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float, duration: float):
+        self._values.append(seconds / max(duration, 1.0))
+
+    def quantile(self, q: float):
+        """Квантиль или None, пока замеров меньше min_samples."""
+        if len(self._values) < self.min_samples:
+            return None
+        values = sorted(self._values)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+    def __len__(self):
+        return len(self._values)
+
+
+def _overloaded(error: Exception) -> bool:
+    return isinstance(error, (ExecutorOverloaded, WorkspaceQuotaExceeded, ProviderUnavailable))
+
+
+class EngineRouter:
+    """
+    Распознавание одного файла несколькими движками по очереди приоритета.
+
+    fallback: следующий движок запускается, только если предыдущий
+    завершился ошибкой. hedged: если движок не ответил за свой p95
+    (пересчитанный на длительность записи), параллельно запускается
+    следующий; берется первый успешный результат, остальные отменяются.
+    Ошибка движка в обоих режимах сразу передает файл следующему.
+    """
+
+    def __init__(self, hedge_delay: float = ROUTING_HEDGE_DELAY,
+                 min_delay: float = ROUTING_HEDGE_MIN_DELAY):
+        self.hedge_delay_default = hedge_delay
+        self.min_delay = min_delay
+        self._latency = {name: LatencyWindow() for name in ENGINES}
+        self._fallbacks = 0
+        self._hedges = 0
+        self._wins = collections.Counter()
+
+    def hedge_delay(self, engine: str, duration: float = None) -> float:
+        """Сколько ждать движок, прежде чем запускать следующий."""
+        p95 = self._latency[engine].quantile(0.95)
+        if p95 is None or duration is None:
+            return self.hedge_delay_default
+        return max(p95 * max(duration, 1.0), self.min_delay)
+
+    @staticmethod
+    async def _duration(input_path: str):
+        try:
+            return (await probe_audio(input_path))["duration"] or None
+        except (TranscodeError, OSError) as e:
+            logging.warning(f"Не удалось определить длительность {input_path}: {e}")
+            return None
+
+    async def _attempt(self, engine: str, input_path: str, duration, attempts: list) -> dict:
+        record = {"engine": engine}
+        attempts.append(record)
+        started = time.monotonic()
+        try:
+            # Перегрузка не ждет освобождения пула или провайдера: файл уходит следующему движку
+            result = await run_engine(engine, input_path, retry_overload=False)
+        except asyncio.CancelledError:
+            record["status"] = "cancelled"
+            raise
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e)
+            raise
+        else:
+            record["status"] = "done"
+            if duration is not None:
+                self._latency[engine].observe(time.monotonic() - started, duration)
+            return result
+        finally:
+            record["seconds"] = round(time.monotonic() - started, 3)
+            ROUTING_ATTEMPTS.inc(engine=engine, status=record["status"])
+
+    @staticmethod
+    def _failed(errors: list, attempts: list):
+        # Если все движки перегружены, клиент получает 503 с Retry-After
+        if errors and all(_overloaded(error) for error in errors):
+            raise errors[-1]
+        raise RoutingError(attempts)
+
+    async def _fallback(self, engines: list, input_path: str, duration, attempts: list):
+        errors = []
+        for engine in engines:
+            if errors:
+                self._fallbacks += 1
+            try:
+                return engine, await self._attempt(engine, input_path, duration, attempts)
+            except Exception as e:
+                errors.append(e)
+                logging.warning(f"Движок {engine} не распознал {input_path}: {e}")
+        self._failed(errors, attempts)
+
+    async def _hedged(self, engines: list, input_path: str, duration, attempts: list):
+        loop = asyncio.get_running_loop()
+        queue = list(engines)
+        pending = {}
+        errors = []
+
+        def launch() -> float:
+            engine = queue.pop(0)
+            task = asyncio.ensure_future(self._attempt(engine, input_path, duration, attempts))
+            pending[task] = engine
+            return loop.time() + self.hedge_delay(engine, duration)
+
+        try:
+            deadline = launch()
+            while pending:
+                timeout = max(deadline - loop.time(), 0.0) if queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                failed = False
+                for task in done:
+                    engine = pending.pop(task)
+                    if task.exception() is None:
+                        return engine, task.result()
+                    errors.append(task.exception())
+                    failed = True
+                    logging.warning(f"Движок {engine} не распознал {input_path}: {task.exception()}")
+                if not queue:
+                    continue
+                if failed:
+                    self._fallbacks += 1
+                else:
+                    # Ни один запущенный движок не уложился в свой p95
+                    self._hedges += 1
+                    ROUTING_HEDGES.inc(engine=queue[0])
+                    logging.info(f"Движки {list(pending.values())} не ответили вовремя, запускаем {queue[0]}")
+                deadline = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._failed(errors, attempts)
+
+    async def recognize(self, input_path: str, engines: list = None, mode: str = None) -> dict:
+        """
+        Распознает файл по маршруту. Сам input_path не изменяется.
+
+        :param engines: Движки в порядке приоритета; по умолчанию ROUTING_ENGINES.
+        :param mode: fallback или hedged; по умолчанию ROUTING_MODE.
+        :return: Движок-победитель, текст, ответ движка и все попытки.
+        """
+        engines = list(dict.fromkeys(engines or ROUTING_ENGINES))
+        mode = mode or ROUTING_MODE
+        unknown = [engine for engine in engines if engine not in ENGINES]
+        if unknown:
+            raise ValueError(f"Неизвестные движки: {', '.join(unknown)}")
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим маршрутизации: {mode}")
+
+        started = time.monotonic()
+        duration = await self._duration(input_path)
+        attempts = []
+        run = self._hedged if mode == "hedged" else self._fallback
+        engine, result = await run(engines, input_path, duration, attempts)
+        self._wins[engine] += 1
+        return {
+            "engine": engine,
+            "mode": mode,
+            "text": ENGINES[engine].text(result),
+            "result": result,
+            "attempts": attempts,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+    def stats(self) -> dict:
+        def rounded(value):
+            return round(value, 4) if value is not None else None
+
+        return {
+            "engines": {
+                name: {
+                    "samples": len(window),
+                    "p50": rounded(window.quantile(0.5)),
+                    "p95": rounded(window.quantile(0.95)),
+                    "wins": self._wins[name],
+                }
+                for name, window in self._latency.items()
+            },
+            "hedge_delay_default": self.hedge_delay_default,
+            "fallbacks": self._fallbacks,
+            "hedges": self._hedges,
+        }
+
+
+engine_router = EngineRouter()
+
+
+def _collect_metrics():
+    for name, window in engine_router._latency.items():
+        p95 = window.quantile(0.95)
+        if p95 is not None:
+            ROUTING_LATENCY_P95.set(p95, engine=name)
+
+
+metrics.add_collector(_collect_metrics)
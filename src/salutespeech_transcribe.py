@@ -1,21 +1,32 @@
 import asyncio
 import os
+import time
 import uuid
-import requests
 import logging
-import urllib3
 
-from config import SALUTE_CLIENT_ID
-from .utils import convert_to_mono
+import httpx
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from config import SALUTE_CLIENT_ID, SALUTE_TOKEN_REFRESH_MARGIN, SALUTE_OAUTH_URL, SALUTE_API_URL
+from .http_client import get_client, stream_file, file_upload_headers
+from .poller import poller, PollTimeout
+from .metrics import stage, UPLOAD_BYTES
+from .resilience import guards, ProviderError, ProviderUnavailable, SyncRecognitionError
 
+# Кодировки асинхронного API -> Content-Type синхронного
+SYNC_CONTENT_TYPES = {
+    "OPUS": "audio/ogg;codecs=opus",
+    "PCM_S16LE": "audio/x-pcm;bit=16;rate=16000",
+    "MP3": "audio/mpeg",
+}
 
-async def get_access_token():
+
+async def _request_access_token():
     """
-    Получение Access Token для аутентификации в API SaluteSpeech.
+    Запрос нового Access Token в API SaluteSpeech.
+
+    :return: Токен и время окончания его действия (unix time, секунды).
     """
-    url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+    url = SALUTE_OAUTH_URL
     auth_key = f"{SALUTE_CLIENT_ID}"
     headers = {
         "Authorization": f"Basic {auth_key}",
@@ -25,55 +36,137 @@ async def get_access_token():
     data = {
         "scope": "SALUTE_SPEECH_PERS"
     }
-    response = requests.post(url,
-                             headers=headers,
-                             data=data,
-                             verify=False,
-                             )
+    response = await guards["salute_oauth"].request(
+        get_client("salute_oauth"), "POST", url, headers=headers, data=data,
+    )
     if response.status_code == 200:
-        return response.json().get("access_token")
+        data = response.json()
+        # expires_at приходит в миллисекундах
+        expires_at = data.get("expires_at", 0) / 1000 or time.time() + 30 * 60
+        return data.get("access_token"), expires_at
     else:
-        raise Exception(
+        raise ProviderError(
+            "salute",
             f"Ошибка получения токена: {response.status_code} - "
             f"{response.text}")
 
 
+class SaluteTokenManager:
+    """
+    Кэш Access Token SaluteSpeech.
+
+    Токен переиспользуется до момента незадолго до expires_at. При
+    одновременных запросах выполняется только одно обновление, остальные
+    ждут его результата.
+    """
+
+    def __init__(self, refresh_margin: float = SALUTE_TOKEN_REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_task = None
+        self.refreshes = 0
+
+    def _valid(self) -> bool:
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    async def _refresh(self):
+        try:
+            token, expires_at = await _request_access_token()
+        finally:
+            self._refresh_task = None
+        self._token, self._expires_at = token, expires_at
+        self.refreshes += 1
+        return token
+
+    async def get(self) -> str:
+        if self._valid():
+            return self._token
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh())
+        # shield: отмена одного ожидающего не прерывает общее обновление
+        return await asyncio.shield(self._refresh_task)
+
+    async def replace(self, rejected_token: str) -> str:
+        """Возвращает новый токен взамен отклоненного сервером (401)."""
+        if self._token == rejected_token:
+            self._token = None
+        return await self.get()
+
+
+salute_tokens = SaluteTokenManager()
+
+
+async def get_access_token():
+    """
+    Получение Access Token для аутентификации в API SaluteSpeech.
+    """
+    return await salute_tokens.get()
+
+
+async def _salute_request(method, url, access_token, headers=None, content_factory=None,
+                          idempotent=True, **kwargs):
+    """
+    Запрос к API SaluteSpeech через защиту провайдера (лимит, повторы
+    временных ошибок, выключатель) с однократным повтором при 401.
+
+    :param content_factory: Функция, создающая тело запроса заново (для потоковой загрузки).
+    :param idempotent: False для создания задачи: таймаут не повторяется.
+    """
+    for attempt in range(2):
+        request_headers = {"Authorization": f"Bearer {access_token}", **(headers or {})}
+        response = await guards["salute"].request(
+            get_client("salute"), method, url, content_factory=content_factory,
+            idempotent=idempotent, headers=request_headers, **kwargs
+        )
+        if response.status_code == 401 and attempt == 0:
+            logging.info("Токен SaluteSpeech отклонен, запрашиваем новый")
+            access_token = await salute_tokens.replace(access_token)
+            continue
+        return response
+
+
 async def upload_file_to_salute(file_path, client_id):
-    """Загружает файл в SaluteSpeech и возвращает идентификатор файла"""
-    url = "https://smartspeech.sber.ru/rest/v1/data:upload"
-    headers = {
-        "Authorization": f"Bearer {client_id}"
-    }
+    """
+    Загружает файл в SaluteSpeech и возвращает идентификатор файла.
+
+    :raises ProviderError: Загрузка не удалась.
+    """
+    url = f"{SALUTE_API_URL}/data:upload"
     try:
-        mono_file_path = file_path.replace(".mp3", "_mono.mp3")
-        await convert_to_mono(file_path, mono_file_path)
-        with open(mono_file_path, "rb") as audio_file:
-            response = requests.post(url, headers=headers, data=audio_file, verify=False)
+        # Файл уже в формате провайдера, отправляется потоком без чтения в память
+        with stage("salute_upload"):
+            response = await _salute_request(
+                "POST", url, client_id,
+                headers=file_upload_headers(file_path),
+                content_factory=lambda: stream_file(file_path),
+            )
             response.raise_for_status()
-            data = response.json()
-            if "result" in data and "request_file_id" in data["result"]:
-                request_file_id = data["result"]["request_file_id"]
-                return request_file_id
-            else:
-                raise Exception("Не удалось загрузить файл. Нет идентификатора.")
-    except requests.exceptions.RequestException as e:
+        UPLOAD_BYTES.inc(os.path.getsize(file_path), target="salute")
+        data = response.json()
+        if "result" in data and "request_file_id" in data["result"]:
+            request_file_id = data["result"]["request_file_id"]
+            return request_file_id
+        else:
+            raise ProviderError("salute", "Не удалось загрузить файл. Нет идентификатора.")
+    except httpx.HTTPError as e:
         logging.error(f"Ошибка при загрузке файла в SaluteSpeech: {e}")
-        return None
+        raise ProviderError("salute", f"Ошибка при загрузке файла в SaluteSpeech: {e}") from e
     finally:
         os.remove(file_path)
 
 
-async def create_salute_task(request_file_id, client_id):
-    """Создает задачу для распознавания аудио в SaluteSpeech и возвращает идентификатор задачи"""
-    url = "https://smartspeech.sber.ru/rest/v1/speech:async_recognize"
-    headers = {
-        "Authorization": f"Bearer {client_id}",
-        "Content-Type": "application/json"
-    }
+async def create_salute_task(request_file_id, client_id, audio_encoding="MP3"):
+    """
+    Создает задачу для распознавания аудио в SaluteSpeech и возвращает идентификатор задачи.
+
+    :raises ProviderError: Задача не создана.
+    """
+    url = f"{SALUTE_API_URL}/speech:async_recognize"
     body = {
         "options": {
             "language": "ru-RU",
-            "audio_encoding": "MP3",
+            "audio_encoding": audio_encoding,
             # "sample_rate": 16000,
             "hypotheses_count": 1,
             "enable_profanity_filter": False,
@@ -84,52 +177,65 @@ async def create_salute_task(request_file_id, client_id):
         "request_file_id": request_file_id
     }
     try:
-        response = requests.post(url, headers=headers, json=body, verify=False)
+        response = await _salute_request("POST", url, client_id, idempotent=False, json=body)
         response.raise_for_status()
         data = response.json()
         if "result" in data and "id" in data["result"]:
             task_id = data["result"]["id"]
             return task_id
         else:
-            raise Exception("Не удалось создать задачу для распознавания.")
-    except requests.exceptions.RequestException as e:
+            raise ProviderError("salute", "Не удалось создать задачу для распознавания.")
+    except httpx.HTTPError as e:
         logging.error(f"Ошибка при создании задачи для распознавания в SaluteSpeech: {e}")
-        return None
+        raise ProviderError(
+            "salute", f"Ошибка при создании задачи для транскрибации в SaluteSpeech: {e}"
+        ) from e
 
 
-async def get_task_status(task_id, client_id):
-    """Проверяет статус задачи на распознавание аудио в SaluteSpeech"""
-    url = f"https://smartspeech.sber.ru/rest/v1/task:get?id={task_id}"
-    headers = {
-        "Authorization": f"Bearer {client_id}"
-    }
+async def get_task_status(task_id, client_id, duration=None):
+    """
+    Ожидает завершения задачи на распознавание аудио в SaluteSpeech.
+
+    :param duration: Длительность аудио в секундах, по ней планируются опросы.
+    :return: Результат задачи (с response_file_id).
+    :raises ProviderError: Задача завершилась ошибкой или не дождалась результата.
+    """
+    url = f"{SALUTE_API_URL}/task:get?id={task_id}"
+
+    async def check():
+        try:
+            response = await _salute_request("GET", url, client_id)
+        except ProviderUnavailable:
+            # Задача идет у провайдера, опрос откладывается до следующего раза
+            return False, None
+        response.raise_for_status()
+        data = response.json()
+        if "result" in data and data["result"]["status"] == "DONE":
+            return True, data["result"]
+        elif "result" in data and data["result"]["status"] == "ERROR":
+            logging.error(f"Ошибка при распознавании: {data['result']['error']}")
+            raise ProviderError(
+                "salute", f"Ошибка при распознавании аудио в SaluteSpeech: {data['result']['error']}"
+            )
+        return False, None
+
     try:
-        while True:
-            await asyncio.sleep(5)  # Проверяем каждые 5 секунд
-            response = requests.get(url, headers=headers, verify=False)
-            response.raise_for_status()
-            data = response.json()
-            if "result" in data and data["result"]["status"] == "DONE":
-                return data["result"]
-            elif "result" in data and data["result"]["status"] == "ERROR":
-                logging.error(f"Ошибка при распознавании: {data['result']['error']}")
-                return None
-    except requests.exceptions.RequestException as e:
+        return await poller.wait("salute", task_id, check, duration=duration)
+    except (httpx.HTTPError, PollTimeout) as e:
         logging.error(f"Ошибка при проверке статуса задачи SaluteSpeech: {e}")
-        return None
+        raise ProviderError("salute", f"Ошибка при распознавании аудио в SaluteSpeech: {e}") from e
 
 
 async def download_result_from_salute(response_file_id, client_id):
     """
     Скачивание результата из SaluteSpeech по идентификатору файла.
+
+    :raises ProviderError: Результат не скачан.
     """
-    url = f"https://smartspeech.sber.ru/rest/v1/data:download?response_file_id={response_file_id}"
-    headers = {
-        "Authorization": f"Bearer {client_id}"
-    }
+    url = f"{SALUTE_API_URL}/data:download?response_file_id={response_file_id}"
     try:
         # Отправка GET-запроса для скачивания результата
-        response = requests.get(url, headers=headers, verify=False)
+        response = await _salute_request("GET", url, client_id)
         response.raise_for_status()  # Проверка на наличие HTTP-ошибок
         
         # Преобразование ответа в JSON
@@ -139,7 +245,67 @@ async def download_result_from_salute(response_file_id, client_id):
         logging.info(f"Результаты скачивания из SaluteSpeech успешно получены.")
         return data
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logging.error(f"Ошибка при скачивании результата из SaluteSpeech: {e}")
-        return None
+        raise ProviderError("salute", f"Ошибка при скачивании результата из SaluteSpeech: {e}") from e
+
+
+async def recognize_file_with_salute(upload_path, audio_encoding="OPUS", duration=None):
+    """
+    Полный цикл распознавания файла в SaluteSpeech: загрузка, задача,
+    ожидание и скачивание результата.
+
+    :param upload_path: Файл в формате провайдера (удаляется после загрузки).
+    :return: Список сегментов результата SaluteSpeech.
+    """
+    # Загрузка файла в SaluteSpeech
+    access_token = await get_access_token()
+    request_file_id = await upload_file_to_salute(upload_path, access_token)
+
+    # Создание задачи для транскрибации
+    task_id = await create_salute_task(
+        request_file_id, access_token, audio_encoding=audio_encoding
+    )
+
+    # Проверка статуса задачи
+    task_status = await get_task_status(task_id, access_token, duration=duration)
+    response_file_id = task_status.get("response_file_id")
+
+    result = await download_result_from_salute(response_file_id, access_token)
+    if not isinstance(result, list) or len(result) == 0:
+        raise ProviderError("salute", "Некорректный формат ответа из SaluteSpeech")
+    return result
+
+
+async def recognize_sync_with_salute(file_path, audio_encoding="OPUS"):
+    """
+    Синхронное распознавание короткой записи (до 1 мин и 2 МБ) одним
+    запросом, без загрузки файла, задачи и опросов. Файл не удаляется.
+
+    :return: Список сегментов в формате результата асинхронного распознавания
+        (без выравнивания слов - синхронный API его не возвращает).
+    """
+    url = f"{SALUTE_API_URL}/speech:recognize"
+    access_token = await get_access_token()
+    headers = {"Content-Type": SYNC_CONTENT_TYPES[audio_encoding], **file_upload_headers(file_path)}
+    try:
+        with stage("salute_sync"):
+            response = await _salute_request(
+                "POST", url, access_token,
+                headers=headers,
+                content_factory=lambda: stream_file(file_path),
+                params={"language": "ru-RU", "enable_profanity_filter": "false"},
+            )
+            response.raise_for_status()
+        UPLOAD_BYTES.inc(os.path.getsize(file_path), target="salute")
+        data = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        raise SyncRecognitionError("salute", f"Ошибка синхронного распознавания SaluteSpeech: {e}") from e
 
+    if not isinstance(data, dict) or not isinstance(data.get("result"), list):
+        raise SyncRecognitionError("salute", "Некорректный формат ответа из SaluteSpeech")
+    return [
+        {"results": [{"text": text, "normalized_text": text}], "eou": True}
+        for text in data["result"]
+        if text
+    ]
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+
+from config import SEGMENT_TARGET_SECONDS, SEGMENT_CONCURRENCY
+from .executors import gather_or_cancel
+from .salutespeech_transcribe import recognize_file_with_salute
+from .transcode import TranscodePlan, probe_audio, execute_plan, derived_path
+from .utils import detect_speech_regions, remap_time
+from .yandex_transcribe import upload_file_to_s3
+
+# Поля с таймстампами в ответах Yandex ("1.2s") и SaluteSpeech
+TIME_KEYS = ("startTime", "endTime", "start", "end", "processed_audio_start", "processed_audio_end")
+
+_semaphores = {}
+
+
+def _semaphore(provider: str) -> asyncio.Semaphore:
+    if provider not in _semaphores:
+        _semaphores[provider] = asyncio.Semaphore(SEGMENT_CONCURRENCY[provider])
+    return _semaphores[provider]
+
+
+def split_regions(regions: list, target_seconds: float = SEGMENT_TARGET_SECONDS) -> list:
+    """
+    Делит участки речи на группы примерно по target_seconds речи.
+
+    Границы групп проходят только по паузам между участками. Слишком
+    короткий хвост присоединяется к предыдущей группе.
+    """
+    groups = []
+    current = []
+    length = 0.0
+    for start, end in regions:
+        current.append((start, end))
+        length += end - start
+        if length >= target_seconds:
+            groups.append(current)
+            current = []
+            length = 0.0
+    if current:
+        if groups and length < target_seconds / 4:
+            groups[-1].extend(current)
+        else:
+            groups.append(current)
+    return groups
+
+
+def segment_map(regions: list) -> list:
+    """Карта участков для utils.remap_time: где каждый участок лежит в склеенном аудио."""
+    segments = []
+    offset = 0.0
+    for start, end in regions:
+        segments.append({"start": start, "end": end, "offset": offset})
+        offset += end - start
+    return segments
+
+
+def remap_timestamps(data, segments):
+    """Переводит таймстампы ответа провайдера на шкалу исходной записи (на месте)."""
+    if isinstance(data, list):
+        for item in data:
+            remap_timestamps(item, segments)
+    elif isinstance(data, dict):
+        for key, value in data.items():
+            if key in TIME_KEYS and isinstance(value, str) and value.endswith("s"):
+                try:
+                    seconds = float(value[:-1])
+                except ValueError:
+                    continue
+                data[key] = f"{remap_time(seconds, segments):.3f}s"
+            else:
+                remap_timestamps(value, segments)
+    return data
+
+
+async def _yandex_part(index, audio_path, file_name, probe, regions):
+    async with _semaphore("yandex"):
+        plan = TranscodePlan("yandex", probe, regions, window=(regions[0][0], regions[-1][1]))
+        ext = plan.target["ext"]
+        part_path = await execute_plan(
+            plan, audio_path, derived_path(audio_path, f"_yandex_part{index}", ext)
+        )
+        status, full_text, chunks = await upload_file_to_s3(
+            local_file_path=part_path,
+            s3_file_name=f"yandex/{derived_path(file_name, f'_part{index}', ext)}",
+            audio_encoding=plan.encoding,
+            duration=plan.duration,
+        )
+    if status != "done":
+        raise Exception(f"Ошибка при распознавании части {index} в Yandex SpeechKit")
+    remap_timestamps(chunks, segment_map(regions))
+    return full_text, chunks
+
+
+async def recognize_yandex_segmented(audio_path, file_name, regions):
+    """
+    Распознает запись в Yandex SpeechKit частями по паузам параллельно.
+
+    :param regions: Участки речи (начало, конец) в секундах.
+    :return: Как upload_file_to_s3: статус, полный текст и чанки с таймстампами
+        исходной записи.
+    """
+    groups = split_regions(regions)
+    logging.info(f"Запись {audio_path} разбита на {len(groups)} частей для Yandex")
+    probe = await probe_audio(audio_path)
+    parts = await gather_or_cancel(
+        _yandex_part(index, audio_path, file_name, probe, group)
+        for index, group in enumerate(groups)
+    )
+    full_text = " ".join(text for text, _ in parts if text)
+    chunks = [chunk for _, part_chunks in parts for chunk in part_chunks]
+    return "done", full_text, chunks
+
+
+async def _salute_part(index, audio_path, probe, span):
+    async with _semaphore("salute"):
+        plan = TranscodePlan("salute", probe, window=span)
+        part_path = await execute_plan(
+            plan, audio_path,
+            derived_path(audio_path, f"_salute_part{index}", plan.target["ext"]),
+        )
+        result = await recognize_file_with_salute(
+            part_path, audio_encoding=plan.encoding, duration=plan.duration
+        )
+    return remap_timestamps(result, segment_map([span]))
+
+
+async def recognize_salute_segmented(audio_path):
+    """
+    Распознает запись в SaluteSpeech частями параллельно.
+
+    Тишина не вырезается (Salute хуже распознает аудио после VAD), части
+    режутся посередине пауз между участками речи.
+
+    :return: Список сегментов результата SaluteSpeech или None, если запись
+        слишком короткая для разбиения.
+    """
+    probe = await probe_audio(audio_path)
+    if probe["duration"] < SEGMENT_TARGET_SECONDS * 1.25:
+        return None
+    regions = await detect_speech_regions(audio_path)
+    groups = split_regions(regions or [])
+    if len(groups) < 2:
+        return None
+
+    cuts = [
+        (previous[-1][1] + following[0][0]) / 2
+        for previous, following in zip(groups, groups[1:])
+    ]
+    bounds = [0.0] + cuts + [probe["duration"]]
+    spans = list(zip(bounds, bounds[1:]))
+    logging.info(f"Запись {audio_path} разбита на {len(spans)} частей для SaluteSpeech")
+    try:
+        parts = await gather_or_cancel(
+            _salute_part(index, audio_path, probe, span)
+            for index, span in enumerate(spans)
+        )
+    finally:
+        os.remove(audio_path)
+    return [segment for part in parts for segment in part]
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import boto3.session
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from config import (
+    BUCKET_NAME,
+    AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY,
+    YANDEX_S3_ENDPOINT_URL,
+    S3_REGION,
+    S3_ADDRESSING_STYLE,
+    S3_PART_SIZE,
+    S3_MAX_CONCURRENCY,
+    S3_DELETE_AFTER_RECOGNITION,
+    S3_DELETE_GRACE,
+    S3_LIFECYCLE_DAYS,
+)
+from .metrics import stage, UPLOAD_BYTES, STORAGE_OPERATIONS
+from .resilience import guards
+
+DEFAULT_ENDPOINT = "https://storage.yandexcloud.net"
+LIFECYCLE_RULE_ID = "transcribe-expire-recognition-files"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ObjectStorage:
+    """
+    Файлы для распознавания в S3.
+
+    Ключ объекта - хэш содержимого, поэтому повторная отправка того же
+    файла не загружает его заново, если объект еще есть в бакете. Файлы
+    больше part_size загружаются multipart, части отправляются параллельно.
+    Все обращения к boto3 идут в потоках, а не в цикле событий, через
+    защиту провайдера "s3" (лимит запросов и выключатель; повторяет сам boto3).
+
+    Ключ общий для всех процессов и запросов с тем же файлом, поэтому
+    объект не удаляется сразу после распознавания: удаляется только
+    загруженный этим процессом, через delete_grace секунд после того,
+    как его отпустили все запросы процесса. Остальное (объекты других
+    процессов, отложенные удаления, прерванные остановкой) убирает
+    правило жизненного цикла бакета, которое настраивает ensure_lifecycle.
+    """
+
+    def __init__(self, bucket: str = BUCKET_NAME, endpoint_url: str = YANDEX_S3_ENDPOINT_URL,
+                 access_key: str = AWS_ACCESS_KEY_ID, secret_key: str = AWS_SECRET_ACCESS_KEY,
+                 region: str = S3_REGION, addressing_style: str = S3_ADDRESSING_STYLE,
+                 part_size: int = S3_PART_SIZE, max_concurrency: int = S3_MAX_CONCURRENCY,
+                 delete_after_use: bool = S3_DELETE_AFTER_RECOGNITION,
+                 delete_grace: float = S3_DELETE_GRACE,
+                 lifecycle_days: int = S3_LIFECYCLE_DAYS, lifecycle_prefix: str = "yandex/"):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url or DEFAULT_ENDPOINT
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.addressing_style = addressing_style
+        self.delete_after_use = delete_after_use
+        self.delete_grace = delete_grace
+        self.lifecycle_days = lifecycle_days
+        self.lifecycle_prefix = lifecycle_prefix
+        self.transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=max_concurrency,
+            use_threads=True,
+        )
+        self._max_concurrency = max_concurrency
+        self._client = None
+        self._client_lock = threading.Lock()
+        # Загрузки в процессе (ключ -> задача), число запросов, использующих объект,
+        # объекты, загруженные этим процессом, и отложенные удаления (ключ -> задача)
+        self._uploads = {}
+        self._leases = {}
+        self._owned = set()
+        self._deletes = {}
+        self._deleting = set()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = boto3.session.Session().client(
+                        "s3",
+                        aws_access_key_id=self.access_key,
+                        aws_secret_access_key=self.secret_key,
+                        endpoint_url=self.endpoint_url,
+                        region_name=self.region,
+                        config=Config(
+                            s3={"addressing_style": self.addressing_style},
+                            # Соединений не меньше, чем параллельных частей
+                            max_pool_connections=max(self._max_concurrency, 10),
+                            retries={"max_attempts": 5, "mode": "standard"},
+                        ),
+                    )
+        return self._client
+
+    def object_url(self, key: str) -> str:
+        """Адрес объекта, который передается провайдеру распознавания."""
+        endpoint = urlsplit(self.endpoint_url)
+        if self.addressing_style == "path":
+            return f"{endpoint.scheme}://{endpoint.netloc}/{self.bucket}/{key}"
+        return f"{endpoint.scheme}://{self.bucket}.{endpoint.netloc}/{key}"
+
+    def _exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def _upload(self, path: str, key: str) -> bool:
+        if self._exists(key):
+            return False
+        self.client.upload_file(path, self.bucket, key, Config=self.transfer_config)
+        return True
+
+    async def _upload_once(self, path: str, key: str):
+        uploaded = await guards["s3"].call(asyncio.to_thread, self._upload, path, key)
+        if uploaded:
+            self._owned.add(key)
+            STORAGE_OPERATIONS.inc(operation="upload")
+            UPLOAD_BYTES.inc(os.path.getsize(path), target="s3")
+        else:
+            STORAGE_OPERATIONS.inc(operation="skip")
+            logging.info(f"Объект {key} уже есть в хранилище, загрузка пропущена")
+
+    @staticmethod
+    async def _key(path: str, prefix: str, ext: str) -> str:
+        digest = await asyncio.to_thread(file_sha256, path)
+        ext = os.path.splitext(path)[1] if ext is None else ext
+        return f"{prefix.strip('/')}/{digest}{ext}" if prefix else f"{digest}{ext}"
+
+    async def upload(self, path: str, prefix: str = "", ext: str = None) -> str:
+        """
+        Загружает файл под ключом по хэшу содержимого, если такого объекта нет.
+
+        :param prefix: Каталог в бакете ("yandex").
+        :param ext: Расширение ключа; по умолчанию расширение файла.
+        :return: Ключ объекта.
+        """
+        key = await self._key(path, prefix, ext)
+        await self._put(path, key)
+        return key
+
+    async def _put(self, path: str, key: str):
+        # Одновременные запросы с тем же файлом ждут одну загрузку
+        task = self._uploads.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._upload_once(path, key))
+            self._uploads[key] = task
+            task.add_done_callback(lambda _: self._uploads.pop(key, None))
+        with stage("s3_upload"):
+            await asyncio.shield(task)
+
+    async def delete(self, key: str):
+        try:
+            await guards["s3"].call(
+                asyncio.to_thread, self.client.delete_object, Bucket=self.bucket, Key=key
+            )
+            STORAGE_OPERATIONS.inc(operation="delete")
+        except Exception as e:
+            logging.warning(f"Не удалось удалить объект {key} из хранилища: {e}")
+
+    async def _delete_later(self, key: str):
+        await asyncio.sleep(self.delete_grace)
+        # Удаление остается в _deletes, пока не завершится: stored() с тем же
+        # ключом дождется его и загрузит объект заново
+        self._deleting.add(key)
+        try:
+            await self.delete(key)
+        finally:
+            self._deleting.discard(key)
+            self._owned.discard(key)
+            if self._deletes.get(key) is asyncio.current_task():
+                del self._deletes[key]
+
+    def _ensure_lifecycle(self):
+        try:
+            rules = self.client.get_bucket_lifecycle_configuration(Bucket=self.bucket)["Rules"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchLifecycleConfiguration":
+                raise
+            rules = []
+        rule = {
+            "ID": LIFECYCLE_RULE_ID,
+            "Status": "Enabled",
+            "Filter": {"Prefix": self.lifecycle_prefix},
+            "Expiration": {"Days": self.lifecycle_days},
+        }
+        current = next((item for item in rules if item.get("ID") == LIFECYCLE_RULE_ID), None)
+        if current is not None and all(current.get(name) == value for name, value in rule.items()):
+            return False
+        # Чужие правила бакета сохраняются, заменяется только свое
+        rules = [item for item in rules if item.get("ID") != LIFECYCLE_RULE_ID] + [rule]
+        self.client.put_bucket_lifecycle_configuration(
+            Bucket=self.bucket, LifecycleConfiguration={"Rules": rules}
+        )
+        return True
+
+    async def ensure_lifecycle(self):
+        """
+        Настраивает правило жизненного цикла: объекты под lifecycle_prefix
+        удаляются через lifecycle_days дней. Ошибка (нет прав, хранилище не
+        поддерживает правила) только пишется в журнал.
+        """
+        if self.lifecycle_days <= 0:
+            return
+        try:
+            if await asyncio.to_thread(self._ensure_lifecycle):
+                logging.info(
+                    f"Бакет {self.bucket}: объекты {self.lifecycle_prefix} удаляются "
+                    f"через {self.lifecycle_days} дн."
+                )
+        except Exception as e:
+            logging.warning(f"Не удалось настроить правило жизненного цикла бакета {self.bucket}: {e}")
+
+    @asynccontextmanager
+    async def stored(self, path: str, prefix: str = "", ext: str = None):
+        """
+        Загружает файл на время блока и возвращает ключ. Запрос занимает
+        объект до проверки его наличия в бакете, так что удаление, начатое
+        другим запросом процесса, не может случиться между проверкой и
+        распознаванием.
+        """
+        key = await self._key(path, prefix, ext)
+        self._leases[key] = self._leases.get(key, 0) + 1
+        try:
+            pending = self._deletes.get(key)
+            if pending is not None:
+                if key in self._deleting:
+                    # Объект уже удаляется: после удаления он будет загружен заново
+                    await asyncio.shield(pending)
+                else:
+                    del self._deletes[key]
+                    pending.cancel()
+            await self._put(path, key)
+            yield key
+        finally:
+            self._leases[key] -= 1
+            if not self._leases[key]:
+                del self._leases[key]
+                if self.delete_after_use and key in self._owned:
+                    self._deletes[key] = asyncio.ensure_future(self._delete_later(key))
+
+    def stats(self) -> dict:
+        return {
+            "bucket": self.bucket,
+            "endpoint": self.endpoint_url,
+            "uploads_in_progress": len(self._uploads),
+            "objects_in_use": len(self._leases),
+            "deletes_scheduled": len(self._deletes),
+        }
+
+
+storage = ObjectStorage()
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import os
+
+from config import TRANSCODE_OPUS_BITRATE
+from .metrics import stage
+
+# Самые компактные форматы, которые принимают провайдеры
+PROVIDER_FORMATS = {
+    "yandex": {
+        "codec": "opus", "format": "ogg", "ext": ".ogg",
+        "sample_rate": 16000, "channels": 1, "encoding": "OGG_OPUS",
+    },
+    "salute": {
+        "codec": "opus", "format": "ogg", "ext": ".ogg",
+        "sample_rate": 16000, "channels": 1, "encoding": "OPUS",
+    },
+}
+
+
+class TranscodeError(Exception):
+    """Ошибка ffprobe/ffmpeg."""
+
+
+def derived_path(path: str, suffix: str, ext: str = None) -> str:
+    """Путь к производному файлу рядом с исходным: <имя><suffix><ext>."""
+    base, original_ext = os.path.splitext(path)
+    return f"{base}{suffix}{ext or original_ext}"
+
+
+def upload_extension(filename: str) -> str:
+    """Расширение загруженного файла (формат все равно определяется по содержимому)."""
+    return os.path.splitext(filename or "")[1].lower() or ".mp3"
+
+
+async def _run(*args) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise TranscodeError(stderr.decode(errors="ignore").strip())
+    return stdout
+
+
+async def probe_audio(path: str) -> dict:
+    """
+    Параметры аудиодорожки без декодирования: кодек, контейнер, частота,
+    число каналов и длительность.
+    """
+    output = await _run(
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name,sample_rate,channels:format=format_name,duration",
+        "-of", "json",
+        path,
+    )
+    data = json.loads(output)
+    if not data.get("streams"):
+        raise TranscodeError(f"В файле {path} нет аудиодорожки")
+    stream = data["streams"][0]
+    return {
+        "codec": stream.get("codec_name"),
+        "format": data.get("format", {}).get("format_name", ""),
+        "sample_rate": int(stream.get("sample_rate") or 0),
+        "channels": int(stream.get("channels") or 0),
+        "duration": float(data.get("format", {}).get("duration") or 0.0),
+    }
+
+
+class TranscodePlan:
+    """
+    Какие шаги нужны, чтобы привести файл к формату провайдера.
+
+    :param regions: Участки речи (начало, конец) в секундах исходной записи.
+    :param window: Читать только этот отрезок (начало, конец) исходной записи:
+        ffmpeg перематывает к нему, не декодируя файл с начала.
+    """
+
+    def __init__(self, provider: str, probe: dict, regions: list = None, window: tuple = None):
+        self.provider = provider
+        self.probe = probe
+        self.target = PROVIDER_FORMATS[provider]
+        self.regions = regions or []
+        self.window = window
+        self.downmix = probe["channels"] != self.target["channels"]
+        # ffprobe всегда сообщает 48 кГц для Opus, поэтому для него частоту не сверяем
+        self.resample = (
+            probe["codec"] != "opus"
+            and probe["sample_rate"] != self.target["sample_rate"]
+        )
+        self.recode = (
+            probe["codec"] != self.target["codec"]
+            or self.target["format"] not in probe["format"].split(",")
+        )
+
+    @property
+    def needs_encode(self) -> bool:
+        return bool(self.regions) or bool(self.window) or self.downmix or self.resample or self.recode
+
+    @property
+    def encoding(self) -> str:
+        return self.target["encoding"]
+
+    @property
+    def duration(self) -> float:
+        """Длительность результата в секундах."""
+        if self.regions:
+            return sum(end - start for start, end in self.regions)
+        if self.window:
+            return self.window[1] - self.window[0]
+        return self.probe["duration"]
+
+    def __repr__(self):
+        return (
+            f"TranscodePlan(provider={self.provider}, regions={len(self.regions)}, window={self.window}, "
+            f"downmix={self.downmix}, resample={self.resample}, recode={self.recode})"
+        )
+
+
+def speech_filter(regions: list) -> str:
+    """Фильтр ffmpeg, оставляющий только участки (начало, конец) в секундах."""
+    condition = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in regions)
+    return f"aselect='{condition}',asetpts=N/SR/TB"
+
+
+async def plan_transcode(input_path: str, provider: str, regions: list = None) -> TranscodePlan:
+    probe = await probe_audio(input_path)
+    plan = TranscodePlan(provider, probe, regions)
+    logging.info(f"План перекодирования {input_path}: {plan}")
+    return plan
+
+
+async def execute_plan(plan: TranscodePlan, input_path: str, output_path: str = None) -> str:
+    """
+    Выполняет план одним вызовом ffmpeg (ровно одно кодирование).
+
+    Если файл уже в нужном формате и вырезать нечего, возвращается input_path.
+    """
+    if not plan.needs_encode:
+        return input_path
+
+    target = plan.target
+    output_path = output_path or derived_path(input_path, f"_{plan.provider}", target["ext"])
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    regions = plan.regions
+    if plan.window:
+        start, end = plan.window
+        # Перемотка до -i: время на выходе отсчитывается от начала отрезка
+        args += ["-ss", f"{start:.3f}", "-t", f"{end - start:.3f}"]
+        regions = [(region_start - start, region_end - start) for region_start, region_end in regions]
+    args += ["-i", input_path, "-vn"]
+    if regions:
+        args += ["-af", speech_filter(regions)]
+    args += [
+        "-ac", str(target["channels"]),
+        "-ar", str(target["sample_rate"]),
+        "-c:a", "libopus", "-b:a", TRANSCODE_OPUS_BITRATE, "-application", "voip",
+        "-f", target["format"],
+        output_path,
+    ]
+    with stage("transcode"):
+        await _run(*args)
+    return output_path
+
+
+async def decode_to_pcm(input_path: str, output_path: str, sample_rate: int = 16000) -> str:
+    """Декодирует файл в сырой PCM s16le моно (для локальных движков)."""
+    with stage("decode"):
+        await _run(
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-i", input_path, "-vn",
+            "-f", "s16le", "-ac", "1", "-ar", str(sample_rate),
+            output_path,
+        )
+    return output_path
+
+
+async def transcode_for_provider(input_path: str, provider: str, regions: list = None):
+    """
+    Пробует файл, строит план и выполняет его.
+
+    :return: Путь к файлу для загрузки и план (кодировка, длительность).
+    """
+    plan = await plan_transcode(input_path, provider, regions)
+    return await execute_plan(plan, input_path), plan
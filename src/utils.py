@@ -1,41 +1,79 @@
 import logging
-import torch
-import re
+import threading
+import numpy as np
 import soundfile as sf
 
-from pydub import AudioSegment
-
-from elevenlabs import ElevenLabs
-
-from config import ELEVENLABS_KEY
-from silero_vad import load_silero_vad, read_audio, get_speech_timestamps
-
-client = ElevenLabs(api_key=ELEVENLABS_KEY)
+from math import gcd
 
-
-# AudioSegment.converter = which("/usr/bin/ffmpeg")
-# vad_model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad', force_reload=True)
-vad_model = load_silero_vad()
+from pydub import AudioSegment
+from pydub.utils import mediainfo
+
+from config import ELEVENLABS_KEY, VAD_PAD_MS
+from .executors import run_in_pool
+from .hallucinations import DEFAULT_STOP_WORDS, hallucination_filters
+from .metrics import stage
+from scipy.signal import resample_poly
+
+# torch, Silero и ElevenLabs загружаются при первом использовании, а не при импорте:
+# процессу, который обслуживает только часть движков, они могут не понадобиться
+_client = None
+_vad_model = None
+_vad_lock = threading.Lock()
+
+
+def get_elevenlabs_client():
+    global _client
+    if _client is None:
+        from elevenlabs import ElevenLabs
+        _client = ElevenLabs(api_key=ELEVENLABS_KEY)
+    return _client
+
+
+def get_vad_model():
+    """Модель Silero VAD процесса (загружается один раз)."""
+    global _vad_model
+    if _vad_model is None:
+        with _vad_lock:
+            if _vad_model is None:
+                from silero_vad import load_silero_vad
+                # AudioSegment.converter = which("/usr/bin/ffmpeg")
+                # vad_model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad', force_reload=True)
+                _vad_model = load_silero_vad()
+    return _vad_model
 
 # get_speech_timestamps = utils[0]
 
-STOP_WORDS = [
-    "эмм", "эээ", "типа", "ну это", "мм", "вроде как", "короче", 
-    "это самое", "в общем", "как его там", "что-то типа"
-]
+STOP_WORDS = DEFAULT_STOP_WORDS["ru"]
 
 
-async def convert_to_mono(audio_path: str, output_path: str):
+def _convert_to_mono(audio_path: str, output_path: str):
     audio = AudioSegment.from_file(audio_path)
     mono_audio = audio.set_channels(1)
     mono_audio.export(output_path, format="mp3")
 
 
+async def convert_to_mono(audio_path: str, output_path: str):
+    await run_in_pool("transcode", _convert_to_mono, audio_path, output_path)
+
+
+def get_audio_duration(audio_path: str):
+    """Длительность аудио в секундах без полного декодирования (None, если не удалось)."""
+    try:
+        return sf.info(audio_path).duration
+    except Exception:
+        pass
+    try:
+        return float(mediainfo(audio_path)["duration"])
+    except Exception as e:
+        logging.warning(f"Не удалось определить длительность {audio_path}: {e}")
+        return None
+
+
 async def remove_background_audio(audio_path):
     try:
         with open(audio_path, "rb") as audio_file:
         # Perform audio isolation
-            isolated_audio_iterator = client.audio_isolation.audio_isolation(audio=audio_file)
+            isolated_audio_iterator = get_elevenlabs_client().audio_isolation.audio_isolation(audio=audio_file)
 
             # Save the isolated audio to a new file
             audio_file_path = audio_path.replace(".mp3", "_cleaned_file.mp3")
@@ -53,86 +91,83 @@ async def remove_background_audio(audio_path):
         )
 
 
-# Стоп-слова или стоп-фразы, которые могут быть "галлюцинациями"
+async def filter_hallucinations(transcribed_text, language="ru"):
+    """Убирает стоп-слова и стоп-фразы, схлопывает лишние пробелы."""
+    with stage("filter"):
+        return hallucination_filters.get(language).filter_text(transcribed_text)
 
-async def filter_hallucinations(transcribed_text):
-    # Убираем все слова из списка STOP_WORDS
-    for word in STOP_WORDS:
-        transcribed_text = re.sub(rf'\b{word}\b', '', transcribed_text, flags=re.IGNORECASE)
-    
-    # Убираем лишние пробелы
-    transcribed_text = re.sub(r'\s+', ' ', transcribed_text).strip()
-    
-    return transcribed_text
 
+VAD_SAMPLE_RATE = 16000
 
-# Функция для применения VaD к аудиофайлу
-async def apply_vad(audio_file_path, output_file_path):
-    try:
-        # Сначала конвертируем аудио в моно, если оно стерео
-        audio = AudioSegment.from_file(audio_file_path)
-        original_frame_rate = audio.frame_rate  # Сохраняем исходную частоту дискретизации
-        original_channels = audio.channels  # Сохраняем исходное количество каналов
-
-        # Преобразование аудио в моно, если в нем более одного канала
-        if audio.channels > 1:
-            logging.info(f"Конвертация файла {audio_file_path} в моно...")
-            audio = audio.set_channels(1)
-
-        # Преобразование частоты дискретизации в 16000 Гц, если это необходимо
-        if audio.frame_rate != 16000:
-            logging.info(f"Изменение частоты дискретизации файла {audio_file_path} на 16000 Гц...")
-            audio = audio.set_frame_rate(16000)
-
-        # Сохраняем преобразованное аудио во временный файл в формате WAV
-        temp_mono_path = f"{audio_file_path}_mono_16kHz.wav"
-        audio.export(temp_mono_path, format="wav")
-        audio_file_path = temp_mono_path
-
-        # Используем soundfile для считывания аудиофайла
-        wav, sr = sf.read(audio_file_path)
-
-        # Проверяем количество каналов и конвертируем в одномерный массив, если требуется
-        if wav.ndim > 1:
-            logging.info(f"Конвертация многоканального аудио в одномерный массив для файла {audio_file_path}...")
-            wav = wav.mean(axis=1)  # Среднее значение по каналам для получения моно
-
-        # Определяем таймстампы с участками речи с помощью модели VAD
-        speech_timestamps = get_speech_timestamps(
-            wav,
-            vad_model,
-            return_seconds=True,  # Return speech timestamps in seconds (default is samples)
-        )
 
-        # Проверяем, были ли найдены речевые сегменты
-        if not speech_timestamps:
-            logging.warning(f"No speech segments found in the file {audio_file_path}")
-            return None
+def decode_audio(audio_file_path):
+    """
+    Декодирует файл один раз в массив float32 формы (кадры, каналы).
 
-        # Загружаем аудиофайл для обрезки с помощью Pydub
-        audio = AudioSegment.from_file(audio_file_path)
+    :return: Массив отсчетов в диапазоне [-1, 1] и частота дискретизации.
+    """
+    audio = AudioSegment.from_file(audio_file_path)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    samples = samples.reshape(-1, audio.channels)
+    samples /= float(1 << (8 * audio.sample_width - 1))
+    return samples, audio.frame_rate
 
-        # Собираем аудио участки, где есть речь
-        speech_audio = AudioSegment.empty()
-        for timestamp in speech_timestamps:
-            start = timestamp['start'] / sr * 1000  # переводим в миллисекунды
-            end = timestamp['end'] / sr * 1000  # переводим в миллисекунды
-            speech_audio += audio[start:end]
 
-        # Возвращаем частоту дискретизации и количество каналов к исходным значениям
-        if original_channels > 1:
-            logging.info(f"Возвращаем количество каналов к исходному значению {original_channels} для файла {output_file_path}")
-            speech_audio = speech_audio.set_channels(original_channels)
+def to_vad_input(samples, sample_rate):
+    """Моно 16 кГц для модели VAD (исходный массив не изменяется)."""
+    mono = samples.mean(axis=1) if samples.ndim > 1 else samples
+    if sample_rate != VAD_SAMPLE_RATE:
+        g = gcd(VAD_SAMPLE_RATE, sample_rate)
+        mono = resample_poly(mono, VAD_SAMPLE_RATE // g, sample_rate // g)
+    return np.ascontiguousarray(mono, dtype=np.float32)
 
-        if original_frame_rate != 16000:
-            logging.info(f"Возвращаем частоту дискретизации к исходному значению {original_frame_rate} Гц для файла {output_file_path}")
-            speech_audio = speech_audio.set_frame_rate(original_frame_rate)
 
-        # Сохраняем предобработанный файл
-        speech_audio.export(output_file_path, format="mp3")
+def detect_speech(samples, sample_rate, pad_ms=VAD_PAD_MS):
+    """
+    Находит участки речи моделью Silero VAD.
 
-        return output_file_path
+    :return: Список (начало, конец) в отсчетах исходной частоты дискретизации.
+    """
+    import torch
+    from silero_vad import get_speech_timestamps
 
-    except Exception as e:
-        logging.error(f"Произошла ошибка при применении VAD к файлу {audio_file_path}\n{e}")
-        return None
+    wav = torch.from_numpy(to_vad_input(samples, sample_rate))
+    model = get_vad_model()
+    # Модель хранит состояние, одновременно ее может использовать только один поток
+    with _vad_lock:
+        speech_timestamps = get_speech_timestamps(wav, model)
+
+    scale = sample_rate / VAD_SAMPLE_RATE
+    pad = int(pad_ms * sample_rate / 1000)
+    total = len(samples)
+    regions = []
+    for timestamp in speech_timestamps:
+        start = max(int(timestamp["start"] * scale) - pad, 0)
+        end = min(int(timestamp["end"] * scale) + pad, total)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(end, regions[-1][1]))
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def remap_time(seconds, segments):
+    """Переводит время в аудио после VAD во время исходной записи."""
+    for segment in reversed(segments):
+        if seconds >= segment["offset"]:
+            return segment["start"] + (seconds - segment["offset"])
+    return seconds
+
+
+def _detect_speech_regions(audio_file_path):
+    samples, sample_rate = decode_audio(audio_file_path)
+    return [
+        (start / sample_rate, end / sample_rate)
+        for start, end in detect_speech(samples, sample_rate)
+    ]
+
+
+async def detect_speech_regions(audio_file_path):
+    """Участки речи (начало, конец) в секундах без перекодирования файла."""
+    with stage("vad"):
+        return await run_in_pool("vad", _detect_speech_regions, audio_file_path)
@@ -1,12 +1,228 @@
 import os
 import wave
 import json
+import time
+import queue
+import logging
+import threading
+
+from contextlib import contextmanager
+
+import numpy as np
 from vosk import Model, KaldiRecognizer
 
+from config import (
+    VOSK_MODELS,
+    VOSK_RECOGNIZER_POOL_SIZE,
+    VOSK_RECOGNIZER_TIMEOUT,
+)
+from .metrics import record_model_load, record_worker_stats, worker_stats
+
+
+def _current_rss() -> int:
+    """Текущий RSS процесса в байтах (0, если /proc недоступен)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class VoskModelRegistry:
+    """
+    Реестр моделей Vosk на процесс.
+
+    Каждая модель загружается с диска один раз и разделяется между всеми
+    запросами. Для каждой модели, частоты дискретизации и назначения
+    (пакетное/потоковое) держится ограниченный пул переиспользуемых
+    KaldiRecognizer.
+    """
+
+    def __init__(self, pool_size: int = VOSK_RECOGNIZER_POOL_SIZE,
+                 acquire_timeout: float = VOSK_RECOGNIZER_TIMEOUT):
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._models = {}
+        self._pools = {}
+        self._stats = {}
+
+    def _model_stats(self, model_path):
+        return self._stats.setdefault(model_path, {
+            "loaded": False,
+            "load_seconds": 0.0,
+            "memory_bytes": 0,
+            "hits": 0,
+            "misses": 0,
+            "recognizers_created": 0,
+            "recognizers_reused": 0,
+        })
+
+    def get_model(self, model_path: str) -> Model:
+        """Возвращает загруженную модель, при необходимости загружая ее."""
+        model = self._models.get(model_path)
+        if model is not None:
+            with self._lock:
+                self._model_stats(model_path)["hits"] += 1
+            return model
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_path, threading.Lock())
+
+        # Конкурентные запросы ждут одну загрузку, а не грузят модель повторно
+        with load_lock:
+            model = self._models.get(model_path)
+            if model is not None:
+                with self._lock:
+                    self._model_stats(model_path)["hits"] += 1
+                return model
+
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"Модель не найдена по пути: {model_path}")
+
+            logging.info(f"Загрузка модели Vosk {model_path}...")
+            rss_before = _current_rss()
+            started = time.perf_counter()
+            model = Model(model_path)
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                stats = self._model_stats(model_path)
+                stats["loaded"] = True
+                stats["load_seconds"] = round(elapsed, 3)
+                stats["memory_bytes"] = max(_current_rss() - rss_before, 0)
+                stats["misses"] += 1
+                self._models[model_path] = model
+            record_model_load("vosk", model_path, elapsed)
+            self.publish()
+            logging.info(f"Модель Vosk {model_path} загружена за {elapsed:.2f} с")
+            return model
+
+    def _pool(self, model_path, sample_rate, name, size):
+        key = (model_path, sample_rate, name)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = {
+                    "idle": queue.LifoQueue(),
+                    "slots": threading.BoundedSemaphore(size or self.pool_size),
+                }
+                self._pools[key] = pool
+            return pool
+
+    @contextmanager
+    def recognizer(self, model_path: str, sample_rate: int, words: bool = True,
+                   pool: str = "batch", pool_size: int = None):
+        """
+        Выдает KaldiRecognizer из пула и возвращает его обратно после использования.
+
+        :param model_path: Путь к распакованной модели Vosk.
+        :param sample_rate: Частота дискретизации аудио.
+        :param words: Включить таймстампы слов.
+        :param pool: Имя пула: у потоковых сессий свой пул, чтобы не занимать пакетный.
+        :param pool_size: Размер пула (по умолчанию VOSK_RECOGNIZER_POOL_SIZE).
+        """
+        model = self.get_model(model_path)
+        pool = self._pool(model_path, sample_rate, pool, pool_size)
+        if not pool["slots"].acquire(timeout=self.acquire_timeout):
+            raise TimeoutError(
+                f"Нет свободного распознавателя для модели {model_path}"
+            )
+        try:
+            try:
+                rec = pool["idle"].get_nowait()
+                with self._lock:
+                    self._model_stats(model_path)["recognizers_reused"] += 1
+            except queue.Empty:
+                rec = KaldiRecognizer(model, sample_rate)
+                with self._lock:
+                    self._model_stats(model_path)["recognizers_created"] += 1
+            rec.SetWords(words)
+            yield rec
+        except BaseException:
+            # Распознаватель в неизвестном состоянии, в пул его не возвращаем
+            pool["slots"].release()
+            raise
+        else:
+            rec.Reset()
+            pool["idle"].put(rec)
+            pool["slots"].release()
+        finally:
+            self.publish()
+
+    def warmup(self, model_paths=None):
+        """
+        Загружает модели заранее, чтобы первый запрос не платил за загрузку.
+
+        :param model_paths: Модели для загрузки (по умолчанию все VOSK_MODELS).
+        """
+        for model_path in model_paths or VOSK_MODELS:
+            try:
+                self.get_model(model_path)
+            except FileNotFoundError as e:
+                logging.warning(f"Прогрев Vosk пропущен: {e}")
+
+    def stats(self) -> dict:
+        """Статистика по моделям: память, время загрузки, попадания."""
+        with self._lock:
+            result = {path: dict(stats) for path, stats in self._stats.items()}
+            for (path, sample_rate, name), pool in self._pools.items():
+                result[path].setdefault("idle_recognizers", {})[f"{name}:{sample_rate}"] = (
+                    pool["idle"].qsize()
+                )
+        return result
+
+    def publish(self):
+        """Отправляет снимок статистики в основной процесс (из воркера пула)."""
+        record_worker_stats("vosk", self.stats())
+
+
+vosk_registry = VoskModelRegistry()
+
+
+def vosk_stats() -> dict:
+    """
+    Статистика моделей Vosk по всем процессам: текущему и воркерам пула vosk.
+
+    Каждый воркер загружает модели по требованию и присылает снимок своего
+    реестра после загрузки и после каждого распознавания.
+
+    :return: Сводка по моделям и снимки по процессам (pid -> статистика).
+    """
+    processes = worker_stats("vosk")
+    processes[os.getpid()] = vosk_registry.stats()
+
+    models = {}
+    for stats in processes.values():
+        for path, item in stats.items():
+            total = models.setdefault(path, {
+                "loaded_in": 0,
+                "memory_bytes": 0,
+                "load_seconds_max": 0.0,
+                "hits": 0,
+                "misses": 0,
+                "recognizers_created": 0,
+                "recognizers_reused": 0,
+            })
+            if item["loaded"]:
+                total["loaded_in"] += 1
+            total["memory_bytes"] += item["memory_bytes"]
+            total["load_seconds_max"] = max(total["load_seconds_max"], item["load_seconds"])
+            for key in ("hits", "misses", "recognizers_created", "recognizers_reused"):
+                total[key] += item[key]
+
+    return {
+        "models": models,
+        "processes": {str(pid): stats for pid, stats in processes.items()},
+    }
+
+
 def transcribe_vosk(audio_path, model_path="vosk-model-ru-0.42"):
     """
     Транскрибирует аудио файл с использованием Vosk.
-    
+
     :param audio_path: Путь к аудиофайлу (WAV формат, mono, 16kHz).
     :param model_path: Путь к распакованной модели Vosk.
     :return: Распознанный текст.
@@ -14,27 +230,121 @@ def transcribe_vosk(audio_path, model_path="vosk-model-ru-0.42"):
     if not os.path.exists(model_path):
         print(f"Модель не найдена по пути: {model_path}")
         return ""
-    
+
     wf = wave.open(audio_path, "rb")
     if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getframerate() not in [8000, 16000, 32000, 44100, 48000]:
         print("Аудио должно быть WAV моно 16kHz.")
+        wf.close()
         return ""
-    
-    model = Model(model_path)
-    rec = KaldiRecognizer(model, wf.getframerate())
-    rec.SetWords(True)
-    
+
+    with vosk_registry.recognizer(model_path, wf.getframerate()) as rec:
+        text = _recognize(rec, iter(lambda: wf.readframes(4000), b""))
+
+    wf.close()
+    return text
+
+
+def _recognize(rec, chunks) -> str:
     results = []
-    while True:
-        data = wf.readframes(4000)
-        if len(data) == 0:
-            break
+    for data in chunks:
         if rec.AcceptWaveform(data):
             result = json.loads(rec.Result())
             results.append(result.get("text", ""))
     # Последний фрагмент
     final_result = json.loads(rec.FinalResult())
     results.append(final_result.get("text", ""))
-    
-    wf.close()
     return ' '.join(results)
+
+
+def transcribe_vosk_array(audio, sample_rate=16000, model_path="vosk-model-ru-0.42"):
+    """
+    Транскрибирует аудио из памяти без записи во временный WAV.
+
+    :param audio: Одномерный массив float32 в диапазоне [-1, 1].
+    :param sample_rate: Частота дискретизации аудио.
+    :param model_path: Путь к распакованной модели Vosk.
+    :return: Распознанный текст.
+    """
+    if not os.path.exists(model_path):
+        print(f"Модель не найдена по пути: {model_path}")
+        return ""
+
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    step = 4000 * 2
+    with vosk_registry.recognizer(model_path, sample_rate) as rec:
+        return _recognize(rec, (pcm[i:i + step] for i in range(0, len(pcm), step)))
+
+
+SILENCE_FRAME_MS = 20
+
+
+def split_at_silence(samples, sample_rate, segment_seconds, search_seconds):
+    """
+    Делит запись на части примерно по segment_seconds, разрезая в самых
+    тихих местах.
+
+    Около каждой номинальной границы ищется кадр с минимальной энергией в
+    окне +-search_seconds, граница переносится на него.
+
+    :param samples: Одномерный массив int16 (можно np.memmap).
+    :return: Список (начало, конец) в отсчетах.
+    """
+    total = len(samples)
+    segment = int(segment_seconds * sample_rate)
+    if total <= segment * 1.5:
+        return [(0, total)]
+
+    frame = int(SILENCE_FRAME_MS * sample_rate / 1000)
+    search = int(search_seconds * sample_rate) // frame
+    bounds = [0]
+    nominal = segment
+    while nominal < total - segment // 2:
+        center = nominal // frame
+        first = max(center - search, bounds[-1] // frame + 1)
+        last = min(center + search, total // frame - 1)
+        if last <= first:
+            cut = nominal
+        else:
+            window = samples[first * frame:last * frame].astype(np.float32)
+            energy = np.square(window.reshape(-1, frame)).mean(axis=1)
+            cut = (first + int(np.argmin(energy))) * frame + frame // 2
+        bounds.append(cut)
+        nominal = cut + segment
+    bounds.append(total)
+    return list(zip(bounds, bounds[1:]))
+
+
+def recognize_pcm_segment(pcm_path, start, end, sample_rate, model_path):
+    """
+    Распознает участок сырого PCM-файла (s16le, моно) в процессе пула vosk.
+
+    Воркер читает только свой участок с диска, аудио не передается между
+    процессами.
+
+    :param start: Начало участка в отсчетах.
+    :param end: Конец участка в отсчетах.
+    :return: Текст и слова с таймстампами на шкале всей записи.
+    """
+    samples = np.memmap(pcm_path, dtype="<i2", mode="r")
+    pcm = samples[start:end].tobytes()
+    del samples
+    offset = start / sample_rate
+
+    texts = []
+    words = []
+
+    def collect(result):
+        if result.get("text"):
+            texts.append(result["text"])
+        for word in result.get("result", []):
+            word["start"] = round(word["start"] + offset, 3)
+            word["end"] = round(word["end"] + offset, 3)
+            words.append(word)
+
+    step = 4000 * 2
+    with vosk_registry.recognizer(model_path, sample_rate, words=True) as rec:
+        for i in range(0, len(pcm), step):
+            if rec.AcceptWaveform(pcm[i:i + step]):
+                collect(json.loads(rec.Result()))
+        collect(json.loads(rec.FinalResult()))
+    return {"text": " ".join(texts), "words": words}
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import os
+
+import numpy as np
+
+from config import VOSK_PARALLEL_SEGMENT_SECONDS, VOSK_PARALLEL_SEARCH_SECONDS
+from .executors import pools, run_in_pool, gather_or_cancel
+from .transcode import decode_to_pcm, derived_path
+from .vosk import split_at_silence, recognize_pcm_segment
+
+SAMPLE_RATE = 16000
+
+
+def _split_pcm_file(pcm_path):
+    samples = np.memmap(pcm_path, dtype="<i2", mode="r")
+    return split_at_silence(
+        samples, SAMPLE_RATE, VOSK_PARALLEL_SEGMENT_SECONDS, VOSK_PARALLEL_SEARCH_SECONDS
+    )
+
+
+async def transcribe_vosk_parallel(audio_path, model_path="vosk-model-ru-0.42"):
+    """
+    Офлайн-распознавание длинного файла Vosk на всех ядрах.
+
+    Файл один раз декодируется ffmpeg в сырой PCM (моно 16 кГц), режется по
+    паузам, и части распознаются параллельно воркерами пула vosk, в каждом
+    из которых модель уже загружена. Результаты склеиваются по порядку.
+
+    :param audio_path: Аудиофайл в любом формате, который понимает ffmpeg.
+    :param model_path: Путь к распакованной модели Vosk.
+    :return: Текст и слова с таймстампами (секунды исходной записи).
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Модель не найдена по пути: {model_path}")
+
+    pcm_path = derived_path(audio_path, "_pcm", ".raw")
+    try:
+        await decode_to_pcm(audio_path, pcm_path, SAMPLE_RATE)
+        segments = await asyncio.to_thread(_split_pcm_file, pcm_path)
+        logging.info(f"Vosk: {audio_path} разбит на {len(segments)} частей")
+
+        # Не больше задач, чем воркеров: очередь пула остается другим запросам
+        semaphore = asyncio.Semaphore(max(pools["vosk"].workers, 1))
+
+        async def recognize(start, end):
+            async with semaphore:
+                return await run_in_pool(
+                    "vosk", recognize_pcm_segment,
+                    pcm_path, start, end, SAMPLE_RATE, model_path,
+                )
+
+        results = await gather_or_cancel(
+            recognize(start, end) for start, end in segments
+        )
+    finally:
+        if os.path.exists(pcm_path):
+            os.remove(pcm_path)
+
+    return {
+        "text": " ".join(result["text"] for result in results if result["text"]),
+        "words": [word for result in results for word in result["words"]],
+    }
@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from contextlib import asynccontextmanager
+
+from config import (
+    DOWNLOADS,
+    WORKSPACE_DIR,
+    WORKSPACE_TMPFS,
+    WORKSPACE_QUOTA_BYTES,
+    WORKSPACE_SIZE_FACTOR,
+    WORKSPACE_DEFAULT_RESERVE,
+    WORKSPACE_ADMISSION_TIMEOUT,
+    WORKSPACE_ORPHAN_AGE,
+    YANDEX_SPEECHKIT_DIR,
+    SALUTE_SPEECHKIT_DIR,
+)
+from .metrics import (
+    metrics,
+    directory_size,
+    pid_alive,
+    TEMP_DISK_BYTES,
+    WORKSPACE_ACTIVE,
+    WORKSPACE_RESERVED_BYTES,
+    WORKSPACE_REJECTED,
+)
+
+# Каталоги, куда раньше сохранялись загрузки; при запуске из них удаляются старые файлы
+LEGACY_DIRS = (YANDEX_SPEECHKIT_DIR, SALUTE_SPEECHKIT_DIR, "tmp")
+
+
+class WorkspaceQuotaExceeded(Exception):
+    """Квота рабочих каталогов исчерпана, запрос нужно повторить позже."""
+
+    def __init__(self, requested: int, retry_after: int):
+        super().__init__(
+            f"Недостаточно места для временных файлов ({requested} байт), "
+            f"повторите через {retry_after} с"
+        )
+        self.requested = requested
+        self.retry_after = retry_after
+
+
+def estimate_bytes(upload_bytes: int = None) -> int:
+    """Ожидаемый объем рабочего каталога для загрузки размером upload_bytes."""
+    if not upload_bytes:
+        return WORKSPACE_DEFAULT_RESERVE
+    return int(upload_bytes * WORKSPACE_SIZE_FACTOR)
+
+
+class Workspace:
+    """
+    Рабочий каталог одного запроса.
+
+    Все промежуточные файлы (перекодированные копии, PCM, части записи)
+    создаются рядом с исходным файлом, то есть внутри каталога, и
+    удаляются вместе с ним.
+    """
+
+    def __init__(self, path: str, reserved: int):
+        self.path = path
+        self.reserved = reserved
+        # Вложенные каталоги (файлы пакета), резерв которых входит в reserved
+        self.nested = 0
+
+    def file(self, name: str) -> str:
+        """Путь к файлу внутри рабочего каталога."""
+        return os.path.join(self.path, os.path.basename(name))
+
+    def adopt(self, source: str) -> str:
+        """
+        Жесткая ссылка (или копия) внешнего файла в рабочем каталоге:
+        конвейер может удалять и порождать файлы, не трогая оригинал.
+        """
+        destination = self.file(source)
+        try:
+            os.link(source, destination)
+        except OSError:
+            # Рабочий каталог на другой файловой системе (tmpfs)
+            shutil.copyfile(source, destination)
+        return destination
+
+    def size(self) -> int:
+        return directory_size(self.path)
+
+
+class WorkspaceManager:
+    """
+    Рабочие каталоги запросов с общей квотой.
+
+    Запрос заранее резервирует место (оценка по размеру загрузки). Если
+    квота занята, он ждет освобождения не дольше admission_timeout, затем
+    получает WorkspaceQuotaExceeded. Каталог удаляется при любом выходе:
+    успех, ошибка или отмена запроса.
+
+    Имя каталога содержит pid процесса, поэтому при запуске удаляются
+    каталоги только завершившихся процессов, а не соседних воркеров.
+    """
+
+    def __init__(self, root: str = WORKSPACE_DIR, quota: int = WORKSPACE_QUOTA_BYTES,
+                 admission_timeout: float = WORKSPACE_ADMISSION_TIMEOUT):
+        self.root = root
+        self.quota = quota
+        self.admission_timeout = admission_timeout
+        self._reserved = 0
+        self._active = 0
+        self._condition = None
+        self._created = 0
+        self._rejected = 0
+        self._swept = 0
+
+    def _ensure_root(self):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+        except OSError as e:
+            if not WORKSPACE_TMPFS:
+                raise
+            fallback = os.path.join(DOWNLOADS, "workspace")
+            logging.warning(f"tmpfs {self.root} недоступен ({e}), рабочие каталоги в {fallback}")
+            self.root = fallback
+            os.makedirs(self.root, exist_ok=True)
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _fits(self, size: int, parent: Workspace = None) -> bool:
+        if self._reserved + size <= self.quota:
+            return True
+        # Один запрос больше квоты все равно допускается, если других нет;
+        # для вложенного каталога "других" - кроме его родителя и при
+        # условии, что у родителя нет других вложенных
+        if parent is None:
+            return self._reserved == 0
+        return self._reserved == parent.reserved and parent.nested == 0
+
+    async def _admit(self, size: int, parent: Workspace = None):
+        condition = self._get_condition()
+        async with condition:
+            if not self._fits(size, parent):
+                try:
+                    await asyncio.wait_for(
+                        condition.wait_for(lambda: self._fits(size, parent)), self.admission_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self._rejected += 1
+                    WORKSPACE_REJECTED.inc()
+                    raise WorkspaceQuotaExceeded(size, max(1, int(self.admission_timeout)))
+            self._reserved += size
+            if parent is None:
+                self._active += 1
+            else:
+                parent.reserved += size
+
+    async def _release(self, size: int, parent: Workspace = None):
+        condition = self._get_condition()
+        async with condition:
+            self._reserved -= size
+            if parent is None:
+                self._active -= 1
+            else:
+                parent.reserved -= size
+            condition.notify_all()
+
+    async def resize(self, workspace: Workspace, size: int):
+        """
+        Меняет резерв открытого каталога (например, по фактическому объему
+        распакованного архива). Рост проходит допуск, как вложенный каталог.
+        """
+        delta = size - workspace.reserved
+        if delta > 0:
+            await self._admit(delta, workspace)
+        elif delta < 0:
+            await self._release(-delta, workspace)
+
+    async def reserve(self, path: str, expected_bytes: int = None, wait: bool = True) -> Workspace:
+        """
+        Резерв квоты под файлы вне рабочих каталогов, которые живут дольше
+        запроса (вход фонового задания). Каталог path не удаляется, резерв
+        освобождается через release.
+
+        :param path: Каталог, в котором будут лежать файлы.
+        :param expected_bytes: Резерв квоты; по умолчанию WORKSPACE_DEFAULT_RESERVE.
+        :param wait: False - учесть уже занятое место без ожидания квоты
+            (входы заданий, возобновляемых после перезапуска).
+        """
+        size = expected_bytes or WORKSPACE_DEFAULT_RESERVE
+        if wait:
+            await self._admit(size)
+        else:
+            async with self._get_condition():
+                self._reserved += size
+                self._active += 1
+        return Workspace(path, size)
+
+    async def release(self, workspace: Workspace):
+        """Освобождает резерв, полученный через reserve."""
+        await self._release(workspace.reserved)
+
+    @asynccontextmanager
+    async def open(self, prefix: str = "request", expected_bytes: int = None):
+        """
+        Создает рабочий каталог на время блока.
+
+        :param prefix: Начало имени каталога (движок или маршрут).
+        :param expected_bytes: Резерв квоты; по умолчанию WORKSPACE_DEFAULT_RESERVE.
+        """
+        size = expected_bytes or WORKSPACE_DEFAULT_RESERVE
+        await self._admit(size)
+        workspace = Workspace(None, size)
+        try:
+            self._ensure_root()
+            path = os.path.join(self.root, f"{prefix}-{os.getpid()}-{uuid.uuid4().hex[:12]}")
+            os.makedirs(path)
+            workspace.path = path
+            self._created += 1
+            yield workspace
+        finally:
+            try:
+                if workspace.path is not None:
+                    # Удаление идет в потоке и завершится, даже если запрос снова отменят
+                    await asyncio.shield(asyncio.to_thread(shutil.rmtree, workspace.path, True))
+            finally:
+                # Резерв мог измениться через resize
+                await self._release(workspace.reserved)
+
+    @asynccontextmanager
+    async def nested(self, parent: Workspace, prefix: str, expected_bytes: int = None):
+        """
+        Подкаталог открытого каталога parent со своим резервом поверх
+        резерва родителя: так файл пакета распознается, не запрашивая
+        второй независимый резерв, который собственный резерв пакета не
+        пустил бы в квоту.
+        """
+        size = expected_bytes or WORKSPACE_DEFAULT_RESERVE
+        await self._admit(size, parent)
+        parent.nested += 1
+        workspace = Workspace(os.path.join(parent.path, f"{prefix}-{uuid.uuid4().hex[:12]}"), size)
+        try:
+            os.makedirs(workspace.path)
+            yield workspace
+        finally:
+            parent.nested -= 1
+            try:
+                await asyncio.shield(asyncio.to_thread(shutil.rmtree, workspace.path, True))
+            finally:
+                await self._release(size, parent)
+
+    def _sweep(self, max_age: float) -> int:
+        removed = 0
+        self._ensure_root()
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                try:
+                    pid = int(entry.name.rsplit("-", 2)[1])
+                except (IndexError, ValueError):
+                    pid = None
+                # Каталоги живых процессов не трогаем, свои появились до перезапуска
+                if pid is not None and pid != os.getpid() and pid_alive(pid):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    else:
+                        os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    continue
+
+        now = time.time()
+        for directory in LEGACY_DIRS:
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and now - entry.stat().st_mtime > max_age:
+                            os.remove(entry.path)
+                            removed += 1
+                    except OSError:
+                        continue
+        return removed
+
+    async def sweep_orphans(self, max_age: float = WORKSPACE_ORPHAN_AGE) -> int:
+        """
+        Удаляет каталоги, оставшиеся от упавших процессов, и старые файлы
+        в прежних каталогах загрузок. Вызывается при запуске.
+        """
+        removed = await asyncio.to_thread(self._sweep, max_age)
+        self._swept += removed
+        if removed:
+            logging.info(f"Удалено {removed} оставленных временных файлов и каталогов")
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "quota_bytes": self.quota,
+            "reserved_bytes": self._reserved,
+            "active": self._active,
+            "created": self._created,
+            "rejected": self._rejected,
+            "swept": self._swept,
+        }
+
+
+workspaces = WorkspaceManager()
+
+
+def _collect_metrics():
+    WORKSPACE_ACTIVE.set(workspaces._active)
+    WORKSPACE_RESERVED_BYTES.set(workspaces._reserved)
+    # Каталоги внутри DOWNLOADS уже учитываются коллектором /metrics
+    if os.path.commonpath([os.path.abspath(workspaces.root), DOWNLOADS]) != DOWNLOADS:
+        TEMP_DISK_BYTES.set(directory_size(workspaces.root), directory="workspace")
+
+
+metrics.add_collector(_collect_metrics)
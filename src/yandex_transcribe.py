@@ -1,48 +1,49 @@
 import os
-import asyncio
-import requests
 import logging
-import boto3.session
+
+import httpx
 
 from pydub import AudioSegment
 
 from config import (
     YANDEX_CLOUD,
-    BUCKET_NAME,
-    AWS_ACCESS_KEY_ID,
-    AWS_SECRET_ACCESS_KEY,
-    YANDEX_S3_ENDPOINT_URL,
+    YANDEX_STT_URL,
+    YANDEX_OPERATIONS_URL,
+    YANDEX_SYNC_URL,
 )
-from .utils import convert_to_mono
+from .http_client import get_client, stream_file, file_upload_headers
+from .metrics import stage, UPLOAD_BYTES
+from .poller import poller, PollTimeout
+from .resilience import guards, ProviderError, ProviderUnavailable, SyncRecognitionError
+from .storage import storage
+from .utils import get_audio_duration
 
 from botocore.exceptions import NoCredentialsError
 
-
-session = boto3.session.Session()
-
-# Инициализация клиента S3 для Яндекс Облака
-s3_client = session.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    endpoint_url=YANDEX_S3_ENDPOINT_URL,
-    region_name="ru-central1",
-)
+# Кодировки longRunningRecognize -> параметр format синхронного API
+SYNC_FORMATS = {"OGG_OPUS": "oggopus", "LINEAR16_PCM": "lpcm"}
 
 
+async def upload_file_to_s3(local_file_path, s3_file_name, audio_encoding="OGG_OPUS", duration=None):
+    """
+    Загружает файл в S3 хранилище Яндекс Облака и запускает распознавание.
 
-async def upload_file_to_s3(local_file_path, s3_file_name):
-    """Загружает файл в S3 хранилище Яндекс Облака"""
+    :param local_file_path: Файл, уже перекодированный в формат провайдера.
+    :param s3_file_name: Имя в бакете: из него берутся каталог и расширение,
+        сам ключ - хэш содержимого (повторная загрузка пропускается).
+    :param audio_encoding: Кодировка файла для SpeechKit (OGG_OPUS, MP3, ...).
+    :param duration: Длительность аудио в секундах, если известна.
+    """
     try:
-        mono_file_path = local_file_path.replace(".mp3", "_mono.mp3")
-        await convert_to_mono(local_file_path, mono_file_path)
-        s3_client.upload_file(
-            mono_file_path,
-            BUCKET_NAME,
-            s3_file_name,
-        )
-        # s3_url = f"https://{BUCKET_NAME}.storage.yandexcloud.net/{s3_file_name}"
-        status, full_text, chunks = await transcribe_audio(object_name=s3_file_name)
+        if duration is None:
+            duration = get_audio_duration(local_file_path)
+        # Объект удаляется из бакета, как только распознавание завершено
+        async with storage.stored(
+            local_file_path, os.path.dirname(s3_file_name), os.path.splitext(s3_file_name)[1]
+        ) as object_name:
+            status, full_text, chunks = await transcribe_audio(
+                object_name=object_name, duration=duration, audio_encoding=audio_encoding
+            )
         return status, full_text, chunks
     except FileNotFoundError:
         raise Exception("Файл не найден")
@@ -52,21 +53,24 @@ async def upload_file_to_s3(local_file_path, s3_file_name):
         os.remove(local_file_path)
 
 
-async def transcribe_audio(object_name: str) -> tuple[str, str, dict]:
+async def transcribe_audio(object_name: str, duration: float = None,
+                           audio_encoding: str = "OGG_OPUS") -> tuple[str, str, list]:
+    """
+    Запускает распознавание объекта из S3 и ждет результата.
+
+    :raises ProviderError: SpeechKit вернул ошибку или недоступен.
+    """
     key = YANDEX_CLOUD
-    bucket_name = BUCKET_NAME
 
-    filelink = f"https://{bucket_name}.storage.yandexcloud.net/{object_name}"
+    filelink = storage.object_url(object_name)
 
-    POST = (
-        "https://transcribe.api.cloud.yandex.net/speech/" "stt/v2/longRunningRecognize"
-    )
+    POST = YANDEX_STT_URL
 
     body = {
         "config": {
             "specification": {
                 "languageCode": "ru-RU",
-                "audioEncoding": "MP3",
+                "audioEncoding": audio_encoding,
                 "literature_text": True,
             }
         },
@@ -75,37 +79,43 @@ async def transcribe_audio(object_name: str) -> tuple[str, str, dict]:
 
     header = {"Authorization": f"Api-Key {key}"}
 
+    client = get_client("yandex")
+    guard = guards["yandex"]
     try:
-        response = requests.post(POST, headers=header, json=body)
+        # Повтор после таймаута мог бы создать вторую операцию распознавания
+        response = await guard.request(client, "POST", POST, idempotent=False, headers=header, json=body)
         response.raise_for_status()  # Проверяем, нет ли ошибок на уровне HTTP
         data = response.json()
 
         if "id" not in data:
             error_message = data.get("message", "Unknown error")
             logging.error(f"Ошибка при транскрибации: {error_message}")
-            return "error", "", {}, error_message
+            raise ProviderError("yandex", error_message)
 
         operation_id = data.get("id")
         logging.info(f"Операция транскрибации начата. " f"ID операции: {operation_id}")
 
         # Проверка статуса выполнения транскрибации
-        GET = f"https://operation.api.cloud.yandex.net/operations/{operation_id}"
-        while True:
-            await asyncio.sleep(5)
-            status_response = requests.get(GET, headers=header)
+        GET = f"{YANDEX_OPERATIONS_URL}/{operation_id}"
+
+        async def check():
+            try:
+                status_response = await guard.request(client, "GET", GET, headers=header)
+            except ProviderUnavailable:
+                # Операция идет у провайдера, опрос откладывается до следующего раза
+                return False, None
             status_response.raise_for_status()  # Проверяем HTTP ошибки
             req = status_response.json()
+            return bool(req.get("done")), req
 
-            if req.get("done"):
-                if "error" in req:
-                    error_message = req["error"].get("message", "Unknown error")
-                    logging.error(
-                        f"Ошибка при выполнении операции "
-                        f"транскрибации: {error_message}"
-                    )
-                    return "error", "", {}, error_message
-
-                break
+        req = await poller.wait("yandex", operation_id, check, duration=duration)
+        if "error" in req:
+            error_message = req["error"].get("message", "Unknown error")
+            logging.error(
+                f"Ошибка при выполнении операции "
+                f"транскрибации: {error_message}"
+            )
+            raise ProviderError("yandex", error_message)
 
         full_text = " ".join(
             [chunk["alternatives"][0]["text"] for chunk in req["response"]["chunks"]]
@@ -115,11 +125,48 @@ async def transcribe_audio(object_name: str) -> tuple[str, str, dict]:
 
         return status, full_text, chunks
 
-    except requests.exceptions.HTTPError as http_err:
+    except httpx.HTTPStatusError as http_err:
         # Логирование ошибки HTTP и возврат сообщения об ошибке
-        error_message = response.json().get("message", str(http_err))
+        try:
+            error_message = http_err.response.json().get("message", str(http_err))
+        except ValueError:
+            error_message = str(http_err)
         logging.error(f"HTTP ошибка при транскрибации: {error_message}")
-        return "error", "", {}, error_message
-    except Exception as e:
+        raise ProviderError("yandex", error_message) from http_err
+    except httpx.HTTPError as e:
         logging.error(f"Ошибка при транскрибации файла {filelink}: {e}")
-        return "error", "", {}, str(e)
+        raise ProviderError("yandex", str(e)) from e
+    except PollTimeout as e:
+        logging.error(f"Ошибка при проверке статуса операции Yandex: {e}")
+        raise ProviderError("yandex", f"Ошибка при распознавании аудио в Yandex SpeechKit: {e}") from e
+
+
+async def recognize_sync(local_file_path, audio_encoding="OGG_OPUS", sample_rate=16000) -> tuple[str, str, list]:
+    """
+    Синхронное распознавание короткой записи (до 30 с и 1 МБ): файл
+    отправляется в теле запроса, без S3 и опроса операции. Файл не удаляется.
+
+    Синхронный API не возвращает слова с таймстампами, поэтому результат -
+    один чанк с текстом в формате longRunningRecognize.
+    """
+    params = {"lang": "ru-RU", "format": SYNC_FORMATS[audio_encoding]}
+    if audio_encoding == "LINEAR16_PCM":
+        params["sampleRateHertz"] = sample_rate
+    headers = {"Authorization": f"Api-Key {YANDEX_CLOUD}", **file_upload_headers(local_file_path)}
+
+    try:
+        with stage("yandex_sync"):
+            response = await guards["yandex"].request(
+                get_client("yandex"), "POST", YANDEX_SYNC_URL, params=params, headers=headers,
+                content_factory=lambda: stream_file(local_file_path),
+            )
+            response.raise_for_status()
+        UPLOAD_BYTES.inc(os.path.getsize(local_file_path), target="yandex")
+        data = response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        raise SyncRecognitionError("yandex", f"Ошибка синхронного распознавания Yandex: {e}") from e
+
+    if "result" not in data:
+        raise SyncRecognitionError("yandex", data.get("error_message", "Unknown error"))
+    full_text = data["result"]
+    return "done", full_text, [{"alternatives": [{"text": full_text}], "channelTag": "1"}]